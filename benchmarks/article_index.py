@@ -0,0 +1,87 @@
+# 组合过滤基准：随机生成文章、标签和收藏，比较“标签+作者”“标签+收藏者”两种组合条件下，
+# SQL过滤（连接tagging/collect）与内存文章索引求交集取一页文章id的耗时
+# 用法: python benchmarks/article_index.py --articles 50000 --users 500 --tags 200
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, insert  # noqa: E402
+
+from blog import create_app  # noqa: E402
+from blog.article_index import ArticleIndex  # noqa: E402
+from blog.estensions import db  # noqa: E402
+from blog.models import User, Article, Tag, Collect, tagging  # noqa: E402
+
+
+def populate(articles, users, tags, favorites, seed=0):
+    rng = random.Random(seed)
+    db.session.execute(insert(User.__table__), [{'id': i + 1, 'username': 'user%d' % i} for i in range(users)])
+    db.session.execute(insert(Tag.__table__), [{'id': i + 1, 'name': 'tag%d' % i} for i in range(tags)])
+    db.session.execute(insert(Article.__table__), [
+        {'id': i + 1, 'slug': 'article-%d' % i, 'title': 'T%d' % i, 'author_id': rng.randint(1, users)}
+        for i in range(articles)])
+    db.session.execute(insert(tagging), [
+        {'article_id': i + 1, 'tag_id': tag_id} for i in range(articles)
+        for tag_id in rng.sample(range(1, tags + 1), 3)])
+    pairs = {(rng.randint(1, users), rng.randint(1, articles)) for _ in range(favorites)}
+    db.session.execute(insert(Collect.__table__), [{'collector_id': u, 'collected_id': a} for u, a in pairs])
+    db.session.commit()
+
+
+def sql_page(tag, author_id=None, collector_id=None, limit=20):
+    stmt = select(Article.id).where(Article.tagList.any(Tag.name == tag))
+    if author_id is not None:
+        stmt = stmt.where(Article.author_id == author_id)
+    if collector_id is not None:
+        stmt = stmt.join(Collect, Collect.collected_id == Article.id).where(Collect.collector_id == collector_id)
+    return db.session.execute(stmt.order_by(Article.createdAt, Article.id).limit(limit)).scalars().all()
+
+
+def report(name, timings):
+    timings.sort()
+    print('%-22s p50 %.3fms  p99 %.3fms' % (name, statistics.median(timings), timings[int(len(timings) * 0.99) - 1]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--articles', type=int, default=50000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--tags', type=int, default=200)
+    parser.add_argument('--favorites', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+    app = create_app()
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    with app.app_context():
+        db.create_all()
+        populate(args.articles, args.users, args.tags, args.favorites)
+        index = ArticleIndex()
+        started = time.perf_counter()
+        index.load()
+        print('index load %.1fms' % ((time.perf_counter() - started) * 1000))
+        rng = random.Random(1)
+        queries = [('tag%d' % rng.randrange(args.tags), rng.randint(1, args.users)) for _ in range(args.queries)]
+        for label, use_author in (('tag+author', True), ('tag+favorited', False)):
+            sql, memory = [], []
+            for tag, user_id in queries:
+                started = time.perf_counter()
+                expected = sql_page(tag, author_id=user_id if use_author else None,
+                                    collector_id=None if use_author else user_id)
+                sql.append((time.perf_counter() - started) * 1000)
+                started = time.perf_counter()
+                ids = index.page(tag=tag, author_id=user_id if use_author else None,
+                                 favorited_by=None if use_author else user_id)[0]
+                memory.append((time.perf_counter() - started) * 1000)
+                assert ids == expected, (tag, user_id)
+            report(label + ' sql', sql)
+            report(label + ' index', memory)
+
+
+if __name__ == '__main__':
+    main()
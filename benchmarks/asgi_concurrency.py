@@ -0,0 +1,99 @@
+# 对比WSGI线程模型与ASGI入口在大量并发连接下的吞吐与延迟
+# 用法: python benchmarks/asgi_concurrency.py --connections 1000 --threads 8
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blog import create_app  # noqa: E402
+from blog.asgi import BlogASGI  # noqa: E402
+from blog.estensions import db  # noqa: E402
+from blog.models import Tag  # noqa: E402
+
+
+def make_app(tags):
+    app = create_app()
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Tag(name='tag%d' % i) for i in range(tags)])
+        db.session.commit()
+    return app
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def report(name, total, latencies):
+    print('%-5s total %.3fs  %.0f req/s  p50 %.1fms  p99 %.1fms  max %.1fms' % (
+        name, total, len(latencies) / total, percentile(latencies, 0.5) * 1000,
+        percentile(latencies, 0.99) * 1000, max(latencies) * 1000))
+
+
+# WSGI：和gunicorn的线程worker一样，同时只能处理threads个请求，其余连接排队
+def bench_wsgi(app, connections, threads, path):
+    client = app.test_client()
+
+    # 所有连接在同一时刻到达，每个请求的延迟都从begin开始计算，包含排队时间
+    def one(_):
+        client.get(path)
+        return time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(one, range(connections)))
+    return time.perf_counter() - begin, latencies
+
+
+def bench_asgi(app, connections, path):
+    asgi = BlogASGI(app)
+
+    async def one():
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'',
+                 'http_version': '1.1', 'headers': []}
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            pass
+
+        await asgi(scope, receive, send)
+        return time.perf_counter() - begin
+
+    async def run():
+        try:
+            return await asyncio.gather(*[one() for _ in range(connections)])
+        finally:
+            await asgi.pool.close()
+
+    begin = time.perf_counter()
+    latencies = asyncio.run(run())
+    return time.perf_counter() - begin, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--tags', type=int, default=200)
+    parser.add_argument('--path', default='/api/tags')
+    args = parser.parse_args()
+    app = make_app(args.tags)
+    print('%d simultaneous connections, GET %s' % (args.connections, args.path))
+    total, latencies = bench_wsgi(app, args.connections, args.threads, args.path)
+    report('wsgi', total, latencies)
+    total, latencies = bench_asgi(app, args.connections, args.path)
+    report('asgi', total, latencies)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# 正文压缩存储基准：分别以不压缩、zlib、zstd、带字典的zstd写入同一批随机生成的文章，
+# 统计VACUUM后的数据库大小，以及按页读取文章（读取并解压正文）的延迟
+# 用法: python benchmarks/body_compression.py --articles 20000 --words 500
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blog import create_app  # noqa: E402
+from blog.estensions import db  # noqa: E402
+from blog.models import Article  # noqa: E402
+
+
+def make_bodies(count, words, seed=0):
+    rng = random.Random(seed)
+    vocabulary = ['word%d' % i for i in range(5000)]
+    # 词频按Zipf分布，段落之间夹着固定的Markdown结构，接近真实文章的冗余度
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    bodies = []
+    for i in range(count):
+        tokens = rng.choices(vocabulary, weights, k=words)
+        paragraphs = [' '.join(tokens[start:start + 60]) for start in range(0, words, 60)]
+        bodies.append('# Article %d\n\n' % i + '\n\n## Section\n\n'.join(paragraphs))
+    return bodies
+
+
+def run_mode(name, config, bodies, pages, page_size):
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'bench.db')
+    app = create_app()
+    app.config.update(config, SQLALCHEMY_DATABASE_URI='sqlite:///' + path)
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        for start in range(0, len(bodies), 1000):
+            db.session.bulk_insert_mappings(Article, [
+                {'title': 'T%d' % i, 'slug': 's%d' % i, 'body': body}
+                for i, body in enumerate(bodies[start:start + 1000], start)])
+            db.session.commit()
+        write_ms = (time.perf_counter() - started) * 1000
+        db.session.execute(db.text('VACUUM'))
+        size = os.path.getsize(path)
+        rng = random.Random(1)
+        timings = []
+        for _ in range(pages):
+            offset = rng.randrange(0, max(1, len(bodies) - page_size))
+            started = time.perf_counter()
+            articles = Article.query.order_by(Article.id).offset(offset).limit(page_size).all()
+            sum(len(article.body) for article in articles)
+            timings.append((time.perf_counter() - started) * 1000)
+            db.session.expunge_all()
+        timings.sort()
+    print('%-10s size %8.1fKB  write %8.1fms  page read p50 %.2fms  p99 %.2fms' % (
+        name, size / 1024, write_ms, statistics.median(timings), timings[int(len(timings) * 0.99) - 1]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--articles', type=int, default=20000)
+    parser.add_argument('--words', type=int, default=500)
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--page-size', type=int, default=20)
+    args = parser.parse_args()
+    bodies = make_bodies(args.articles, args.words)
+    modes = [('plain', {'BODY_COMPRESSION': None}), ('zlib', {'BODY_COMPRESSION': 'zlib'})]
+    try:
+        import zstandard
+    except ImportError:
+        print('zstandard is not installed, skipping zstd modes')
+    else:
+        dict_path = os.path.join(tempfile.mkdtemp(), 'bodies.dict')
+        samples = [body.encode('utf-8') for body in bodies[:2000]]
+        with open(dict_path, 'wb') as f:
+            f.write(zstandard.train_dictionary(112640, samples).as_bytes())
+        modes += [('zstd', {'BODY_COMPRESSION': 'zstd'}),
+                  ('zstd+dict', {'BODY_COMPRESSION': 'zstd', 'BODY_ZSTD_DICT': dict_path})]
+    for name, config in modes:
+        run_mode(name, config, bodies, args.pages, args.page_size)
+
+
+if __name__ == '__main__':
+    main()
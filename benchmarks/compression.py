@@ -0,0 +1,68 @@
+# 响应压缩基准：构造与文章列表接口结构相同的JSON响应，比较gzip各级别、brotli各质量的压缩耗时与压缩后大小，
+# 以及压缩缓存命中时（只查一次LRU缓存）的开销，用来选择COMPRESS_GZIP_LEVEL和COMPRESS_BR_QUALITY
+# 用法: python benchmarks/compression.py --articles 20 --rounds 200
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blog.cache import LRUCache  # noqa: E402
+from blog.compression import compress, _brotli  # noqa: E402
+
+
+def make_payload(count, seed=0):
+    rng = random.Random(seed)
+    vocabulary = ['word%d' % i for i in range(2000)]
+    articles = []
+    for i in range(count):
+        articles.append({
+            'slug': 'article-%d' % i, 'title': ' '.join(rng.choices(vocabulary, k=6)),
+            'description': ' '.join(rng.choices(vocabulary, k=20)),
+            'body': ' '.join(rng.choices(vocabulary, k=400)),
+            'tagList': rng.sample(['python', 'flask', 'sqlite', 'web', 'api'], 2),
+            'createdAt': '2022-03-%02dT12:00:00' % (i % 28 + 1), 'updatedAt': '2022-03-%02dT12:00:00' % (i % 28 + 1),
+            'favorited': False, 'favoritesCount': rng.randrange(100),
+            'author': {'username': 'user%d' % rng.randrange(50), 'bio': None, 'image': None, 'following': False},
+        })
+    return json.dumps({'articles': articles, 'articleCount': count}).encode('utf-8')
+
+
+def measure(data, rounds, encoding, level):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        compressed = compress(data, encoding, gzip_level=level, br_quality=level)
+    return (time.perf_counter() - started) * 1000 / rounds, len(compressed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--articles', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+    data = make_payload(args.articles)
+    print('payload %.1fKB' % (len(data) / 1024))
+    modes = [('gzip', level) for level in (1, 6, 9)]
+    if _brotli() is None:
+        print('brotli is not installed, skipping br modes')
+    else:
+        modes += [('br', quality) for quality in (1, 5, 11)]
+    for encoding, level in modes:
+        elapsed_ms, size = measure(data, args.rounds, encoding, level)
+        print('%-4s %2d  %8.3fms  %8.1fKB  ratio %.3f  saved %.1fKB/ms' % (
+            encoding, level, elapsed_ms, size / 1024, size / len(data),
+            (len(data) - size) / 1024 / elapsed_ms))
+    cache = LRUCache(maxsize=512, ttl=300)
+    key = ('/api/articles?limit=%d' % args.articles, 'etag', 'gzip')
+    cache.set(key, compress(data, 'gzip'))
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        cache.get(key)
+    print('cache hit %.4fms' % ((time.perf_counter() - started) * 1000 / args.rounds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# 推荐关注的二度查询基准：随机生成关注图，统计构建CSR和二度查询的耗时
+# 用法: python benchmarks/follow_graph.py --users 100000 --edges 1000000
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blog.follow_graph import FollowGraph  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--edges', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--updates', type=int, default=5000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    # 被关注者按幂律分布，模拟少数热门作者
+    followers = rng.integers(0, args.users, args.edges)
+    followed = (rng.pareto(1.2, args.edges) * 100).astype(np.int64) % args.users
+    keep = followers != followed
+    started = time.perf_counter()
+    graph = FollowGraph.from_edges(followers[keep], followed[keep])
+    print('build %d edges: %.1fms' % (keep.sum(), (time.perf_counter() - started) * 1000))
+
+    started = time.perf_counter()
+    for follower, target in zip(rng.integers(0, args.users, args.updates), rng.integers(0, args.users, args.updates)):
+        graph.add_edge(int(follower), int(target))
+    print('%d incremental follows: %.1fms' % (args.updates, (time.perf_counter() - started) * 1000))
+
+    timings = []
+    for user_id in rng.integers(0, args.users, args.queries):
+        started = time.perf_counter()
+        graph.friends_of_friends(int(user_id))
+        timings.append(time.perf_counter() - started)
+    timings = np.array(timings) * 1000
+    print('2-hop query: p50 %.2fms  p99 %.2fms  max %.2fms' % (
+        np.percentile(timings, 50), np.percentile(timings, 99), timings.max()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# 预先fork的内存基准：分别以预加载（master创建应用后fork）和--lazy（每个worker各自创建应用）两种方式
+# 启动blog.prefork，向每种方式发送一些请求后，从/proc读取每个worker的USS（私有页面，worker退出时真正释放的内存）、
+# PSS（私有页面加上按进程数均摊的共享页面）和RSS，USS决定一台机器上能放下多少个worker
+# 用法: python benchmarks/prefork_memory.py --workers 4 --requests 200
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ['/api/tags', '/api/articles?limit=20', '/api/articles/trending', '/api/profiles/test1']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def children(ppid):
+    pids = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % name) as f:
+                # 进程名可能带空格，从最后一个')'之后开始解析：状态、父进程id……
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == ppid:
+            pids.append(int(name))
+    return sorted(pids)
+
+
+# 返回(USS, PSS, RSS)，单位KB
+def memory(pid):
+    values = {}
+    with open('/proc/%d/smaps_rollup' % pid) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return values['Private_Clean'] + values['Private_Dirty'], values['Pss'], values['Rss']
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen('http://127.0.0.1:%d/api/tags' % port, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server on port %d did not start' % port)
+
+
+def measure(mode, workers, requests):
+    port = free_port()
+    env = dict(os.environ, RATE_LIMIT_FILE=os.path.join(tempfile.mkdtemp(), 'ratelimit.bin'))
+    command = [sys.executable, '-m', 'blog.prefork', '--workers', str(workers), '--bind', '127.0.0.1:%d' % port]
+    if mode == 'lazy':
+        command.append('--lazy')
+    proc = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port)
+        # 连接由内核分给任意一个worker，请求数足够多时每个worker都会处理到
+        for i in range(requests):
+            try:
+                urllib.request.urlopen('http://127.0.0.1:%d%s' % (port, PATHS[i % len(PATHS)]), timeout=5).read()
+            except OSError:
+                pass
+        pids = children(proc.pid)
+        rows = [memory(pid) for pid in pids]
+        master = memory(proc.pid)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=10)
+    print('%s: master USS %dKB' % (mode, master[0]))
+    for pid, (uss, pss, rss) in zip(pids, rows):
+        print('  worker %-7d USS %7dKB  PSS %7dKB  RSS %7dKB' % (pid, uss, pss, rss))
+    uss_total = sum(row[0] for row in rows)
+    print('  mean USS %dKB, total USS+master %dKB' % (uss_total / len(rows), uss_total + master[0]))
+    return uss_total / len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+    lazy = measure('lazy', args.workers, args.requests)
+    preload = measure('preload', args.workers, args.requests)
+    print('per-worker USS: preload %.0fKB vs lazy %.0fKB (%.0f%%)' % (preload, lazy, 100.0 * preload / lazy))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# 列表读取基准：同一页文章分别用ORM实例（预加载作者和标签，响应模型逐条查询收藏状态）和只读行对象读取并序列化，
+# 比较每页的SQL语句数、耗时和tracemalloc统计的内存峰值
+# 用法: python benchmarks/read_models.py --articles 2000 --page-size 20
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_login import login_user  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.orm import joinedload, selectinload  # noqa: E402
+
+from blog import create_app  # noqa: E402
+from blog.estensions import db  # noqa: E402
+from blog.models import User, Article, Tag, Collect, articles_schema  # noqa: E402
+from blog.readmodels import article_rows  # noqa: E402
+
+
+def populate(articles):
+    users = [User(username='user%d' % i, email='user%d@example.com' % i) for i in range(50)]
+    tags = [Tag(name='tag%d' % i) for i in range(20)]
+    db.session.add_all(users + tags)
+    db.session.flush()
+    for i in range(articles):
+        db.session.add(Article(title='T%d' % i, slug='article-%d' % i, description='d', body='word ' * 200,
+                               author=users[i % len(users)], tagList=[tags[i % 20], tags[(i * 7) % 20]]))
+    db.session.flush()
+    for i in range(0, articles, 3):
+        db.session.add(Collect(collector_id=users[i % 7].id, collected_id=i + 1))
+    db.session.commit()
+
+
+def orm_page(limit, offset):
+    return Article.query.options(joinedload(Article.author), selectinload(Article.tagList)) \
+        .order_by(Article.id).offset(offset).limit(limit).all()
+
+
+def dto_page(limit, offset):
+    return article_rows(Article.query.order_by(Article.id), limit, offset)
+
+
+def run(name, load, pages, page_size, articles, statements, viewer):
+    del statements[:]
+    tracemalloc.start()
+    started = time.perf_counter()
+    for page in range(pages):
+        articles_schema.dump(load(page_size, (page * page_size) % max(1, articles - page_size)))
+        # 每页相当于一个新请求：清空identity map，只保留登录用户
+        db.session.expunge_all()
+        db.session.add(viewer)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('%-4s %6.1f queries/page  %7.2fms/page  peak %8.1fKB' % (
+        name, len(statements) / pages, elapsed_ms / pages, peak / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--articles', type=int, default=2000)
+    parser.add_argument('--pages', type=int, default=100)
+    parser.add_argument('--page-size', type=int, default=20)
+    args = parser.parse_args()
+    app = create_app()
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    with app.app_context():
+        db.create_all()
+        populate(args.articles)
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *a, **kw: statements.append(1))
+        with app.test_request_context():
+            # 响应模型要计算查看者的收藏和关注状态，需要一个登录用户
+            viewer = User.query.first()
+            login_user(viewer)
+            for name, load in (('orm', orm_page), ('dto', dto_page)):
+                run(name, load, args.pages, args.page_size, args.articles, statements, viewer)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# 启动耗时基准：在全新的解释器里导入并创建应用，统计冷启动耗时，
+# 并根据 python -X importtime 的输出列出导入耗时最多的顶层包
+# 用法: python benchmarks/startup.py --runs 5 --target-ms 750（--target-ms 0 不检查目标）
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = '''
+import time
+started = time.perf_counter()
+from blog import create_app
+app = create_app()
+print('create_app %.1f' % ((time.perf_counter() - started) * 1000))
+'''
+
+
+def run_once():
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', SNIPPET], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+    elapsed = float(proc.stdout.strip().split()[-1])
+    # importtime的每一行: import time: self [us] | cumulative | imported package
+    packages = defaultdict(int)
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        packages[name.strip().split('.')[0]] += int(self_us)
+    return elapsed, packages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--target-ms', type=float, default=750)
+    args = parser.parse_args()
+    timings = []
+    totals = defaultdict(list)
+    for _ in range(args.runs):
+        elapsed, packages = run_once()
+        timings.append(elapsed)
+        for name, self_us in packages.items():
+            totals[name].append(self_us)
+    median = statistics.median(timings)
+    print('import + create_app: median %.1fms  min %.1fms  max %.1fms  (%d runs)' % (
+        median, min(timings), max(timings), args.runs))
+    print('top packages by import self time (median):')
+    ranked = sorted(((statistics.median(v), k) for k, v in totals.items()), reverse=True)
+    for self_us, name in ranked[:args.top]:
+        print('  %-24s %8.1fms' % (name, self_us / 1000))
+    if args.target_ms:
+        if median > args.target_ms:
+            print('FAIL: %.1fms > target %.1fms' % (median, args.target_ms))
+            sys.exit(1)
+        print('OK: %.1fms <= target %.1fms' % (median, args.target_ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,9 @@
 import os
+import click
 from flask import Flask
 from blog.settings import config
-from blog.blueprints.users import users_bp
-from blog.blueprints.tags import tags_bp
-from blog.blueprints.articles import articles_bp
-from blog.estensions import migrate, db, login_manager, mail, jwt
-from blog.models import User, Article, Tag, Comment
+from blog.estensions import db, login_manager, jwt, init_migrate, init_session_profile
+from blog.writebatch import init_write_coalescer
 
 
 # 工厂函数
@@ -17,24 +15,198 @@ def create_app(config_name=None):
     register_blueprints(app)
     register_extensions(app)
     register_shell_context(app)
+    register_commands(app)
     return app
 
 
+# 蓝本在这里才导入，只导入blog包（例如读取配置的CLI任务）时不需要加载视图、flask_apispec和响应模型
 def register_blueprints(app):
+    from blog.blueprints.users import users_bp
+    from blog.blueprints.tags import tags_bp
+    from blog.blueprints.articles import articles_bp
+    from blog.blueprints.admin import admin_bp
     app.register_blueprint(users_bp)
     app.register_blueprint(articles_bp)
     app.register_blueprint(tags_bp)
+    app.register_blueprint(admin_bp)
 
 
+# Flask-Mail在第一次发信时才初始化（见estensions.get_mail）；
+# Flask-Migrate及alembic只在flask命令行中（例如flask db upgrade）初始化，提供服务的worker进程不会导入它们
 def register_extensions(app):
+    from blog.profiles import init_profile_cache
+    from blog.trending import init_trending
+    from blog.softdelete import init_soft_delete
+    from blog.profiling import init_profiling
+    from blog.deadline import init_deadline
+    from blog.compression import init_compression
+    from blog.ratelimit import init_rate_limit
+    from blog.maintenance import init_maintenance
+    from blog.capture import init_capture
+    from blog.memtrack import init_memtrack
+    # 导入related、events以注册标签变化、新评论和新文章的信号处理函数
+    import blog.related  # noqa: F401
+    import blog.events  # noqa: F401
     db.init_app(app)
-    migrate.init_app(app, db)
+    if app.config['MIGRATE_ALWAYS'] or click.get_current_context(silent=True) is not None:
+        init_migrate(app)
     login_manager.init_app(app)
-    mail.init_app(app)
     jwt.init_app(app)
+    init_session_profile(app)
+    init_write_coalescer(app)
+    init_profile_cache(app)
+    init_trending(app)
+    init_soft_delete(app)
+    init_profiling(app)
+    init_capture(app)
+    init_deadline(app)
+    init_compression(app)
+    init_rate_limit(app)
+    init_maintenance(app)
+    init_memtrack(app)
 
 
 def register_shell_context(app):
     @app.shell_context_processor
     def shell_context():
+        from blog.models import User, Article, Tag, Comment
         return dict(db=db, User=User, Article=Article, Comment=Comment, Tags=Tag)
+
+
+def register_commands(app):
+    @app.cli.command('trending-refresh')
+    def trending_refresh():
+        """重新计算热门文章快照"""
+        from blog.trending import refresh_trending
+        count = refresh_trending()
+        click.echo('trending snapshot: %d articles' % count)
+
+    @app.cli.command('related-refresh')
+    def related_refresh():
+        """根据标签共现重新计算全部文章的相关文章"""
+        from blog.related import refresh_related_all
+        count = refresh_related_all()
+        click.echo('related articles: %d articles' % count)
+
+    @app.cli.command('articles-purge')
+    @click.option('--limit', type=int, default=None, help='本次最多清除的文章数')
+    def articles_purge(limit):
+        """清除已软删除的文章及其评论、收藏"""
+        from blog.softdelete import purge_deleted_articles
+        count = purge_deleted_articles(limit)
+        click.echo('purged: %d articles' % count)
+
+    @app.cli.command('body-compress')
+    @click.option('--decompress', is_flag=True, help='把正文全部转换回原文')
+    @click.option('--batch-size', type=int, default=500)
+    def body_compress(decompress, batch_size):
+        """按BODY_COMPRESSION的配置分块转换已有的文章、评论正文"""
+        from blog.body_codec import codec_from_config, convert_bodies
+        codec = codec_from_config(app.config, compress=not decompress)
+        count = convert_bodies(db.session, codec, batch_size=batch_size, after_chunk=db.session.commit)
+        db.session.commit()
+        click.echo('converted: %d rows' % count)
+
+    @app.cli.command('body-train-dict')
+    @click.option('--output', required=True, help='字典文件的保存路径')
+    @click.option('--size', type=int, default=112640, help='字典大小（字节）')
+    @click.option('--samples', type=int, default=10000, help='采样的文章数')
+    def body_train_dict(output, size, samples):
+        """用已有的文章正文训练zstd字典"""
+        import zstandard
+        from blog.models import Article
+        bodies = [row[0].encode('utf-8') for row in db.session.query(Article.body)
+                  .filter(Article.body.isnot(None)).order_by(Article.id.desc()).limit(samples)]
+        dictionary = zstandard.train_dictionary(size, bodies)
+        with open(output, 'wb') as f:
+            f.write(dictionary.as_bytes())
+        click.echo('trained %d byte dictionary from %d articles' % (len(dictionary.as_bytes()), len(bodies)))
+
+    @app.cli.command('db-maintenance')
+    @click.option('--step', 'steps', multiple=True, type=click.Choice(['analyze', 'checkpoint', 'vacuum']),
+                  help='只执行指定的步骤，可以重复，默认全部执行')
+    @click.option('--full-analyze', is_flag=True, help='对整个库执行ANALYZE，而不是PRAGMA optimize')
+    @click.option('--checkpoint-mode', type=click.Choice(['PASSIVE', 'FULL', 'RESTART', 'TRUNCATE']), default=None)
+    @click.option('--vacuum-pages', type=int, default=None, help='本次最多回收的空闲页数')
+    @click.option('--enable-incremental-vacuum', is_flag=True, help='把库切换为auto_vacuum=INCREMENTAL（会VACUUM整个库）')
+    def db_maintenance(steps, full_analyze, checkpoint_mode, vacuum_pages, enable_incremental_vacuum):
+        """执行SQLite维护：更新统计信息、WAL检查点、增量回收空闲页"""
+        from blog import maintenance
+        if enable_incremental_vacuum:
+            click.echo('auto_vacuum=INCREMENTAL: %s' % maintenance.enable_incremental_vacuum())
+        report = maintenance.run_maintenance(steps or None, full_analyze=full_analyze,
+                                             checkpoint_mode=checkpoint_mode, vacuum_pages=vacuum_pages)
+        for step, result in report.get('steps', {}).items():
+            details = ', '.join('%s=%s' % item for item in result.items() if item[0] != 'ms')
+            click.echo('%-10s %8.1fms  %s' % (step, result['ms'], details))
+        if 'skipped' in report:
+            click.echo('skipped: %s' % report['skipped'])
+        else:
+            click.echo('total %.1fms, database %d -> %d bytes (reclaimed %d)' % (
+                report['ms'], report['dbBytesBefore'], report['dbBytesAfter'], report['reclaimedBytes']))
+
+    @app.cli.command('capture-replay')
+    @click.argument('files', nargs=-1, required=True, type=click.Path(exists=True))
+    @click.option('--speed', type=float, default=1.0, help='相对原始速率的倍数，0为不等待、尽快发出')
+    @click.option('--concurrency', type=int, default=8, help='同时进行的请求数')
+    @click.option('--limit', type=int, default=None, help='只回放前若干条记录')
+    @click.option('--output', type=click.Path(), default=None, help='把各路由的耗时分布保存为JSON，供capture-compare比较')
+    @click.option('--label', default=None, help='保存在结果中的构建标识')
+    @click.option('--seed-accounts', type=int, default=0,
+                  help='回放前创建若干个已知密码的账号，登录请求轮流使用，测到的是登录成功的耗时')
+    @click.option('--password', default='replay-password', help='--seed-accounts创建的账号的密码')
+    @click.option('--fixtures', type=click.Path(exists=True), default=None,
+                  help='JSON文件，{"方法 路由": 请求体模板}，模板字符串中的{seq}替换为回放序号，优先于--seed-accounts')
+    def capture_replay(files, speed, concurrency, limit, output, label, seed_accounts, password, fixtures):
+        """在当前应用上回放流量记录，统计各路由的耗时分布（建议设置RATE_LIMIT_ENABLED=false、CAPTURE_ENABLED=false）。
+
+        注意：回放的POST、PUT、DELETE请求和--seed-accounts创建的账号都会写入当前配置的数据库，应使用测试库的副本回放
+        """
+        import json
+        import time
+        from blog.capture import read_captures, replay, latency_summary, seed_accounts as seed, load_fixtures
+        records = read_captures(files)[:limit]
+        providers = {}
+        if seed_accounts:
+            providers.update(seed(seed_accounts, password))
+        if fixtures:
+            providers.update(load_fixtures(fixtures))
+        started = time.time()
+        latencies, errors, lag = replay(app, records, speed=speed, concurrency=concurrency, body_providers=providers)
+        routes = {key: dict(latency_summary(samples), errors=errors.get(key, 0), samples=samples)
+                  for key, samples in latencies.items()}
+        for key, summary in sorted(routes.items(), key=lambda item: -item[1]['count']):
+            click.echo('%-48s n=%-6d p50 %8.2fms  p90 %8.2fms  p99 %8.2fms  5xx %d' % (
+                key, summary['count'], summary['p50'], summary['p90'], summary['p99'], summary['errors']))
+        click.echo('%d requests in %.1fs' % (len(records), time.time() - started))
+        if speed:
+            click.echo('max lag behind schedule %.2fs' % lag)
+        if output:
+            with open(output, 'w', encoding='utf-8') as f:
+                json.dump({'label': label, 'speed': speed, 'concurrency': concurrency, 'startedAt': started,
+                           'routes': routes}, f)
+
+    @app.cli.command('capture-compare')
+    @click.argument('base', type=click.Path(exists=True))
+    @click.argument('new', type=click.Path(exists=True))
+    @click.option('--threshold', type=float, default=0.1, help='p50或p99变慢超过这个比例记为退化')
+    @click.option('--min-count', type=int, default=20, help='样本数少于这个值的路由不判断')
+    def capture_compare(base, new, threshold, min_count):
+        """比较两次capture-replay的结果，有路由退化时以状态码1退出"""
+        import json
+        from blog.capture import compare_results
+        with open(base, encoding='utf-8') as f:
+            base_result = json.load(f)
+        with open(new, encoding='utf-8') as f:
+            new_result = json.load(f)
+        rows = compare_results(base_result, new_result, threshold=threshold, min_count=min_count)
+        click.echo('%s -> %s' % (base_result.get('label') or base, new_result.get('label') or new))
+        for row in rows:
+            if not row['base'] or not row['new']:
+                click.echo('%-48s only in %s' % (row['route'], 'new' if row['new'] else 'base'))
+                continue
+            click.echo('%-48s p50 %8.2f -> %8.2fms  p99 %8.2f -> %8.2fms%s' % (
+                row['route'], row['base']['p50'], row['new']['p50'], row['base']['p99'], row['new']['p99'],
+                '  REGRESSED' if row['regressed'] else ''))
+        if any(row['regressed'] for row in rows):
+            raise SystemExit(1)
@@ -1,2 +1,5 @@
 from blog import create_app
+from blog.asgi import BlogASGI
 app = create_app()
+# ASGI入口，例如 uvicorn blog.app:asgi_app
+asgi_app = BlogASGI(app)
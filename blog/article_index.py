@@ -0,0 +1,204 @@
+import threading
+import time
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import select, inspect
+
+from blog.estensions import db
+from blog.models import Article, Collect, Tag, tagging
+from blog.signals import article_tags_changed, article_collected, article_uncollected
+
+
+# 一组倒排表：每个键对应一个有序的位置数组。写入先记在增量集合里，读到这个键时才合并成新数组，
+# 写操作是O(1)的，只有被查询的键付出合并的代价
+class PostingLists(object):
+
+    def __init__(self, lists=None):
+        self._lists = lists or {}
+        self._added = {}
+        self._removed = {}
+
+    @classmethod
+    def build(cls, pairs):
+        grouped = {}
+        for key, position in pairs:
+            grouped.setdefault(key, []).append(position)
+        return cls({key: np.unique(np.asarray(positions, dtype=np.int64)) for key, positions in grouped.items()})
+
+    def add(self, key, position):
+        self._removed.get(key, set()).discard(position)
+        self._added.setdefault(key, set()).add(position)
+
+    def remove(self, key, position):
+        self._added.get(key, set()).discard(position)
+        self._removed.setdefault(key, set()).add(position)
+
+    def get(self, key):
+        base = self._lists.get(key)
+        added, removed = self._added.pop(key, None), self._removed.pop(key, None)
+        if added or removed:
+            if base is None:
+                base = np.empty(0, dtype=np.int64)
+            if removed:
+                base = base[~np.isin(base, list(removed))]
+            if added:
+                base = np.union1d(base, np.fromiter(added, dtype=np.int64))
+            self._lists[key] = base
+        return base
+
+
+# 文章元数据索引：文章按(createdAt, id)排序后编号为位置，标签、作者、收藏者各有一组倒排表，
+# 组合条件的查询对这几个有序数组求交集后直接分页，只有最后一页的文章id交给SQL读取。
+# 新文章追加在末尾；创建时间早于末尾的文章（时钟回拨、其他worker写入）无法追加，标记为需要重建
+class ArticleIndex(object):
+
+    def __init__(self):
+        self.built_at = None
+        self._ids = []
+        self._positions = {}
+        self._created = []
+        self._meta = {}
+        self._dead = set()
+        self.tags = PostingLists()
+        self.authors = PostingLists()
+        self.favorites = PostingLists()
+        self._lock = threading.Lock()
+
+    # 从数据库重建，已软删除的文章由全局的查询条件排除
+    def load(self):
+        articles = db.session.execute(select(Article.id, Article.createdAt, Article.author_id)
+                                      .order_by(Article.createdAt, Article.id)).all()
+        tag_rows = db.session.execute(select(tagging.c.article_id, Tag.name)
+                                      .join(Tag, Tag.id == tagging.c.tag_id)).all()
+        collect_rows = db.session.execute(select(Collect.collector_id, Collect.collected_id)).all()
+        with self._lock:
+            self._ids = [row[0] for row in articles]
+            self._positions = {article_id: position for position, article_id in enumerate(self._ids)}
+            self._created = [row[1] for row in articles]
+            self._meta = {row[0]: (row[2], set()) for row in articles}
+            for article_id, name in tag_rows:
+                if article_id in self._meta:
+                    self._meta[article_id][1].add(name)
+            positions = self._positions
+            self.tags = PostingLists.build((name, positions[article_id]) for article_id, name in tag_rows
+                                           if article_id in positions)
+            self.authors = PostingLists.build((row[2], position) for position, row in enumerate(articles))
+            self.favorites = PostingLists.build((user_id, positions[article_id]) for user_id, article_id
+                                                in collect_rows if article_id in positions)
+            self._dead = set()
+            self.built_at = time.monotonic()
+
+    def set_article(self, article_id, created_at, author_id, tag_names):
+        tag_names = set(tag_names)
+        with self._lock:
+            position = self._positions.get(article_id)
+            if position is None:
+                if self._created and created_at is not None and self._created[-1] is not None \
+                        and created_at < self._created[-1]:
+                    self.built_at = None
+                    return
+                position = self._positions[article_id] = len(self._ids)
+                self._ids.append(article_id)
+                self._created.append(created_at)
+                self.authors.add(author_id, position)
+                old_tags = set()
+            else:
+                old_tags = self._meta[article_id][1]
+            for name in old_tags - tag_names:
+                self.tags.remove(name, position)
+            for name in tag_names - old_tags:
+                self.tags.add(name, position)
+            self._meta[article_id] = (author_id, tag_names)
+
+    # 删除的文章从作者和标签的倒排表中去掉；收藏者不知道有哪些，查询时按_dead过滤，重建时清除
+    def remove_article(self, article_id):
+        with self._lock:
+            position = self._positions.pop(article_id, None)
+            if position is None:
+                return
+            author_id, tag_names = self._meta.pop(article_id)
+            self.authors.remove(author_id, position)
+            for name in tag_names:
+                self.tags.remove(name, position)
+            self._dead.add(position)
+
+    def set_favorite(self, user_id, article_id, favorited):
+        with self._lock:
+            position = self._positions.get(article_id)
+            if position is None:
+                return
+            if favorited:
+                self.favorites.add(user_id, position)
+            else:
+                self.favorites.remove(user_id, position)
+
+    # 按条件求交集并分页，返回(当前页的文章id列表, 符合条件的总数)，结果按创建时间升序
+    def page(self, tag=None, author_id=None, favorited_by=None, limit=20, offset=0):
+        with self._lock:
+            lists = []
+            if tag is not None:
+                lists.append(self.tags.get(tag))
+            if author_id is not None:
+                lists.append(self.authors.get(author_id))
+            if favorited_by is not None:
+                lists.append(self.favorites.get(favorited_by))
+            if any(postings is None for postings in lists):
+                return [], 0
+            if lists:
+                lists.sort(key=len)
+                result = lists[0]
+                for postings in lists[1:]:
+                    if not len(result):
+                        break
+                    result = np.intersect1d(result, postings, assume_unique=True)
+            else:
+                result = np.arange(len(self._ids), dtype=np.int64)
+            if self._dead and len(result):
+                result = result[~np.isin(result, list(self._dead))]
+            ids = self._ids
+            return [ids[position] for position in result[offset:offset + limit].tolist()], len(result)
+
+
+# 索引在第一次组合条件的查询时才创建和加载（同时导入numpy），之后超过ARTICLE_INDEX_TTL秒从数据库重建一次，
+# 以吸收其他worker进程中的写入
+def get_article_index():
+    index = current_app.extensions.get('article_index')
+    if index is None:
+        index = current_app.extensions['article_index'] = ArticleIndex()
+    if index.built_at is None or time.monotonic() - index.built_at > current_app.config['ARTICLE_INDEX_TTL']:
+        index.load()
+    return index
+
+
+def _loaded_index():
+    index = current_app.extensions.get('article_index')
+    if index is not None and index.built_at is not None:
+        return index
+    return None
+
+
+# 文章创建、修改标签和删除（硬删除或软删除）后都会发出这个信号
+@article_tags_changed.connect
+def on_article_tags_changed(sender, article, **kwargs):
+    index = _loaded_index()
+    if index is None:
+        return
+    if inspect(article).was_deleted or article.deletedAt is not None:
+        index.remove_article(article.id)
+    else:
+        index.set_article(article.id, article.createdAt, article.author_id, [tag.name for tag in article.tagList])
+
+
+@article_collected.connect
+def on_article_collected(sender, article, **kwargs):
+    index = _loaded_index()
+    if index is not None:
+        index.set_favorite(sender.id, article.id, True)
+
+
+@article_uncollected.connect
+def on_article_uncollected(sender, article, **kwargs):
+    index = _loaded_index()
+    if index is not None:
+        index.set_favorite(sender.id, article.id, False)
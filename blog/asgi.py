@@ -0,0 +1,319 @@
+import asyncio
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from io import BytesIO
+from urllib.parse import unquote
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from blog.estensions import db
+from blog.events import EVENT_STREAM_KEY, format_event, prune_events
+from blog.models import EventLog
+
+logger = logging.getLogger(__name__)
+
+
+# 有界的aiosqlite连接池，连接用完时协程在队列上等待，而不是阻塞线程
+class AsyncSQLitePool(object):
+
+    def __init__(self, database, size=10):
+        self.database = database
+        self.size = size
+        self._idle = None
+        self._created = 0
+
+    async def acquire(self):
+        # aiosqlite为可选依赖，只有ASGI模式下推送事件流时才需要
+        import aiosqlite
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+        if self._idle.empty() and self._created < self.size:
+            self._created += 1
+            try:
+                return await aiosqlite.connect(self.database)
+            except Exception:
+                self._created -= 1
+                raise
+        return await self._idle.get()
+
+    def release(self, conn):
+        self._idle.put_nowait(conn)
+
+    @asynccontextmanager
+    async def connection(self):
+        conn = await self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    async def close(self):
+        if self._idle is None:
+            return
+        while not self._idle.empty():
+            conn = self._idle.get_nowait()
+            await conn.close()
+            self._created -= 1
+
+
+# ASGI模式下的事件流订阅中心，与EventHub相同，只是轮询和分发都在事件循环上完成：
+# 一个协程按SSE_POLL_INTERVAL轮询event_log，把新事件放进订阅者的asyncio.Queue，推送连接不占用线程
+class AsyncEventHub(object):
+
+    def __init__(self, asgi):
+        self.asgi = asgi
+        self._subscribers = {}
+        self._task = None
+        self.last_id = None
+
+    def subscribe(self, channels):
+        q = asyncio.Queue(maxsize=self.asgi.app.config['SSE_QUEUE_SIZE'])
+        for channel in channels:
+            self._subscribers.setdefault(channel, set()).add(q)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._poll())
+        return q
+
+    def unsubscribe(self, q, channels):
+        for channel in channels:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(q)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def dispatch(self, event_id, channel, payload):
+        for q in list(self._subscribers.get(channel, ())):
+            try:
+                q.put_nowait((event_id, payload))
+            except asyncio.QueueFull:
+                # 客户端读得太慢，丢弃事件，客户端可以凭Last-Event-ID重连补齐
+                pass
+
+    async def _poll(self):
+        config = self.asgi.app.config
+        loop = asyncio.get_running_loop()
+        pruned_at = time.monotonic()
+        table = EventLog.__table__.name
+        while True:
+            try:
+                if self.last_id is None:
+                    # 从第一个订阅者出现时的最新事件之后开始分发
+                    rows = await self.asgi.fetch('SELECT MAX(id) FROM %s' % table)
+                    self.last_id = rows[0][0] or 0
+                rows = await self.asgi.fetch('SELECT id, channel, payload FROM %s WHERE id > :last_id '
+                                             'ORDER BY id LIMIT 1000' % table, {'last_id': self.last_id})
+                for event_id, channel, payload in rows:
+                    self.dispatch(event_id, channel, payload)
+                    self.last_id = event_id
+                if time.monotonic() - pruned_at > config['SSE_PRUNE_INTERVAL']:
+                    await loop.run_in_executor(self.asgi.wsgi_executor, self.asgi.prune_events)
+                    pruned_at = time.monotonic()
+            except Exception:
+                logger.exception('async event hub poll failed')
+            await asyncio.sleep(config['SSE_POLL_INTERVAL'])
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+# ASGI入口：所有请求都交给原有的WSGI应用，在有界线程池中执行，经过完整的after_request链（条件GET、压缩、限流、录制），
+# 慢请求（发信、密码散列等）只占用线程池，不会阻塞事件循环。
+# 事件流（SSE）请求的视图在线程池中完成鉴权后立即返回，之后由事件循环推送事件，长连接不占用线程；
+# SQLite时轮询event_log用有界的aiosqlite连接池，其他数据库在线程池中短暂执行查询
+class BlogASGI(object):
+
+    def __init__(self, app):
+        self.app = app
+        config = app.config
+        self.wsgi_executor = ThreadPoolExecutor(max_workers=config['ASGI_WSGI_THREADS'],
+                                                thread_name_prefix='asgi-wsgi')
+        self.hub = AsyncEventHub(self)
+        self.pool = None
+        url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+        if url.get_backend_name() == 'sqlite' and url.database:
+            self.pool = AsyncSQLitePool(url.database, size=config['ASGI_DB_POOL_SIZE'])
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise RuntimeError('不支持的ASGI请求类型: %s' % scope['type'])
+        return await self.call_wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.hub.close()
+                if self.pool is not None:
+                    await self.pool.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # 只读查询，sql使用:name形式的参数
+    async def fetch(self, sql, params=None):
+        if self.pool is not None:
+            async with self.pool.connection() as conn:
+                async with conn.execute(sql, params or {}) as cursor:
+                    return await cursor.fetchall()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.wsgi_executor, self._fetch, sql, params or {})
+
+    def _fetch(self, sql, params):
+        with self.app.app_context():
+            with db.engine.connect() as conn:
+                return conn.execute(text(sql), params).all()
+
+    def prune_events(self):
+        with self.app.app_context():
+            try:
+                prune_events()
+                db.session.commit()
+            finally:
+                db.session.remove()
+
+    async def call_wsgi(self, scope, receive, send):
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+        environ = build_environ(scope, body)
+        environ[EVENT_STREAM_KEY] = None
+        loop = asyncio.get_running_loop()
+        status, headers, chunks = await loop.run_in_executor(self.wsgi_executor, self.run_wsgi, environ)
+        stream = environ[EVENT_STREAM_KEY]
+        if stream is not None and status == 200:
+            headers = [(name, value) for name, value in headers if name != b'content-length']
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            return await self.event_stream(receive, send, *stream)
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b''.join(chunks)})
+
+    def run_wsgi(self, environ):
+        started = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin1'), value.encode('latin1'))
+                                  for name, value in response_headers]
+
+        result = self.app(environ, start_response)
+        try:
+            return started['status'], started['headers'], list(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    # 事件流的响应体，行为与events.event_stream相同：先补发错过的事件，然后等待新事件，空闲时发送保活注释，
+    # 最多保持SSE_MAX_STREAM秒。客户端断开时停止推送并取消订阅
+    async def event_stream(self, receive, send, channels, last_event_id):
+        pushing = asyncio.ensure_future(self._push_events(send, channels, last_event_id))
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            await asyncio.wait({pushing, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            pushing.cancel()
+            disconnected.cancel()
+            # 等待两个任务真正结束，取消订阅在返回之前完成
+            result, _ = await asyncio.gather(pushing, disconnected, return_exceptions=True)
+        if isinstance(result, Exception):
+            raise result
+
+    async def _wait_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def _push_events(self, send, channels, last_event_id):
+        config = self.app.config
+        keepalive, max_stream = config['SSE_KEEPALIVE'], config['SSE_MAX_STREAM']
+        q = self.hub.subscribe(channels)
+        try:
+            # 先订阅再补发，避免两者之间发布的事件丢失；重复的事件按id跳过
+            missed = await self.missed_events(channels, last_event_id) if last_event_id is not None else []
+            last_sent = last_event_id or 0
+            deadline = time.monotonic() + max_stream
+            await self._send_chunk(send, 'retry: %d\n\n' % config['SSE_RETRY_MS'])
+            for event_id, payload in missed:
+                last_sent = event_id
+                await self._send_chunk(send, format_event(event_id, payload))
+            while True:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    event_id, payload = await asyncio.wait_for(q.get(), timeout=min(keepalive, left))
+                except asyncio.TimeoutError:
+                    await self._send_chunk(send, ': keepalive\n\n')
+                    continue
+                if event_id <= last_sent:
+                    continue
+                last_sent = event_id
+                await self._send_chunk(send, format_event(event_id, payload))
+        finally:
+            self.hub.unsubscribe(q, channels)
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def _send_chunk(self, send, chunk):
+        await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+
+    async def missed_events(self, channels, last_event_id):
+        names = {'channel%d' % i: channel for i, channel in enumerate(channels)}
+        if not names:
+            return []
+        params = dict(names, last_event_id=last_event_id, limit=self.app.config['SSE_QUEUE_SIZE'])
+        rows = await self.fetch('SELECT id, payload FROM %s WHERE id > :last_event_id AND channel IN (%s) '
+                                'ORDER BY id LIMIT :limit'
+                                % (EventLog.__table__.name, ', '.join(':' + name for name in names)), params)
+        return [(row[0], row[1]) for row in rows]
+
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': unquote(scope['path']).encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope['http_version'],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+        environ['REMOTE_PORT'] = str(scope['client'][1])
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1')
+        value = value.decode('latin1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in environ:
+            value = environ[key] + ',' + value
+        environ[key] = value
+    return environ
+
+
+def create_asgi_app(config_name=None):
+    from blog import create_app
+    return BlogASGI(create_app(config_name))
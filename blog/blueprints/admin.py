@@ -0,0 +1,104 @@
+import hmac
+from functools import wraps
+
+from flask import Blueprint, jsonify, request, current_app, send_from_directory
+
+from blog.profiling import list_profiles, profile_dir
+from blog.deadline import deadline_hits
+from blog.ratelimit import rate_limit_rejections
+from blog.maintenance import last_maintenance
+from blog.memtrack import memory_report
+
+admin_bp = Blueprint('admin', __name__)
+
+
+# 管理接口用请求头X-Admin-Token中的令牌鉴权，未配置ADMIN_TOKEN时管理接口全部不可用
+def admin_required(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = current_app.config['ADMIN_TOKEN']
+        header = request.headers.get('X-Admin-Token')
+        if not token or not header or not hmac.compare_digest(header, token):
+            ret_data = {"code": 10008,
+                        "errors": {
+                            "body": [
+                                "can't be empty"
+                            ]
+                        },
+                        "message": "not admin"
+                        }
+            return jsonify(ret_data)
+        return func(*args, **kwargs)
+    return wrapper
+
+
+# 列出已保存的性能剖析文件
+@admin_bp.route('/api/admin/profiles', methods=['GET'])
+@admin_required
+def profiles_list():
+    ret_data = {
+        "data": {'profiles': list_profiles(current_app)},
+        'message': 'null',
+        'code': 10000,
+    }
+    return jsonify(ret_data)
+
+
+# 下载剖析文件：.prof用pstats或snakeviz查看，.speedscope.json可以直接拖进speedscope
+@admin_bp.route('/api/admin/profiles/<name>', methods=['GET'])
+@admin_required
+def profiles_download(name):
+    return send_from_directory(profile_dir(current_app), name, as_attachment=True)
+
+
+# 各端点超过请求截止时间的次数
+@admin_bp.route('/api/admin/deadlines', methods=['GET'])
+@admin_required
+def deadlines_list():
+    ret_data = {
+        "data": {'deadlineMs': current_app.config['REQUEST_DEADLINE_MS'],
+                 'hits': deadline_hits(current_app)},
+        'message': 'null',
+        'code': 10000,
+    }
+    return jsonify(ret_data)
+
+
+# 各端点、各限流范围被拒绝的请求数（当前worker进程）
+@admin_bp.route('/api/admin/ratelimits', methods=['GET'])
+@admin_required
+def ratelimits_list():
+    ret_data = {
+        "data": {'limits': current_app.config['RATE_LIMITS'] if current_app.config['RATE_LIMIT_ENABLED'] else {},
+                 'rejected': rate_limit_rejections(current_app)},
+        'message': 'null',
+        'code': 10000,
+    }
+    return jsonify(ret_data)
+
+
+# 当前worker最近一次SQLite维护的报告，还没有执行过时为null
+@admin_bp.route('/api/admin/maintenance', methods=['GET'])
+@admin_required
+def maintenance_last():
+    ret_data = {
+        "data": {'intervalSeconds': current_app.config['MAINTENANCE_INTERVAL'],
+                 'last': last_maintenance(current_app)},
+        'message': 'null',
+        'code': 10000,
+    }
+    return jsonify(ret_data)
+
+
+# 各端点的峰值分配、净增长与相对基线增长最多的分配位置（需要MEMTRACK_ENABLED），
+# limit为列出的分配位置数，baseline=1在返回后把当前状态设为新的基线
+@admin_bp.route('/api/admin/memory', methods=['GET'])
+@admin_required
+def memory_stats():
+    ret_data = {
+        "data": {'memory': memory_report(current_app, limit=request.args.get('limit', type=int),
+                                         reset_baseline=request.args.get('baseline') == '1')},
+        'message': 'null',
+        'code': 10000,
+    }
+    return jsonify(ret_data)
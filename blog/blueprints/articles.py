@@ -1,46 +1,114 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response
 from flask_apispec import use_kwargs, marshal_with
 from marshmallow import fields
 from blog.models import User, Article, Comment, Tag, article_schema, articles_schema, comment_schema, \
-    comments_schema, Follow
+    comments_schema, Follow, Collect, TrendingArticle, RelatedArticle
+from blog.signals import comment_posted, article_tags_changed, article_published
 from flask_login import login_required, current_user
 from blog.estensions import db
-from slugify import slugify
+from blog.conditional import conditional
+from blog.softdelete import soft_delete_article
+from blog.events import EVENT_STREAM_KEY, get_event_hub, event_stream, feed_channels
+from blog.profiles import get_profile
+from blog.readmodels import article_rows, comment_rows
+from blog.utils import too_many_items_response
+from blog.slugs import assign_slug
+from sqlalchemy import func, select, exists, and_
+from sqlalchemy.orm import aliased, joinedload, selectinload
+from datetime import datetime
 import json
 
 articles_bp = Blueprint('articles', __name__)
 
 
-# 为了避免不同查询条件写多个视图， 使用flask_apispec提供的@use_kwargs装饰器
-@articles_bp.route('/api/articles', methods=['GET'])
-@marshal_with(articles_schema)
-def articles_show(limit=20, offset=0):
+# 计算文章版本用到的列：更新时间、作者资料、收藏数，以及当前用户是否收藏了文章、是否关注了作者，
+# 响应中的这些字段任何一个变化，ETag都会随之变化
+def article_version_columns():
+    viewer_id = current_user.id if current_user.is_authenticated else None
+    # 使用别名，避免子查询与外层查询中已有的Collect/Follow关联
+    collect, follow = aliased(Collect), aliased(Follow)
+    favorites = select(func.count()).where(collect.collected_id == Article.id).scalar_subquery()
+    viewer_collect = aliased(Collect)
+    favorited = exists().where(and_(viewer_collect.collected_id == Article.id,
+                                    viewer_collect.collector_id == viewer_id))
+    following = exists().where(and_(follow.followed_id == Article.author_id, follow.follower_id == viewer_id))
+    return (Article.id, Article.slug, Article.updatedAt, User.username, User.email, User.bio, User.image,
+            favorites, favorited, following)
+
+
+def article_version(slug):
+    row = db.session.query(*article_version_columns()).outerjoin(User, User.id == Article.author_id) \
+        .filter(Article.slug == slug).first()
+    if row is None:
+        return None
+    return tuple(row), None
+
+
+# 分页参数，limit/offset从查询字符串中读取
+def page_args():
+    return request.args.get('limit', 20, type=int), request.args.get('offset', 0, type=int)
+
+
+# 根据查询参数构造文章列表的查询，tag、author、favorited可以组合使用
+def articles_filter_query():
     tag = request.args.get('tag')
     author = request.args.get('author')
     favorited = request.args.get('favorited')
+    query = Article.query
     if tag is not None:
-        res = Article.query.filter(Article.tagList.any(Tag.name == tag))
-        return res.offset(offset).limit(limit).all()
+        query = query.filter(Article.tagList.any(Tag.name == tag))
     if author is not None:
-        target_author = User.query.filter(User.username == author).first()
-        res = Article.query.filter(Article.author == target_author)
-        return res.offset(offset).limit(limit).all()
+        author_id = select(User.id).where(User.username == author).scalar_subquery()
+        query = query.filter(Article.author_id == author_id)
     if favorited is not None:
-        # 要想从user的collection中返回响应，遇到的问题是从collection中获取的响应与响应模型不一致
-        # join的用法
-        # 这里获得的是所有Collect模型的响应，而不是Article响应模型
-        target_user = User.query.filter(User.username == favorited).first()
-        article_id = []
-        res_list = []
-        user_collect = target_user.collections
-        # for collect in user_collect:
-        #    article_id.append(collect.collected_id)
-        for ar_id in user_collect:
-            res = Article.query.filter(Article.id == ar_id.collected_id).first()
-            res_list.append(res)
-        return res_list
+        # 与collect表做一次连接，由(collector_id, timestamp)索引支持
+        collector_id = select(User.id).where(User.username == favorited).scalar_subquery()
+        query = query.join(Collect, Collect.collected_id == Article.id).filter(Collect.collector_id == collector_id)
+    if [tag, author, favorited].count(None) < 2:
+        # 组合条件时与文章索引的顺序一致，按创建时间升序
+        return query.order_by(Article.createdAt, Article.id)
+    if favorited is not None:
+        # 只按收藏者过滤时按收藏时间倒序
+        return query.order_by(Collect.timestamp.desc())
+    return query
+
+
+# 当前页的查询与分页参数。组合了多个过滤条件且开启了文章索引时，由内存中的索引求交集、分页，
+# SQL只按id读取最后这一页；否则由articles_filter_query在SQL中过滤
+def articles_page():
+    limit, offset = page_args()
+    tag, author, favorited = request.args.get('tag'), request.args.get('author'), request.args.get('favorited')
+    if not current_app.config['ARTICLE_INDEX_ENABLED'] or [tag, author, favorited].count(None) > 1:
+        return articles_filter_query(), limit, offset
+    # 索引依赖numpy，在第一次组合条件的查询时才导入
+    from blog.article_index import get_article_index
+    author_profile = get_profile(author) if author is not None else None
+    favorited_profile = get_profile(favorited) if favorited is not None else None
+    if (author is not None and author_profile is None) or (favorited is not None and favorited_profile is None):
+        ids = []
     else:
-        return Article.query.offset(offset).limit(limit).all()
+        ids = get_article_index().page(tag=tag, author_id=author_profile and author_profile.id,
+                                       favorited_by=favorited_profile and favorited_profile.id,
+                                       limit=limit, offset=offset)[0]
+    return Article.query.filter(Article.id.in_(ids)).order_by(Article.createdAt, Article.id), len(ids), 0
+
+
+# 列表的版本：只查询当前页每篇文章的版本列，Last-Modified取页内最新的更新时间
+def articles_version():
+    query, limit, offset = articles_page()
+    rows = query.with_entities(*article_version_columns()) \
+        .outerjoin(User, User.id == Article.author_id).offset(offset).limit(limit).all()
+    last_modified = max([row.updatedAt for row in rows if row.updatedAt is not None], default=None)
+    return (request.query_string, tuple(tuple(row) for row in rows)), last_modified
+
+
+# 为了避免不同查询条件写多个视图， 使用flask_apispec提供的@use_kwargs装饰器
+@articles_bp.route('/api/articles', methods=['GET'])
+@conditional(articles_version)
+@marshal_with(articles_schema)
+def articles_show():
+    # 只读的行对象，作者、标签、收藏状态都批量查好，序列化时不再逐篇查询
+    return article_rows(*articles_page())
 
 
 # 返回关注的用户创建的多篇文章
@@ -50,13 +118,83 @@ def articles_show(limit=20, offset=0):
 @marshal_with(articles_schema)
 def articles_feed(limit=20, offset=0):
     if current_user.is_authenticated:
-        target_articles = Article.query.join(Follow, Follow.followed_id == Article.author_id).filter(
-            Follow.follower_id == current_user.id).order_by(Article.createdAt).offset(offset).limit(limit).all()
-        return target_articles
+        return article_rows(Article.query.join(Follow, Follow.followed_id == Article.author_id)
+                            .filter(Follow.follower_id == current_user.id).order_by(Article.createdAt), limit, offset)
+
+
+# 推送事件流的响应：关闭代理缓冲，断线重连时浏览器会在请求头Last-Event-ID中带上收到的最后一个事件id。
+# ASGI模式下视图只负责鉴权和确定频道，事件由事件循环推送，不占用执行WSGI请求的线程
+def stream_response(channels):
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    if EVENT_STREAM_KEY in request.environ:
+        request.environ[EVENT_STREAM_KEY] = (channels, last_event_id)
+        return Response(mimetype='text/event-stream', headers=headers)
+    stream, close = event_stream(get_event_hub(), channels, last_event_id)
+    response = Response(stream, mimetype='text/event-stream', headers=headers)
+    response.call_on_close(close)
+    return response
+
+
+# 关注的作者发表的新文章，以Server-Sent Events推送，替代轮询/api/articles/feed
+@articles_bp.route('/api/articles/feed/stream', methods=['GET'])
+@login_required
+def articles_feed_stream():
+    return stream_response(feed_channels(current_user.id))
+
+
+# 热门文章，直接按分数索引读取预先计算好的快照，每次只读取一页
+@articles_bp.route('/api/articles/trending', methods=['GET'])
+@marshal_with(articles_schema)
+def articles_trending():
+    limit, offset = page_args()
+    return article_rows(Article.query.join(TrendingArticle, TrendingArticle.article_id == Article.id)
+                        .order_by(TrendingArticle.score.desc()), limit, offset)
+
+
+# 批量获取文章：请求体 {"slugs": [...]}，用文章列表的只读查询一次取出所有文章，标签、收藏数、
+# 当前用户的收藏和关注状态各一次IN查询，按请求的顺序返回，不存在的文章返回code为10004的条目
+@articles_bp.route('/api/articles/batch', methods=['POST'])
+@login_required
+def articles_batch():
+    slugs = (request.get_json(silent=True) or {}).get('slugs') or []
+    if not isinstance(slugs, list) or not all(isinstance(slug, str) for slug in slugs):
+        ret_data = {
+            "code": 10001,
+            "errors": {
+                "body": [
+                    "slugs必须是字符串数组"
+                ]
+            },
+            "message": "fail"
+        }
+        return jsonify(ret_data)
+    if len(slugs) > current_app.config['BATCH_MAX_ITEMS']:
+        return too_many_items_response()
+    articles = article_rows(Article.query.filter(Article.slug.in_(slugs)), len(slugs), 0) if slugs else []
+    by_slug = {article.slug: article for article in articles}
+    items = []
+    for slug in slugs:
+        article = by_slug.get(slug)
+        if article is None:
+            items.append({"code": 10004,
+                          "errors": {
+                              "body": [
+                                  "can't be empty"
+                              ]
+                          },
+                          "message": "no article",
+                          "slug": slug
+                          })
+        else:
+            items.append(article_schema.dump(article))
+    ret_data = {'articles': items, 'articleCount': len(items), 'message': 'success', 'code': 10000, 'body': 'null'}
+    return jsonify(ret_data)
 
 
 # 获取单篇文章
 @articles_bp.route('/api/articles/<slug>', methods=['GET'])
+@conditional(article_version)
 @use_kwargs({'slug': fields.Str()})
 @marshal_with(article_schema)
 def article_get(slug):
@@ -77,6 +215,41 @@ def article_get(slug):
         return jsonify(ret_data)
 
 
+# 对于多对多关系 要添加的标签必须已有该实例，所以对于新标签要先创建该实例，再添加 否则报错 'str' object has no attribute '_sa...'
+def get_or_create_tags(names):
+    tags = []
+    for name in dict.fromkeys(names):
+        exist_tag = Tag.query.filter_by(name=name).first()
+        if exist_tag is None:
+            exist_tag = Tag()
+            exist_tag.name = name
+            db.session.add(exist_tag)
+        tags.append(exist_tag)
+    return tags
+
+
+# 相关文章，读取预先计算好的近邻，按rank顺序返回
+@articles_bp.route('/api/articles/<slug>/related', methods=['GET'])
+@login_required
+@marshal_with(articles_schema)
+def articles_related(slug):
+    article_id = db.session.query(Article.id).filter(Article.slug == slug).scalar()
+    if article_id is None:
+        ret_data = {"code": 10004,
+                    "errors": {
+                        "body": [
+                            "can't be empty"
+                        ]
+                    },
+                    "message": "no article"
+                    }
+        return jsonify(ret_data)
+    return Article.query.join(RelatedArticle, RelatedArticle.related_id == Article.id) \
+        .filter(RelatedArticle.article_id == article_id) \
+        .options(joinedload(Article.author), selectinload(Article.tagList)) \
+        .order_by(RelatedArticle.rank).all()
+
+
 # 创作文章
 @articles_bp.route('/api/articles', methods=['POST'])
 @login_required
@@ -88,7 +261,8 @@ def article_create():
     description = dic1['description']
     body = dic1['body']
     if current_user.is_authenticated:
-        exist_article = Article.query.filter_by(title=title).first()
+        # 标题上有索引，只查id
+        exist_article = db.session.query(Article.id).filter(Article.title == title).first()
         if exist_article is not None:
             ret_data = {
                 "code": 10005,
@@ -98,23 +272,15 @@ def article_create():
             return jsonify(ret_data)
         article = Article()
         article.title = title
-        article.author = current_user
+        article.author_id = current_user.id
         article.description = description
         article.body = body
-        article.slug = slugify(title)
-        # 对于多对多关系 要添加的标签必须已有该实例，所以对于新标签要先创建该实例，再添加 否则报错 'str' object has no attribute '_sa...'
-        for tag in dic1["tagList"]:
-            exist_tag = Tag.query.filter_by(name=tag).first()
-            if exist_tag is None:
-                new_tag = Tag()
-                new_tag.name = tag
-                db.session.add(new_tag)
-                db.session.commit()
-                article.tagList.append(new_tag)
-            if exist_tag is not None:
-                article.tagList.append(exist_tag)
-        db.session.add(article)
+        # 先分配slug再设置标签，插入文章只需一条INSERT
+        assign_slug(article, title)
+        article.tagList = get_or_create_tags(dic1["tagList"])
         db.session.commit()
+        article_tags_changed.send(current_user._get_current_object(), article=article)
+        article_published.send(current_user._get_current_object(), article=article)
         return article
 
 
@@ -141,17 +307,25 @@ def article_update(slug):
         title = data['article'].get('title')
         description = data['article'].get('description')
         body = data['article'].get('body')
+        tag_list = data['article'].get('tagList')
         if title is not None:
             target_article.title = title
-            target_article.slug = slugify(title)
         if description is not None:
             target_article.description = description
         if body is not None:
             target_article.body = body
+        if tag_list is not None:
+            target_article.tagList = get_or_create_tags(tag_list)
+        target_article.updatedAt = datetime.utcnow()
         db.session.add(target_article)
         # 报错一次 问题在于当我想要测试是否能够验证当前用户为目标文章作者时，
-        # 创建新文章后在update请求里没有把请求的json数据中的title属性值修改，导致unique的slug冲突，在提交时报错
+        # 创建新文章后在update请求里没有把请求的json数据中的title属性值修改，导致unique的slug冲突，在提交时报错。
+        # 现在slug由assign_slug分配，与其他文章冲突时自动加数字后缀
+        if title is not None:
+            assign_slug(target_article, title)
         db.session.commit()
+        if tag_list is not None:
+            article_tags_changed.send(current_user._get_current_object(), article=target_article)
         return target_article
     else:
         ret_data = {"code": 10006,
@@ -182,8 +356,14 @@ def article_delete(slug):
         return jsonify(ret_data)
     # 判断要操作的文章的作者是否为当前用户
     if target_article.author == current_user:
-        db.session.delete(target_article)
-        db.session.commit()
+        # 评论、收藏、标签关联由数据库的ON DELETE CASCADE删除；开启软删除时只做标记，由后台任务清除
+        if current_app.config['ARTICLE_SOFT_DELETE']:
+            soft_delete_article(target_article)
+        else:
+            db.session.delete(target_article)
+            db.session.commit()
+        # 删除文章同时删除了它的标签关联，相关文章表中指向它的记录需要一并刷新
+        article_tags_changed.send(current_user._get_current_object(), article=target_article)
         ret_data = {"code": 10000,
                     "errors": {
                         "body": [
@@ -211,7 +391,7 @@ def article_delete(slug):
 @login_required
 @use_kwargs(comment_schema)
 @marshal_with(comment_schema)
-def article_comment(slug):
+def article_comment(slug, **kwargs):
     target_article = Article.query.filter(Article.slug == slug).first()
     if target_article is None:
         ret_data = {"code": 10004,
@@ -231,6 +411,7 @@ def article_comment(slug):
     comment.article = target_article
     db.session.add(comment)
     db.session.commit()
+    comment_posted.send(current_user._get_current_object(), comment=comment)
     return comment
 
 
@@ -239,8 +420,26 @@ def article_comment(slug):
 @login_required
 @marshal_with(comments_schema)
 def get_comments(slug):
-    target_article = Article.query.filter(Article.slug == slug).first()
-    if target_article is None:
+    article_id = db.session.query(Article.id).filter(Article.slug == slug).scalar()
+    if article_id is None:
+        ret_data = {"code": 10004,
+                    "errors": {
+                        "body": [
+                            "can't be empty"
+                        ]
+                    },
+                    "message": "no article"
+                    }
+        return jsonify(ret_data)
+    return comment_rows(article_id)
+
+
+# 文章的新评论，以Server-Sent Events推送，替代轮询评论列表
+@articles_bp.route('/api/articles/<slug>/comments/stream', methods=['GET'])
+@login_required
+def comments_stream(slug):
+    article_id = db.session.query(Article.id).filter(Article.slug == slug).scalar()
+    if article_id is None:
         ret_data = {"code": 10004,
                     "errors": {
                         "body": [
@@ -250,7 +449,7 @@ def get_comments(slug):
                     "message": "no article"
                     }
         return jsonify(ret_data)
-    return target_article.comments
+    return stream_response(['article:%d' % article_id])
 
 
 # 删除评论
@@ -1,11 +1,20 @@
 from flask import Blueprint, jsonify
+from sqlalchemy import func
 from blog.models import Tag
+from blog.estensions import db
+from blog.conditional import conditional
 
 
 tags_bp = Blueprint('tags', __name__)
 
 
+# 标签只会新增，不会修改或删除，标签数和最大id就能确定标签列表的版本
+def tags_version():
+    return tuple(db.session.query(func.count(Tag.id), func.max(Tag.id)).one()), None
+
+
 @tags_bp.route('/api/tags', methods=['GET'])
+@conditional(tags_version)
 def get_tags():
     ret_data = {
         "data": {'tags': [tag.name for tag in Tag.query.all()]},
@@ -1,10 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import create_access_token, create_refresh_token
 from blog.models import User
 from flask_login import login_user, logout_user, login_required, current_user
 from blog.estensions import db
 import json
-from blog.utils import validate_token
+from blog.utils import validate_token, too_many_items_response
+from blog.conditional import conditional
+from blog.profiles import get_profile, get_profiles, get_profiles_by_id, invalidate_profile, is_following_id, \
+    following_ids, profile_data
 
 users_bp = Blueprint('users', __name__)
 
@@ -157,6 +160,7 @@ def user_update():
         current_user.token = create_refresh_token(identity=current_user.username)
         db.session.add(current_user)
         db.session.commit()
+        invalidate_profile(current_user.username)
         ret_data = {
             "code": 10000,
             "data": {"user": {
@@ -185,20 +189,63 @@ def user_update():
         return jsonify(ret_data)
 
 
+# 推荐关注的用户
+@users_bp.route('/api/user/suggestions', methods=['GET'])
+@login_required
+def user_suggestions():
+    # 关注图依赖numpy，在第一次请求推荐时才导入
+    from blog.follow_graph import suggest_follows
+    limit = request.args.get('limit', 10, type=int)
+    suggestions = suggest_follows(current_user.id, limit)
+    profiles = get_profiles_by_id([user_id for user_id, score in suggestions])
+    ret_data = {
+        "code": 10000,
+        "data": {"profiles": [profile_data(profiles[user_id], False)
+                              for user_id, score in suggestions if user_id in profiles]},
+        "message": "null"}
+    return jsonify(ret_data)
+
+
+# 目标用户不存在时的响应
+def no_user_data():
+    return {
+        "code": 10007,
+        "errors": {
+            "body": [
+                "用户不存在"
+            ]
+        },
+        "message": "no user"
+    }
+
+
+def no_user_response():
+    return jsonify(no_user_data())
+
+
+# 个人资料的版本：缓存的资料字段以及当前用户是否关注了对方
+def profile_version(username):
+    if not current_user.is_authenticated:
+        return None
+    profile = get_profile(username)
+    if profile is None:
+        return None
+    return (profile.username, profile.bio, profile.image, is_following_id(current_user.id, profile.id)), None
+
+
 # 查询指定用户个人资料(当前用户需登录)
+# 公共资料来自profiles里的缓存，following单独查询，缓存不因查看者不同而失效
 @users_bp.route('/api/profiles/<username>', methods=['GET'])
+@conditional(profile_version)
 def user_profiles(username):
-    # 这里查询的是目标用户，当前登陆的是exist_user
-    target_user = User.query.filter(User.username == username).first()
     if current_user.is_authenticated:
+        # 这里查询的是目标用户，当前登陆的是current_user
+        profile = get_profile(username)
+        if profile is None:
+            return no_user_response()
         ret_data = {
             "code": 10000,
-            "data": {"profile": {
-                "username": target_user.username,
-                "bio": target_user.bio,
-                "image": target_user.bio,
-                "following": current_user.is_following(target_user)}
-            },
+            "data": {"profile": profile_data(profile, is_following_id(current_user.id, profile.id))},
             "message": "null"}
         return jsonify(ret_data)
     else:
@@ -214,19 +261,53 @@ def user_profiles(username):
         return jsonify(ret_data)
 
 
+# 批量查询个人资料：/api/profiles?usernames=a,b,c，资料一次IN查询（优先读缓存），
+# 是否关注也一次查询，按请求的顺序返回，不存在的用户返回code为10007的条目
+@users_bp.route('/api/profiles', methods=['GET'])
+def user_profiles_batch():
+    if not current_user.is_authenticated:
+        ret_data = {
+            "code": 10003,
+            "errors": {
+                "body": [
+                    "未登录"
+                ]
+            },
+            "message": "fail"
+        }
+        return jsonify(ret_data)
+    usernames = [name for name in request.args.get('usernames', '').split(',') if name]
+    if len(usernames) > current_app.config['BATCH_MAX_ITEMS']:
+        return too_many_items_response()
+    profiles = get_profiles(usernames)
+    following = following_ids(current_user.id, [profile.id for profile in profiles.values()])
+    items = []
+    for username in usernames:
+        profile = profiles.get(username)
+        if profile is None:
+            item = dict(no_user_data(), username=username)
+        else:
+            item = profile_data(profile, profile.id in following)
+        items.append(item)
+    ret_data = {
+        "code": 10000,
+        "data": {"profiles": items},
+        "message": "null"}
+    return jsonify(ret_data)
+
+
 # 关注用户
 @users_bp.route('/api/profiles/<username>/follow', methods=['POST'])
 def user_follow(username):
     if current_user.is_authenticated:
-        target_user = User.query.filter(User.username == username).first()
-        current_user.follow(target_user)
+        profile = get_profile(username)
+        if profile is None:
+            return no_user_response()
+        following = current_user.follow(profile)
+        invalidate_profile(username)
         ret_data = {
             "code": 10000,
-            "data": {"profile": {
-                "username": target_user.username,
-                "bio": target_user.bio,
-                "image": target_user.bio,
-                "following": current_user.is_following(target_user)}},
+            "data": {"profile": profile_data(profile, following)},
             "message": "null"}
         return jsonify(ret_data)
     else:
@@ -246,15 +327,14 @@ def user_follow(username):
 @users_bp.route('/api/profiles/<username>/follow', methods=['DELETE'])
 def user_unfollow(username):
     if current_user.is_authenticated:
-        target_user = User.query.filter(User.username == username).first()
-        current_user.unfollow(target_user)
+        profile = get_profile(username)
+        if profile is None:
+            return no_user_response()
+        following = current_user.unfollow(profile)
+        invalidate_profile(username)
         ret_data = {
             "code": 10000,
-            "data":{"profile": {
-                "username": target_user.username,
-                "bio": target_user.bio,
-                "image": target_user.bio,
-                "following": current_user.is_following(target_user)}},
+            "data": {"profile": profile_data(profile, following)},
             "message": "null"}
         return jsonify(ret_data)
     else:
@@ -0,0 +1,167 @@
+import zlib
+
+from flask import current_app, has_app_context
+from sqlalchemy import select, update, bindparam, table, column
+from sqlalchemy.types import TypeDecorator, Text
+
+# 压缩后的正文以BLOB存进原来的TEXT列，前两个字节标明编码方式；
+# 普通字符串（未压缩的旧数据、太短不值得压缩的正文）原样存储，两种数据可以在同一列中共存
+ZLIB_MAGIC = b'\x00z'
+ZSTD_MAGIC = b'\x00s'
+ZSTD_DICT_MAGIC = b'\x00d'
+
+
+class BodyCodec(object):
+
+    def __init__(self, method=None, min_bytes=256, zlib_level=6, zstd_level=3, zstd_dict=None):
+        self.method = method
+        self.min_bytes = min_bytes
+        self.zlib_level = zlib_level
+        self.zstd_level = zstd_level
+        self.zstd_dict = zstd_dict
+        self._zstd = None
+
+    # zstandard为可选依赖，第一次压缩或解压zstd正文时才导入并读取字典
+    def _zstd_state(self):
+        if self._zstd is None:
+            import zstandard
+            dict_data = None
+            if self.zstd_dict:
+                with open(self.zstd_dict, 'rb') as f:
+                    dict_data = zstandard.ZstdCompressionDict(f.read())
+                # 预先处理字典，之后每次创建压缩器不用重新分析字典
+                dict_data.precompute_compress(level=self.zstd_level)
+            self._zstd = (zstandard, dict_data)
+        return self._zstd
+
+    def encode(self, text):
+        if self.method is None or text is None:
+            return text
+        raw = text.encode('utf-8')
+        if len(raw) < self.min_bytes:
+            return text
+        if self.method == 'zlib':
+            data = ZLIB_MAGIC + zlib.compress(raw, self.zlib_level)
+        else:
+            zstandard, dict_data = self._zstd_state()
+            magic = ZSTD_MAGIC if dict_data is None else ZSTD_DICT_MAGIC
+            data = magic + zstandard.ZstdCompressor(level=self.zstd_level, dict_data=dict_data).compress(raw)
+        # 压缩后没有变小就保存原文
+        return data if len(data) < len(raw) else text
+
+    def decode(self, value):
+        if not isinstance(value, bytes):
+            return value
+        magic, data = value[:2], value[2:]
+        if magic == ZLIB_MAGIC:
+            return zlib.decompress(data).decode('utf-8')
+        if magic == ZSTD_MAGIC:
+            zstandard, _ = self._zstd_state()
+            return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+        if magic == ZSTD_DICT_MAGIC:
+            zstandard, dict_data = self._zstd_state()
+            if dict_data is None:
+                raise ValueError('body was compressed with a zstd dictionary, set BODY_ZSTD_DICT')
+            return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(data).decode('utf-8')
+        return value.decode('utf-8')
+
+
+# compress为False时得到只解压不压缩的编解码器，用于把正文转换回原文
+def codec_from_config(config, compress=True):
+    return BodyCodec(method=config['BODY_COMPRESSION'] if compress else None,
+                     min_bytes=config['BODY_COMPRESS_MIN_BYTES'], zlib_level=config['BODY_ZLIB_LEVEL'],
+                     zstd_level=config['BODY_ZSTD_LEVEL'], zstd_dict=config['BODY_ZSTD_DICT'])
+
+
+# 编解码器在第一次读写正文时按配置创建，保存在app.extensions中
+def get_body_codec():
+    codec = current_app.extensions.get('body_codec')
+    if codec is None:
+        codec = current_app.extensions['body_codec'] = codec_from_config(current_app.config)
+    return codec
+
+
+# 读出的压缩正文：保存原始字节，第一次转成字符串时（marshmallow的fields.Str序列化时会调用str()）才解压并缓存结果，
+# 列表查询读出的正文不被序列化就不用解压。其他字符串方法（encode、split等）转交给解压后的字符串
+class CompressedBody(object):
+    __slots__ = ('raw', '_codec', '_text')
+
+    def __init__(self, raw, codec=None):
+        self.raw = raw
+        self._codec = codec
+        self._text = None
+
+    def __str__(self):
+        if self._text is None:
+            codec = self._codec
+            if codec is None:
+                # 不在应用上下文中读出的正文，用不带配置的编解码器解压（用了zstd字典的正文需要应用上下文）
+                codec = get_body_codec() if has_app_context() else BodyCodec()
+            self._text = codec.decode(self.raw)
+            self._codec = None
+        return self._text
+
+    def __eq__(self, other):
+        if isinstance(other, CompressedBody):
+            other = str(other)
+        return str(self) == other
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __len__(self):
+        return len(str(self))
+
+    def __repr__(self):
+        return 'CompressedBody(%r)' % self.raw[:2]
+
+    def __getattr__(self, name):
+        return getattr(str(self), name)
+
+
+# 透明压缩的正文列：写入时按配置压缩，读取时根据前缀识别，压缩的正文返回CompressedBody，序列化时才解压。
+# 只在SQLite上压缩，其他数据库的TEXT列不能存二进制，原样读写；不在应用上下文中时也不压缩
+class CompressedText(TypeDecorator):
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, CompressedBody):
+            # 读出后原样写回的正文直接写原始字节，不用先解压再压缩
+            return value.raw if dialect.name == 'sqlite' else str(value)
+        if value is None or dialect.name != 'sqlite' or not has_app_context():
+            return value
+        return get_body_codec().encode(value)
+
+    def process_result_value(self, value, dialect):
+        if not isinstance(value, bytes):
+            return value
+        return CompressedBody(value, get_body_codec() if has_app_context() else None)
+
+
+# 按主键分块把已有的正文转换成codec的编码（codec.method为None时即全部解压回原文），
+# connection可以是连接或会话，每块执行完调用after_chunk（命令行中提交事务），返回改写的行数。迁移和flask body-compress共用。
+# 这里用不带类型的轻量表对象读写原始值，绕过CompressedText按应用配置做的编解码
+def convert_bodies(connection, codec, table_names=('article', 'comment'), batch_size=500, after_chunk=None):
+    converted = 0
+    for name in table_names:
+        raw = table(name, column('id'), column('body'))
+        last_id = 0
+        while True:
+            rows = connection.execute(select(raw.c.id, raw.c.body).where(raw.c.id > last_id)
+                                      .order_by(raw.c.id).limit(batch_size)).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            params = []
+            for row_id, value in rows:
+                encoded = codec.encode(codec.decode(value))
+                if encoded != value:
+                    params.append({'row_id': row_id, 'new_body': encoded})
+            if params:
+                connection.execute(update(raw).where(raw.c.id == bindparam('row_id'))
+                                   .values(body=bindparam('new_body')), params)
+                converted += len(params)
+            if after_chunk is not None:
+                after_chunk()
+    return converted
@@ -0,0 +1,244 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import RotatingFileHandler
+
+from flask import request, g
+from flask_login import current_user
+
+
+# 请求体只记录结构：字符串替换为{'$str': 长度}，数字、布尔值保留，回放时按结构生成同样大小的请求体，
+# 密码、正文等内容不会写进记录文件
+def body_shape(value):
+    if isinstance(value, dict):
+        return {key: body_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [body_shape(item) for item in value]
+    if isinstance(value, str):
+        return {'$str': len(value)}
+    return value
+
+
+# 按结构生成请求体，字符串以回放序号开头，标题、邮箱这类需要唯一的字段不会互相冲突
+def fill_shape(shape, seq):
+    if isinstance(shape, dict):
+        if set(shape) == {'$str'}:
+            prefix = 'r%d-' % seq
+            return (prefix + 'x' * shape['$str'])[:max(shape['$str'], len(prefix))]
+        return {key: fill_shape(item, seq) for key, item in shape.items()}
+    if isinstance(shape, list):
+        return [fill_shape(item, seq) for item in shape]
+    return shape
+
+
+# 按模板生成请求体：模板中字符串里的{seq}替换为回放序号
+def fill_template(template, seq):
+    if isinstance(template, dict):
+        return {key: fill_template(item, seq) for key, item in template.items()}
+    if isinstance(template, list):
+        return [fill_template(item, seq) for item in template]
+    if isinstance(template, str):
+        return template.replace('{seq}', str(seq))
+    return template
+
+
+# 按结构生成的请求体内容是随机的，登录这类需要有效数据的接口只会测到出错的分支。
+# 回放前创建count个已知密码的账号（已存在的跳过），返回{路由: 函数(seq, record) -> 请求体}，
+# 登录请求轮流使用这些账号。账号写入当前配置的数据库
+def seed_accounts(count, password, prefix='replay'):
+    from blog.estensions import db
+    from blog.models import User
+    emails = ['%s-%d@replay.invalid' % (prefix, i) for i in range(count)]
+    existing = {row[0] for row in db.session.query(User.email).filter(User.email.in_(emails)).all()}
+    for i, email in enumerate(emails):
+        if email not in existing:
+            user = User()
+            user.email = email
+            user.username = '%s-%d' % (prefix, i)
+            user.password = password
+            db.session.add(user)
+    db.session.commit()
+
+    def login_body(seq, record):
+        return {'user': {'email': emails[seq % len(emails)], 'password': password}}
+
+    return {'POST /api/users/login': login_body}
+
+
+# 从JSON文件读取调用方准备的请求体模板：{"POST /api/articles/<slug>/comments": {...}, ...}，
+# 返回{路由: 函数(seq, record) -> 请求体}
+def load_fixtures(path):
+    with open(path, encoding='utf-8') as f:
+        templates = json.load(f)
+    return {key: (lambda seq, record, template=template: fill_template(template, seq))
+            for key, template in templates.items()}
+
+
+def _capture_record(redact, started_at, elapsed, response):
+    record = {
+        'ts': round(started_at, 6),
+        'method': request.method,
+        'endpoint': request.endpoint,
+        'rule': request.url_rule.rule if request.url_rule else None,
+        'path': request.path,
+        'args': [[key, '' if key in redact else value] for key, value in request.args.items(multi=True)],
+        'user': current_user.get_id() if current_user.is_authenticated else None,
+        'status': response.status_code,
+        'ms': round(elapsed * 1000, 3),
+        'bytes': response.calculate_content_length(),
+    }
+    # 部分接口不要求Content-Type为application/json，有请求体就按JSON解析
+    if request.content_length:
+        body = request.get_json(force=True, silent=True)
+        if body is not None:
+            record['body'] = body_shape(body)
+    return record
+
+
+# CAPTURE_ENABLED时把请求的元数据（路由、路径、查询参数、用户id、状态码、耗时）按行写入JSONL文件，供flask capture-replay回放。
+# 不记录请求头、cookie和请求体的内容，CAPTURE_REDACT_ARGS中的查询参数只保留参数名；管理接口和流式响应不记录。
+# 每个进程写自己的文件（CAPTURE_FILE中的{pid}），达到CAPTURE_MAX_BYTES后轮转，保留CAPTURE_BACKUP_COUNT个旧文件
+def init_capture(app):
+    if not app.config['CAPTURE_ENABLED']:
+        return
+    config = app.config
+    path = (config['CAPTURE_FILE'] or os.path.join(app.instance_path, 'capture-{pid}.jsonl'))
+    redact = set(config['CAPTURE_REDACT_ARGS'])
+    sample_rate = config['CAPTURE_SAMPLE_RATE']
+    state = {'pid': None, 'handler': None}
+    lock = threading.Lock()
+
+    # 文件在第一次写入时才按当前进程号打开，在master中创建应用再fork的worker各写各的文件
+    def handler():
+        pid = os.getpid()
+        with lock:
+            if state['pid'] != pid:
+                filename = path.format(pid=pid)
+                directory = os.path.dirname(filename)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                state['handler'] = RotatingFileHandler(filename, maxBytes=config['CAPTURE_MAX_BYTES'],
+                                                       backupCount=config['CAPTURE_BACKUP_COUNT'], delay=True)
+                state['pid'] = pid
+            return state['handler']
+
+    @app.before_request
+    def start_capture():
+        if sample_rate >= 1 or random.random() < sample_rate:
+            g.capture_started = (time.time(), time.perf_counter())
+
+    @app.after_request
+    def write_capture(response):
+        started = g.pop('capture_started', None)
+        if started is None or response.is_streamed or (request.endpoint or '').startswith('admin.'):
+            return response
+        record = _capture_record(redact, started[0], time.perf_counter() - started[1], response)
+        line = logging.makeLogRecord({'msg': json.dumps(record, ensure_ascii=False, separators=(',', ':'))})
+        handler().handle(line)
+        return response
+
+
+def read_captures(paths):
+    records = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    records.sort(key=lambda record: record['ts'])
+    return records
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def latency_summary(samples):
+    samples = sorted(samples)
+    return {'count': len(samples), 'mean': round(sum(samples) / len(samples), 3) if samples else None,
+            'p50': percentile(samples, 0.5), 'p90': percentile(samples, 0.9), 'p99': percentile(samples, 0.99),
+            'max': samples[-1] if samples else None}
+
+
+def route_key(record):
+    return '%s %s' % (record['method'], record['rule'] or record['path'])
+
+
+# 回放记录：每条请求在(原始时间偏移 / speed)时刻由线程池发出，speed为0时不等待、尽快发出。
+# 请求以记录中的用户身份登录（写入flask_login的会话）。body_providers中有对应路由（route_key）的，
+# 请求体由提供者生成（见seed_accounts、load_fixtures），其余的按记录的结构生成。
+# 返回{路由: 耗时列表（毫秒）}、{路由: 5xx次数}和整体落后于计划的最大秒数
+def replay(app, records, speed=1.0, concurrency=8, body_providers=None):
+    body_providers = body_providers or {}
+
+    local = threading.local()
+
+    def client_for(user_id):
+        clients = getattr(local, 'clients', None)
+        if clients is None:
+            clients = local.clients = {}
+        client = clients.get(user_id)
+        if client is None:
+            client = clients[user_id] = app.test_client()
+            if user_id is not None:
+                with client.session_transaction() as session:
+                    session['_user_id'] = user_id
+                    session['_fresh'] = True
+        return client
+
+    latencies, errors, lag = {}, {}, [0.0]
+    lock = threading.Lock()
+
+    def send(seq, record, due):
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        behind = time.monotonic() - due
+        client = client_for(record.get('user'))
+        kwargs = {'method': record['method'], 'query_string': [tuple(pair) for pair in record.get('args', [])]}
+        key = route_key(record)
+        provider = body_providers.get(key)
+        if provider is not None:
+            kwargs['json'] = provider(seq, record)
+        elif 'body' in record:
+            kwargs['json'] = fill_shape(record['body'], seq)
+        started = time.perf_counter()
+        response = client.open(record['path'], **kwargs)
+        response.get_data()
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.setdefault(key, []).append(round(elapsed, 3))
+            if response.status_code >= 500:
+                errors[key] = errors.get(key, 0) + 1
+            lag[0] = max(lag[0], behind)
+
+    if not records:
+        return latencies, errors, 0.0
+    first = records[0]['ts']
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(send, seq, record,
+                                   start + ((record['ts'] - first) / speed if speed else 0))
+                   for seq, record in enumerate(records)]
+        for future in futures:
+            future.result()
+    return latencies, errors, lag[0]
+
+
+# 比较两次回放的结果：两边都至少有min_count个样本的路由，p50或p99变慢超过threshold（比例）记为退化
+def compare_results(base, new, threshold=0.1, min_count=20):
+    rows = []
+    for key in sorted(set(base['routes']) | set(new['routes'])):
+        before, after = base['routes'].get(key), new['routes'].get(key)
+        row = {'route': key, 'base': before, 'new': after, 'regressed': False}
+        if before and after and before['count'] >= min_count and after['count'] >= min_count:
+            for name in ('p50', 'p99'):
+                if before[name] and after[name] > before[name] * (1 + threshold):
+                    row['regressed'] = True
+        rows.append(row)
+    return rows
@@ -0,0 +1,84 @@
+import gzip
+
+from flask import request
+
+from blog.cache import LRUCache
+
+
+_brotli_module = False
+
+
+# brotli为可选依赖，第一次用到时才导入，没有安装时只提供gzip
+def _brotli():
+    global _brotli_module
+    if _brotli_module is False:
+        try:
+            import brotli
+        except ImportError:
+            brotli = None
+        _brotli_module = brotli
+    return _brotli_module
+
+
+def compress(data, encoding, gzip_level=6, br_quality=5):
+    if encoding == 'br':
+        return _brotli().compress(data, quality=br_quality)
+    # mtime固定为0，同样的内容压缩结果也相同
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+# 压缩后的表示与原始响应内容不同，ETag按编码加上后缀，缓存不会把gzip、br和未压缩的版本当成同一个表示
+def encoded_etag(etag, encoding):
+    return '%s-%s' % (etag, encoding)
+
+
+# 按Accept-Encoding选择编码：质量值最高的优先，相同时按COMPRESS_ALGORITHMS的顺序，没有安装brotli时不提供br
+def choose_encoding(accept_encodings, algorithms):
+    best, best_quality = None, 0
+    for encoding in algorithms:
+        if encoding == 'br' and _brotli() is None:
+            continue
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+# 响应压缩：对200的JSON响应按请求协商gzip/brotli压缩，小于COMPRESS_MIN_BYTES的不压缩。
+# 带ETag的响应（条件GET的接口）内容由ETag唯一确定，压缩结果按(路径, ETag, 编码)缓存复用，不必每次重新压缩；
+# 压缩后的响应ETag带上编码后缀，304响应同样带Vary: Accept-Encoding
+def init_compression(app):
+    if not app.config['COMPRESS_ENABLED']:
+        return
+    config = app.config
+    cache = app.extensions['compression_cache'] = LRUCache(maxsize=config['COMPRESS_CACHE_SIZE'],
+                                                           ttl=config['COMPRESS_CACHE_TTL'])
+
+    @app.after_request
+    def compress_response(response):
+        if response.status_code == 304 and response.get_etag()[0]:
+            response.vary.add('Accept-Encoding')
+            return response
+        if response.status_code != 200 or response.direct_passthrough or response.is_streamed \
+                or 'Content-Encoding' in response.headers \
+                or response.mimetype not in config['COMPRESS_MIMETYPES']:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings, config['COMPRESS_ALGORITHMS'])
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_BYTES']:
+            return response
+        etag, weak = response.get_etag()
+        key = (request.full_path, etag, encoding) if etag else None
+        compressed = cache.get(key) if key else None
+        if compressed is None:
+            compressed = compress(data, encoding, config['COMPRESS_GZIP_LEVEL'], config['COMPRESS_BR_QUALITY'])
+            if key:
+                cache.set(key, compressed)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            response.set_etag(encoded_etag(etag, encoding), weak)
+        return response
@@ -0,0 +1,73 @@
+import hashlib
+from datetime import timezone
+from functools import wraps
+
+from flask import request, make_response, current_app
+
+from blog.compression import encoded_etag
+
+
+def make_etag(parts):
+    return hashlib.sha1(repr(parts).encode('utf8')).hexdigest()
+
+
+def _utc(value):
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    # HTTP日期只精确到秒
+    return value.replace(microsecond=0)
+
+
+# 客户端缓存的可能是压缩后的表示，它的ETag带有编码后缀（见compression.encoded_etag），这些形式同样视为匹配
+def _matched_etag(etag):
+    if request.if_none_match.star_tag:
+        return etag
+    candidates = [etag]
+    if current_app.config['COMPRESS_ENABLED']:
+        candidates += [encoded_etag(etag, encoding) for encoding in current_app.config['COMPRESS_ALGORITHMS']]
+    for candidate in candidates:
+        if request.if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+# 客户端缓存仍然有效时返回304响应中应带的ETag，否则返回None
+def _not_modified(etag, last_modified):
+    # 同时带有两个条件头时以If-None-Match为准
+    if request.if_none_match:
+        return _matched_etag(etag)
+    if last_modified is not None and request.if_modified_since is not None \
+            and last_modified <= _utc(request.if_modified_since):
+        return etag
+    return None
+
+
+# 条件GET：先用version_func做一次廉价的版本查询，客户端缓存仍然有效时直接返回304，
+# 不再加载ORM对象也不做序列化；否则照常执行视图并在响应中附上ETag/Last-Modified。
+# version_func接收视图参数，返回(用于计算ETag的元组, Last-Modified时间或None)，资源不存在时返回None
+def conditional(version_func):
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            version = version_func(*args, **kwargs)
+            if version is None:
+                return f(*args, **kwargs)
+            parts, last_modified = version
+            etag = make_etag(parts)
+            last_modified = _utc(last_modified)
+            matched = _not_modified(etag, last_modified)
+            if matched is not None:
+                response = current_app.response_class(status=304)
+                response.set_etag(matched)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import Counter
+
+from flask import request, jsonify
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+from blog.estensions import db
+
+# 当前线程正在处理的请求的截止时间（time.monotonic()），不在请求中时为None
+_local = threading.local()
+# 每隔多少条SQLite虚拟机指令检查一次截止时间
+_check_ops = 1000
+
+
+def remaining():
+    deadline = getattr(_local, 'deadline', None)
+    return None if deadline is None else deadline - time.monotonic()
+
+
+# SQLite：每执行一定数量的虚拟机指令回调一次，返回非0即中断正在执行的语句（抛出interrupted错误）
+def _progress_handler():
+    deadline = getattr(_local, 'deadline', None)
+    return deadline is not None and time.monotonic() > deadline
+
+
+def _install_progress_handler(dbapi_connection, connection_record):
+    if hasattr(dbapi_connection, 'set_progress_handler'):
+        dbapi_connection.set_progress_handler(_progress_handler, _check_ops)
+
+
+# 其他数据库：每条语句执行前把剩余时间设置为语句超时。PostgreSQL用SET LOCAL，只在当前事务内有效；
+# MySQL不改会话变量（SET SESSION会留在连接上，连接回到连接池后下一个请求还带着这个超时），
+# 改为在SELECT上加语句级的MAX_EXECUTION_TIME提示，MySQL的执行超时本来也只对SELECT生效
+def _set_statement_timeout(conn, cursor, statement, parameters, context, executemany):
+    left = remaining()
+    if left is None:
+        return statement, parameters
+    timeout_ms = max(1, int(left * 1000))
+    dialect = conn.dialect.name
+    if dialect == 'postgresql':
+        cursor.execute('SET LOCAL statement_timeout = %d' % timeout_ms)
+    elif dialect == 'mysql':
+        stripped = statement.lstrip()
+        if stripped[:6].upper() == 'SELECT':
+            statement = 'SELECT /*+ MAX_EXECUTION_TIME(%d) */%s' % (timeout_ms, stripped[6:])
+    return statement, parameters
+
+
+def deadline_hits(app):
+    state = app.extensions.get('deadline_hits')
+    if state is None:
+        return {}
+    counter, lock = state
+    with lock:
+        return dict(counter)
+
+
+# REQUEST_DEADLINE_MS大于0时，每个请求的SQL语句只能在截止时间之前执行：SQLite用progress handler中断，
+# PostgreSQL/MySQL设置语句超时。超时的请求返回code 10010，并按端点计数
+def init_deadline(app):
+    budget = app.config['REQUEST_DEADLINE_MS'] / 1000.0
+    if budget <= 0:
+        return
+    global _check_ops
+    _check_ops = app.config['REQUEST_DEADLINE_CHECK_OPS']
+    app.extensions['deadline_hits'] = (Counter(), threading.Lock())
+    # 监听器挂在Engine类上，对之后创建的所有连接生效，同一进程创建多个应用时只注册一次
+    if not event.contains(Engine, 'connect', _install_progress_handler):
+        event.listen(Engine, 'connect', _install_progress_handler)
+        event.listen(Engine, 'before_cursor_execute', _set_statement_timeout, retval=True)
+
+    @app.before_request
+    def start_deadline():
+        _local.deadline = time.monotonic() + budget
+
+    @app.teardown_request
+    def clear_deadline(exc):
+        _local.deadline = None
+
+    @app.errorhandler(OperationalError)
+    def deadline_exceeded(e):
+        left = remaining()
+        if left is None or left > 0:
+            raise e
+        db.session.rollback()
+        counter, lock = app.extensions['deadline_hits']
+        with lock:
+            counter[request.endpoint or 'unknown'] += 1
+        ret_data = {"code": 10010,
+                    "errors": {
+                        "body": [
+                            "can't be empty"
+                        ]
+                    },
+                    "message": "deadline exceeded"
+                    }
+        return jsonify(ret_data)
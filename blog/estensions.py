@@ -1,19 +1,74 @@
+import os
+import sqlite3
+
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
 from flask_login import LoginManager
-from flask_mail import Mail
 from flask_jwt_extended import JWTManager
 
 db = SQLAlchemy()
-migrate = Migrate()
 login_manager = LoginManager()
-mail = Mail()
 jwt = JWTManager()
 
 
+# SQLite默认不检查外键，每个新连接都要打开foreign_keys，ON DELETE CASCADE才会生效
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+# 在master中创建应用再fork的worker会继承master连接池中的连接，两个进程共用一个连接会互相破坏状态。
+# 连接记录创建它的进程，其他进程取出时作废，连接池丢弃它并新建一个连接
+@event.listens_for(Engine, 'connect')
+def record_connection_pid(dbapi_connection, connection_record):
+    connection_record.info['pid'] = os.getpid()
+
+
+@event.listens_for(Engine, 'checkout')
+def check_connection_pid(dbapi_connection, connection_record, connection_proxy):
+    pid = os.getpid()
+    if connection_record.info['pid'] != pid:
+        connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+        raise exc.DisconnectionError('connection record belongs to pid %s, attempting to check out in pid %s'
+                                     % (connection_record.info['pid'], pid))
+
+
 # 用户加载函数
 @login_manager.user_loader
 def load_user(user_id):
     from blog.models import User
     user = User.query.get(int(user_id))
     return user
+
+
+# API请求的会话在commit之后不让已加载的对象过期：视图提交后还要读取刚写入的对象生成响应，
+# 默认的expire_on_commit会让每个对象再执行一次SELECT重新加载。会话在请求结束时被移除，对象不会跨请求保留旧数据；
+# 用核心语句修改数据的地方（run_write）自己负责expire_all
+def init_session_profile(app):
+    if app.config['SESSION_EXPIRE_ON_COMMIT']:
+        return
+
+    @app.before_request
+    def disable_expire_on_commit():
+        db.session().expire_on_commit = False
+
+
+# 迁移和发信扩展按需导入、初始化，避免拖慢worker和命令行任务的冷启动
+def init_migrate(app):
+    from flask_migrate import Migrate
+    migrate = Migrate()
+    migrate.init_app(app, db)
+    return migrate
+
+
+def get_mail():
+    from flask_mail import Mail
+    state = current_app.extensions.get('mail')
+    if state is None:
+        state = Mail().init_app(current_app)
+    return state
@@ -0,0 +1,176 @@
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, func, delete
+
+from blog.estensions import db
+from blog.models import EventLog, Follow
+from blog.signals import comment_posted, article_published
+
+logger = logging.getLogger(__name__)
+
+# ASGI入口在environ中放入这个键，事件流接口把(频道, Last-Event-ID)写回这里，由事件循环推送事件
+EVENT_STREAM_KEY = 'blog.event_stream'
+
+
+# 进程内的发布/订阅中心。事件先写入event_log表，再由本进程的轮询线程读出后分发给订阅者的队列，
+# 这样同一事件在所有gunicorn worker中都能收到，且各进程看到的顺序一致（按event_log的id）。
+# 轮询线程在第一个订阅者出现时才启动，没有推送连接的worker不会轮询数据库
+class EventHub(object):
+
+    def __init__(self, app):
+        self.app = app
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.last_id = 0
+
+    def subscribe(self, channels):
+        q = queue.Queue(maxsize=self.app.config['SSE_QUEUE_SIZE'])
+        with self._lock:
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add(q)
+            if self._thread is None:
+                self.last_id = db.session.query(func.max(EventLog.id)).scalar() or 0
+                self._thread = threading.Thread(target=self._poll, name='event-hub', daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, q, channels):
+        with self._lock:
+            for channel in channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(q)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def dispatch(self, event_id, channel, payload):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for q in subscribers:
+            try:
+                q.put_nowait((event_id, payload))
+            except queue.Full:
+                # 客户端读得太慢，丢弃事件，客户端可以凭Last-Event-ID重连补齐
+                pass
+
+    def _poll(self):
+        config = self.app.config
+        pruned_at = time.monotonic()
+        while True:
+            time.sleep(config['SSE_POLL_INTERVAL'])
+            with self.app.app_context():
+                try:
+                    rows = db.session.execute(select(EventLog.id, EventLog.channel, EventLog.payload)
+                                              .where(EventLog.id > self.last_id)
+                                              .order_by(EventLog.id).limit(1000)).all()
+                    for event_id, channel, payload in rows:
+                        self.dispatch(event_id, channel, payload)
+                        self.last_id = event_id
+                    if time.monotonic() - pruned_at > config['SSE_PRUNE_INTERVAL']:
+                        prune_events()
+                        pruned_at = time.monotonic()
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('event hub poll failed')
+
+
+def get_event_hub():
+    hub = current_app.extensions.get('event_hub')
+    if hub is None:
+        hub = current_app.extensions['event_hub'] = EventHub(current_app._get_current_object())
+    return hub
+
+
+def publish(channel, event, data):
+    db.session.add(EventLog(channel=channel, payload=json.dumps({'event': event, 'data': data})))
+    db.session.commit()
+
+
+def prune_events():
+    before = datetime.utcnow() - timedelta(seconds=current_app.config['SSE_EVENT_TTL'])
+    db.session.execute(delete(EventLog).where(EventLog.createdAt < before))
+
+
+# 读取断线期间错过的事件（id大于Last-Event-ID），只能补齐还没有被清除的事件
+def missed_events(channels, last_event_id):
+    rows = db.session.execute(select(EventLog.id, EventLog.payload)
+                              .where(EventLog.id > last_event_id, EventLog.channel.in_(channels))
+                              .order_by(EventLog.id).limit(current_app.config['SSE_QUEUE_SIZE'])).all()
+    return [(row[0], row[1]) for row in rows]
+
+
+def feed_channels(user_id):
+    rows = db.session.query(Follow.followed_id).filter(Follow.follower_id == user_id).all()
+    return ['author:%d' % row[0] for row in rows]
+
+
+def format_event(event_id, payload):
+    message = json.loads(payload)
+    return 'id: %d\nevent: %s\ndata: %s\n\n' % (event_id, message['event'], json.dumps(message['data']))
+
+
+# SSE响应体：先补发错过的事件，然后阻塞等待新事件，空闲时定期发送注释行保活。
+# 连接最多保持SSE_MAX_STREAM秒后关闭，由客户端带着Last-Event-ID自动重连，避免长期占用worker线程。
+# 生成器不访问数据库，也不需要请求上下文。返回(生成器, 取消订阅的函数)，
+# 客户端在生成器开始执行前就断开时finally不会执行，取消订阅要注册到响应的call_on_close上
+def event_stream(hub, channels, last_event_id=None):
+    config = current_app.config
+    keepalive, max_stream = config['SSE_KEEPALIVE'], config['SSE_MAX_STREAM']
+    q = hub.subscribe(channels)
+    # 先订阅再补发，避免两者之间发布的事件丢失；重复的事件按id跳过
+    missed = missed_events(channels, last_event_id) if last_event_id is not None else []
+    db.session.close()
+
+    def close():
+        hub.unsubscribe(q, channels)
+
+    def generate():
+        last_sent = last_event_id or 0
+        deadline = time.monotonic() + max_stream
+        try:
+            yield 'retry: %d\n\n' % config['SSE_RETRY_MS']
+            for event_id, payload in missed:
+                last_sent = event_id
+                yield format_event(event_id, payload)
+            while True:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return
+                try:
+                    event_id, payload = q.get(timeout=min(keepalive, left))
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if event_id <= last_sent:
+                    continue
+                last_sent = event_id
+                yield format_event(event_id, payload)
+        finally:
+            close()
+
+    return generate(), close
+
+
+@comment_posted.connect
+def on_comment_posted(sender, comment, **kwargs):
+    if current_app.config['SSE_ENABLED']:
+        publish('article:%d' % comment.article_id, 'comment', {
+            'id': comment.id, 'body': comment.body, 'createAt': comment.createAt.isoformat(),
+            'author': sender.username})
+
+
+@article_published.connect
+def on_article_published(sender, article, **kwargs):
+    if current_app.config['SSE_ENABLED']:
+        publish('author:%d' % article.author_id, 'article', {
+            'slug': article.slug, 'title': article.title, 'description': article.description,
+            'tagList': [tag.name for tag in article.tagList], 'createdAt': article.createdAt.isoformat(),
+            'author': sender.username})
@@ -0,0 +1,160 @@
+import threading
+import time
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import select, func
+
+from blog.estensions import db
+from blog.models import Follow, Collect, Article
+from blog.signals import user_followed, user_unfollowed
+
+
+# 关注关系的压缩稀疏行（CSR）邻接表：用户u关注的人为 indices[indptr[u]:indptr[u + 1]]。
+# 关注/取消关注先记在增量集合里，查询时叠加到CSR上，增量积累到一定数量再合并重建数组
+class FollowGraph(object):
+
+    def __init__(self, max_delta=10000):
+        self.max_delta = max_delta
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.empty(0, dtype=np.int64)
+        self.built_at = None
+        self._added = {}
+        self._removed = {}
+        self._delta = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_edges(cls, followers, followed, **kwargs):
+        graph = cls(**kwargs)
+        graph._build(np.asarray(followers, dtype=np.int64), np.asarray(followed, dtype=np.int64))
+        return graph
+
+    def load(self):
+        rows = db.session.execute(select(Follow.follower_id, Follow.followed_id)).all()
+        followers = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        followed = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+        with self._lock:
+            self._build(followers, followed)
+
+    def _build(self, followers, followed):
+        order = np.lexsort((followed, followers))
+        followers, followed = followers[order], followed[order]
+        size = int(max(followers.max(initial=-1), followed.max(initial=-1))) + 2
+        self.indptr = np.zeros(size, dtype=np.int64)
+        np.cumsum(np.bincount(followers, minlength=size - 1), out=self.indptr[1:])
+        self.indices = followed
+        self.built_at = time.monotonic()
+        self._added, self._removed, self._delta = {}, {}, 0
+
+    def _base(self, user_id):
+        if user_id + 1 >= len(self.indptr):
+            return self.indices[:0]
+        return self.indices[self.indptr[user_id]:self.indptr[user_id + 1]]
+
+    def add_edge(self, follower_id, followed_id):
+        with self._lock:
+            self._removed.get(follower_id, set()).discard(followed_id)
+            self._added.setdefault(follower_id, set()).add(followed_id)
+            self._after_change()
+
+    def remove_edge(self, follower_id, followed_id):
+        with self._lock:
+            self._added.get(follower_id, set()).discard(followed_id)
+            self._removed.setdefault(follower_id, set()).add(followed_id)
+            self._after_change()
+
+    def _after_change(self):
+        self._delta += 1
+        if self._delta >= self.max_delta:
+            self._merge()
+
+    # 把增量合并进CSR数组：有变化的用户整行替换，其余的边原样保留
+    def _merge(self):
+        counts = np.diff(self.indptr)
+        followers = np.repeat(np.arange(len(counts), dtype=np.int64), counts)
+        changed = sorted(set(self._added) | set(self._removed))
+        keep = ~np.isin(followers, changed)
+        sources, targets = [followers[keep]], [self.indices[keep]]
+        for user_id in changed:
+            neighbors = self._neighbors(user_id)
+            sources.append(np.full(len(neighbors), user_id, dtype=np.int64))
+            targets.append(neighbors)
+        self._build(np.concatenate(sources), np.concatenate(targets))
+
+    # 批量取出多个用户在CSR中的邻居，不逐个切片
+    def _gather(self, nodes):
+        starts, ends = self.indptr[nodes], self.indptr[nodes + 1]
+        lengths = ends - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self.indices[offsets + np.arange(lengths.sum())]
+
+    def _neighbors(self, user_id):
+        base = self._base(user_id)
+        removed = self._removed.get(user_id)
+        if removed:
+            base = base[~np.isin(base, list(removed))]
+        added = self._added.get(user_id)
+        if added:
+            base = np.union1d(base, np.fromiter(added, dtype=np.int64))
+        return base
+
+    def neighbors(self, user_id):
+        with self._lock:
+            return self._neighbors(user_id)
+
+    # 二度关系：统计“我关注的人”关注的人，按出现次数排序，排除自己和已关注的人
+    def friends_of_friends(self, user_id):
+        with self._lock:
+            direct = self._neighbors(user_id)
+            changed = set(self._added) | set(self._removed)
+            # 有增量的用户单独叠加，其余用户直接从CSR数组中批量取出
+            overlay = [v for v in direct.tolist() if v in changed]
+            base = direct[~np.isin(direct, overlay) & (direct + 1 < len(self.indptr))]
+            hops = [self._gather(base)] + [self._neighbors(v) for v in overlay]
+        candidates = np.concatenate(hops)
+        candidates = candidates[(candidates != user_id) & ~np.isin(candidates, direct)]
+        return np.unique(candidates, return_counts=True)
+
+
+# 图在第一次请求推荐时才创建和加载（同时导入numpy），之后超过FOLLOW_GRAPH_TTL秒从数据库重建一次，
+# 以吸收其他worker进程中的关注变化
+def get_follow_graph():
+    graph = current_app.extensions.get('follow_graph')
+    if graph is None:
+        graph = FollowGraph(max_delta=current_app.config['FOLLOW_GRAPH_MAX_DELTA'])
+        current_app.extensions['follow_graph'] = graph
+    if graph.built_at is None or time.monotonic() - graph.built_at > current_app.config['FOLLOW_GRAPH_TTL']:
+        graph.load()
+    return graph
+
+
+# 推荐关注：二度好友按共同关注数计分，再加上当前用户收藏过的文章的作者，返回[(用户id, 分数)]
+def suggest_follows(user_id, limit=10):
+    config = current_app.config
+    graph = get_follow_graph()
+    ids, counts = graph.friends_of_friends(user_id)
+    scores = dict(zip(ids.tolist(), (counts * config['SUGGEST_FOF_WEIGHT']).tolist()))
+    direct = set(graph.neighbors(user_id).tolist())
+    rows = db.session.query(Article.author_id, func.count()) \
+        .join(Collect, Collect.collected_id == Article.id) \
+        .filter(Collect.collector_id == user_id).group_by(Article.author_id).all()
+    for author_id, count in rows:
+        if author_id is None or author_id == user_id or author_id in direct:
+            continue
+        scores[author_id] = scores.get(author_id, 0) + count * config['SUGGEST_FAVORITE_WEIGHT']
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+@user_followed.connect
+def on_user_followed(sender, user, **kwargs):
+    graph = current_app.extensions.get('follow_graph')
+    if graph is not None and graph.built_at is not None:
+        graph.add_edge(sender.id, user.id)
+
+
+@user_unfollowed.connect
+def on_user_unfollowed(sender, user, **kwargs):
+    graph = current_app.extensions.get('follow_graph')
+    if graph is not None and graph.built_at is not None:
+        graph.remove_edge(sender.id, user.id)
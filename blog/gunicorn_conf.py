@@ -0,0 +1,26 @@
+# gunicorn配置，生产环境的启动方式: gunicorn -c blog/gunicorn_conf.py blog.wsgi:app
+# 绑定地址、worker数、每个worker的线程数从环境变量GUNICORN_BIND、GUNICORN_WORKERS、GUNICORN_THREADS读取
+import os
+
+bind = os.getenv('GUNICORN_BIND', '127.0.0.1:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', os.cpu_count() or 2))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+# 必须预加载：blog.wsgi在master中创建应用并gc.freeze，定时任务登记后等fork之后由post_fork启动
+preload_app = True
+
+
+# 在master中给即将fork的worker分配编号，被替换的worker沿用空出来的最小编号；0号worker负责运行共享的定时任务
+def pre_fork(server, worker):
+    used = {getattr(other, 'index', None) for other in server.WORKERS.values()}
+    worker.index = next(index for index in range(len(used) + 1) if index not in used)
+
+
+# master中的连接池不能跨进程共用，worker丢掉继承来的连接，之后各自建立；再启动登记的定时任务
+def post_fork(server, worker):
+    from blog.estensions import db
+    from blog.scheduler import start_deferred
+    from blog.wsgi import app
+    with app.app_context():
+        db.engine.dispose()
+    start_deferred(primary=worker.index == 0)
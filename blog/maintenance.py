@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+import time
+
+from flask import current_app, request_started, request_tearing_down
+from sqlalchemy import text
+
+from blog.estensions import db
+from blog.scheduler import start_periodic
+
+logger = logging.getLogger(__name__)
+
+
+def _pragma(conn, statement):
+    result = conn.execute(text('PRAGMA ' + statement))
+    return result.fetchall() if result.returns_rows else []
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+# 更新查询规划器的统计信息。默认用PRAGMA optimize，只分析统计信息可能已经过时的表，
+# analysis_limit限制每个索引最多扫描的行数，大表上也只做有限的工作；full为True时对整个库执行ANALYZE
+def _analyze(conn, full, analysis_limit):
+    if analysis_limit:
+        _pragma(conn, 'analysis_limit=%d' % analysis_limit)
+    if full:
+        conn.execute(text('ANALYZE'))
+    else:
+        _pragma(conn, 'optimize')
+    return {}
+
+
+# WAL检查点：PASSIVE不等待读写者，只回写能回写的部分；WAL文件超过truncate_bytes时改用TRUNCATE，
+# 等读者结束后把WAL截断为0。不是WAL模式的库跳过
+def _checkpoint(conn, path, mode, truncate_bytes):
+    if _pragma(conn, 'journal_mode')[0][0].lower() != 'wal':
+        return {'skipped': 'journal_mode is not wal'}
+    wal_before = _file_size(path + '-wal')
+    if truncate_bytes and wal_before > truncate_bytes:
+        mode = 'TRUNCATE'
+    busy, log_frames, checkpointed = _pragma(conn, 'wal_checkpoint(%s)' % mode)[0]
+    return {'mode': mode, 'busy': bool(busy), 'logFrames': log_frames, 'checkpointedFrames': checkpointed,
+            'walBytesBefore': wal_before, 'walBytesAfter': _file_size(path + '-wal')}
+
+
+# 增量回收空闲页：每次最多回收max_pages页，避免一次占用写锁太久。
+# 只有auto_vacuum=INCREMENTAL的库才能增量回收，已有的库需要先执行一次flask db-maintenance --enable-incremental-vacuum
+def _incremental_vacuum(conn, max_pages):
+    if _pragma(conn, 'auto_vacuum')[0][0] != 2:
+        return {'skipped': 'auto_vacuum is not incremental'}
+    page_size = _pragma(conn, 'page_size')[0][0]
+    free_before = _pragma(conn, 'freelist_count')[0][0]
+    # incremental_vacuum每执行一步只释放一页，sqlite3模块执行没有结果列的语句时只走一步，
+    # 用executescript让它执行到底
+    conn.connection.executescript('PRAGMA incremental_vacuum(%d);' % max_pages)
+    free_after = _pragma(conn, 'freelist_count')[0][0]
+    return {'freePagesBefore': free_before, 'freePagesAfter': free_after,
+            'reclaimedBytes': (free_before - free_after) * page_size}
+
+
+# 执行一轮SQLite维护，返回各步骤的耗时（毫秒）、结果，以及数据库文件回收的字节数。
+# steps为要执行的步骤，默认依次执行analyze、vacuum、checkpoint（WAL模式下回收的页面经检查点写回后文件才变小），
+# 其余参数默认取MAINTENANCE_*配置。
+# 维护语句在单独的自动提交连接上执行，不影响当前请求的会话
+def run_maintenance(steps=None, full_analyze=False, checkpoint_mode=None, vacuum_pages=None):
+    config = current_app.config
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return {'skipped': 'not a sqlite database'}
+    steps = steps or ('analyze', 'vacuum', 'checkpoint')
+    path = engine.url.database
+    report = {'steps': {}}
+    started = time.perf_counter()
+    size_before = _file_size(path)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for step in steps:
+            step_started = time.perf_counter()
+            if step == 'analyze':
+                result = _analyze(conn, full_analyze, config['MAINTENANCE_ANALYSIS_LIMIT'])
+            elif step == 'checkpoint':
+                result = _checkpoint(conn, path, checkpoint_mode or config['MAINTENANCE_CHECKPOINT_MODE'],
+                                     config['MAINTENANCE_WAL_TRUNCATE_BYTES'])
+            elif step == 'vacuum':
+                result = _incremental_vacuum(conn, vacuum_pages or config['MAINTENANCE_VACUUM_PAGES'])
+            else:
+                raise ValueError('unknown maintenance step: %s' % step)
+            result['ms'] = round((time.perf_counter() - step_started) * 1000, 2)
+            report['steps'][step] = result
+    report['ms'] = round((time.perf_counter() - started) * 1000, 2)
+    report['dbBytesBefore'] = size_before
+    report['dbBytesAfter'] = _file_size(path)
+    report['reclaimedBytes'] = size_before - report['dbBytesAfter']
+    report['finishedAt'] = time.time()
+    logger.info('sqlite maintenance: %.1fms, reclaimed %d bytes, %s', report['ms'], report['reclaimedBytes'],
+                ', '.join('%s %.1fms' % (step, result['ms']) for step, result in report['steps'].items()))
+    current_app.extensions['maintenance_last'] = report
+    return report
+
+
+# 把已有的库切换为auto_vacuum=INCREMENTAL。切换后要VACUUM重建整个库，耗时与库的大小成正比并独占写锁，
+# 只应在停机窗口中执行一次
+def enable_incremental_vacuum():
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        _pragma(conn, 'auto_vacuum=INCREMENTAL')
+        conn.execute(text('VACUUM'))
+        return _pragma(conn, 'auto_vacuum')[0][0] == 2
+
+
+def last_maintenance(app):
+    return app.extensions.get('maintenance_last')
+
+
+# 后台维护：每隔MAINTENANCE_CHECK_INTERVAL秒检查一次，距离上次维护超过MAINTENANCE_INTERVAL秒、
+# 当前worker没有正在处理的请求并且已经空闲MAINTENANCE_IDLE_SECONDS秒时才执行，否则推迟到下一次检查。
+# 用blog.prefork或gunicorn（blog/gunicorn_conf.py）启动时只有0号worker运行维护，以它的空闲状态代表整体的负载
+def init_maintenance(app):
+    if not app.config['MAINTENANCE_INTERVAL']:
+        return
+    state = {'active': 0, 'last_request': time.monotonic(), 'last_run': time.monotonic()}
+    lock = threading.Lock()
+
+    # 用信号而不是before_request计数：其他before_request函数（例如限流）直接返回响应时，后面的函数不会执行，
+    # 而request_tearing_down总会发出
+    def track_request_start(sender, **kwargs):
+        with lock:
+            state['active'] += 1
+
+    def track_request_end(sender, **kwargs):
+        with lock:
+            state['active'] -= 1
+            state['last_request'] = time.monotonic()
+
+    request_started.connect(track_request_start, app, weak=False)
+    request_tearing_down.connect(track_request_end, app, weak=False)
+
+    def maybe_run():
+        now = time.monotonic()
+        with lock:
+            idle = state['active'] == 0 and now - state['last_request'] >= app.config['MAINTENANCE_IDLE_SECONDS']
+        if not idle or now - state['last_run'] < app.config['MAINTENANCE_INTERVAL']:
+            return
+        state['last_run'] = now
+        run_maintenance()
+
+    start_periodic(app, 'sqlite-maintenance', app.config['MAINTENANCE_CHECK_INTERVAL'], maybe_run)
@@ -0,0 +1,161 @@
+import gc
+import logging
+import threading
+import tracemalloc
+
+from flask import request, request_started, request_finished, request_tearing_down
+
+from blog.estensions import db
+from blog.scheduler import start_periodic
+
+logger = logging.getLogger(__name__)
+
+# 统计分配位置时排除tracemalloc、本模块自身和导入机制的分配
+_IGNORED = (tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+            tracemalloc.Filter(False, '<unknown>'))
+
+
+class EndpointMemory(object):
+    __slots__ = ('count', 'peak_max', 'peak_total', 'net_total', 'net_max', 'identity_max')
+
+    def __init__(self):
+        self.count = 0
+        self.peak_max = 0
+        self.peak_total = 0
+        self.net_total = 0
+        self.net_max = 0
+        self.identity_max = 0
+
+    def add(self, peak, net, identity):
+        self.count += 1
+        self.peak_max = max(self.peak_max, peak)
+        self.peak_total += peak
+        self.net_total += net
+        self.net_max = max(self.net_max, net)
+        self.identity_max = max(self.identity_max, identity)
+
+    def as_dict(self):
+        return {'count': self.count, 'peakMax': self.peak_max, 'peakMean': self.peak_total // max(self.count, 1),
+                'netTotal': self.net_total, 'netMax': self.net_max, 'identityMapMax': self.identity_max}
+
+
+# 与基线快照相比增长最多的分配位置，返回[{'site': 文件:行号, 'sizeDiff', 'size', 'countDiff'}]
+def top_sites(baseline, limit=20):
+    snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+    if baseline is None:
+        stats = snapshot.statistics('lineno')
+        return [{'site': str(stat.traceback[0]), 'size': stat.size, 'count': stat.count}
+                for stat in stats[:limit]]
+    stats = snapshot.compare_to(baseline, 'lineno')
+    return [{'site': str(stat.traceback[0]), 'sizeDiff': stat.size_diff, 'size': stat.size,
+             'countDiff': stat.count_diff} for stat in stats[:limit]]
+
+
+def memory_report(app, limit=None, reset_baseline=False):
+    state = app.extensions.get('memtrack')
+    if state is None:
+        return None
+    with state['lock']:
+        endpoints = {endpoint: stats.as_dict() for endpoint, stats in state['endpoints'].items()}
+    current, peak = tracemalloc.get_traced_memory()
+    report = {'traced': current, 'endpoints': endpoints,
+              'topSites': top_sites(state['baseline'], limit or app.config['MEMTRACK_TOP'])}
+    if reset_baseline:
+        state['baseline'] = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+    return report
+
+
+# MEMTRACK_ENABLED时用tracemalloc记录每个请求的峰值分配（请求期间的最高占用减去开始时的占用）和净增长
+# （请求结束时减去开始时，持续为正的端点可能有泄漏），以及会话identity map中的对象数，按端点汇总。
+# tracemalloc的计数是整个进程的，为了把分配准确地算到端点上，开启后请求串行执行，只应在排查内存时临时开启。
+# 应用启动后第一个请求开始前保存基线快照，/api/admin/memory和MEMTRACK_LOG_INTERVAL的定时日志列出相对基线增长最多的分配位置
+def init_memtrack(app):
+    if not app.config['MEMTRACK_ENABLED']:
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(app.config['MEMTRACK_FRAMES'])
+    state = app.extensions['memtrack'] = {'lock': threading.Lock(), 'serial': threading.Lock(),
+                                          'endpoints': {}, 'baseline': None}
+    local = threading.local()
+
+    def track_start(sender, **kwargs):
+        state['serial'].acquire()
+        local.held = True
+        if state['baseline'] is None:
+            state['baseline'] = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        tracemalloc.reset_peak()
+        local.started = tracemalloc.get_traced_memory()[0]
+
+    def release(sender, **kwargs):
+        if getattr(local, 'held', False):
+            local.held = False
+            state['serial'].release()
+
+    def track_end(sender, **kwargs):
+        try:
+            current, peak = tracemalloc.get_traced_memory()
+            identity = len(db.session.identity_map) if db.session.registry.has() else 0
+            endpoint = request.endpoint or 'unknown'
+            with state['lock']:
+                stats = state['endpoints'].get(endpoint)
+                if stats is None:
+                    stats = state['endpoints'][endpoint] = EndpointMemory()
+                stats.add(peak - local.started, current - local.started, identity)
+        finally:
+            release(sender)
+
+    request_started.connect(track_start, app, weak=False)
+    # request_finished在生成响应之后发出，出错转成500响应时也会发出；流式响应的内容在这之后才生成，不计入。
+    # 万一没有发出，请求结束时的request_tearing_down保证释放串行锁
+    request_finished.connect(track_end, app, weak=False)
+    request_tearing_down.connect(release, app, weak=False)
+
+    def log_report():
+        report = memory_report(app, limit=10)
+        for endpoint, stats in sorted(report['endpoints'].items(), key=lambda item: -item[1]['netTotal'])[:10]:
+            logger.info('memory %s: %s', endpoint, stats)
+        for site in report['topSites']:
+            logger.info('memory site %s', site)
+
+    if app.config['MEMTRACK_LOG_INTERVAL']:
+        start_periodic(app, 'memtrack-log', app.config['MEMTRACK_LOG_INTERVAL'], log_report, per_process=True)
+
+
+# 测试辅助函数：用测试客户端请求path，先预热warmup次，再测量repeat次，断言单次请求的峰值分配不超过max_peak、
+# 平均每次的净增长（两次gc之间）不超过max_net（字节）。超出时抛出AssertionError并列出增长最多的分配位置。
+# kwargs原样传给client.open，例如method='POST', json={...}；返回(峰值, 平均净增长)
+def assert_memory_bound(client, path, max_peak=None, max_net=None, repeat=20, warmup=3, **kwargs):
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(10)
+    try:
+        for _ in range(warmup):
+            client.open(path, **kwargs).close()
+        gc.collect()
+        baseline = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        before = tracemalloc.get_traced_memory()[0]
+        peak = 0
+        for _ in range(repeat):
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+            client.open(path, **kwargs).close()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - start)
+        gc.collect()
+        net = (tracemalloc.get_traced_memory()[0] - before) / float(repeat)
+        failures = []
+        if max_peak is not None and peak > max_peak:
+            failures.append('peak %d bytes > %d' % (peak, max_peak))
+        if max_net is not None and net > max_net:
+            failures.append('net %.0f bytes/request > %d' % (net, max_net))
+        if failures:
+            sites = '\n'.join('  %(site)s: %(sizeDiff)+d bytes (%(countDiff)+d blocks)' % site
+                              for site in top_sites(baseline, 10))
+            raise AssertionError('%s %s: %s\ntop allocation sites:\n%s' % (
+                kwargs.get('method', 'GET'), path, ', '.join(failures), sites))
+        return peak, net
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
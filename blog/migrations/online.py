@@ -0,0 +1,173 @@
+# 在线迁移的辅助函数，供versions中的迁移脚本导入。
+# 改列名、拆列这类变更按“扩展-迁移-收缩”分步进行，每一步都不长时间锁表：
+# 扩展：add_column加新列（SQLite上ADD COLUMN只改表结构，不重写数据），create_dual_write让新旧两列互相同步；
+# 迁移：backfill按主键范围分块把旧数据复制到新列，每块单独提交，块之间让出写锁，中断后重新运行从检查点继续；
+# 收缩：等所有应用实例都只读写新列之后，在后续的版本中drop_dual_write、drop_column。
+import logging
+import time
+
+import sqlalchemy as sa
+from alembic import op
+from flask import current_app
+
+logger = logging.getLogger('alembic.online')
+
+# 分块回填的检查点表，每个进行中的回填一行：下一块从last_id之后开始，max_id为回填开始时的最大主键，
+# 之后插入的行由双写触发器负责。所有回填完成后删除这张表，不会出现在自动生成的迁移中
+CHECKPOINT_TABLE = 'alembic_backfill'
+_checkpoints = sa.table(CHECKPOINT_TABLE, sa.column('name'), sa.column('last_id'), sa.column('max_id'))
+
+
+def has_column(table_name, column_name):
+    return column_name in {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table_name)}
+
+
+def _indexed(table_name, column_name):
+    inspector = sa.inspect(op.get_bind())
+    constraints = inspector.get_indexes(table_name) + inspector.get_unique_constraints(table_name) \
+        + inspector.get_foreign_keys(table_name)
+    return any(column_name in constraint.get('column_names', constraint.get('constrained_columns', []))
+               for constraint in constraints)
+
+
+# 加列，列已存在时跳过，重复运行中断过的迁移不会出错。
+# SQLite上可空或带默认值的列直接ALTER TABLE ADD COLUMN；不可空又没有默认值的列只能重建表
+def add_column(table_name, column):
+    if has_column(table_name, column.name):
+        return
+    if op.get_bind().dialect.name == 'sqlite' and not column.nullable and column.server_default is None:
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.add_column(column)
+    else:
+        op.add_column(table_name, column)
+
+
+# 删列，列不存在时跳过。SQLite 3.35起支持DROP COLUMN，不必重建表、复制索引；
+# 列上有索引、唯一约束或外键时SQLite不允许直接删除，退回batch模式重建表
+def drop_column(table_name, column_name):
+    if not has_column(table_name, column_name):
+        return
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite' and (bind.dialect.dbapi.sqlite_version_info < (3, 35, 0)
+                                          or _indexed(table_name, column_name)):
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.drop_column(column_name)
+    else:
+        op.drop_column(table_name, column_name)
+
+
+def _trigger_names(table_name, source, target):
+    prefix = 'dual_write_%s_%s_%s' % (table_name, source, target)
+    return prefix + '_insert', prefix + '_update'
+
+
+# 双写：在source列上建触发器，插入或更新source时同步写入target，新旧版本的应用同时在线时两列保持一致。
+# 改列名时两个方向各建一次。插入时只在target为空时复制，避免双向的触发器互相覆盖；更新时只在source变化时复制。
+# SQLite用AFTER触发器再UPDATE一次这一行，SQLite默认不允许触发器递归，两个方向的触发器最多各执行一次；
+# PostgreSQL、MySQL用BEFORE触发器直接改写NEW，不产生额外的UPDATE
+def create_dual_write(table_name, source, target, pk='id'):
+    bind = op.get_bind()
+    quote = bind.dialect.identifier_preparer.quote
+    insert_name, update_name = _trigger_names(table_name, source, target)
+    names = dict(table=quote(table_name), source=quote(source), target=quote(target), pk=quote(pk),
+                 insert=quote(insert_name), update=quote(update_name))
+    dialect = bind.dialect.name
+    if dialect == 'sqlite':
+        op.execute('CREATE TRIGGER IF NOT EXISTS {insert} AFTER INSERT ON {table} FOR EACH ROW '
+                   'WHEN NEW.{source} IS NOT NULL AND NEW.{target} IS NULL BEGIN '
+                   'UPDATE {table} SET {target} = NEW.{source} WHERE {pk} = NEW.{pk}; END'.format(**names))
+        op.execute('CREATE TRIGGER IF NOT EXISTS {update} AFTER UPDATE OF {source} ON {table} FOR EACH ROW '
+                   'WHEN NEW.{source} IS NOT NEW.{target} BEGIN '
+                   'UPDATE {table} SET {target} = NEW.{source} WHERE {pk} = NEW.{pk}; END'.format(**names))
+    elif dialect == 'postgresql':
+        # 一个触发器函数同时处理插入和更新，update_name的触发器不使用
+        op.execute('CREATE OR REPLACE FUNCTION {insert}() RETURNS trigger AS $$ BEGIN '
+                   'IF TG_OP = \'INSERT\' THEN '
+                   'IF NEW.{target} IS NULL THEN NEW.{target} := NEW.{source}; END IF; '
+                   'ELSIF NEW.{source} IS DISTINCT FROM OLD.{source} THEN NEW.{target} := NEW.{source}; END IF; '
+                   'RETURN NEW; END $$ LANGUAGE plpgsql'.format(**names))
+        op.execute('DROP TRIGGER IF EXISTS {insert} ON {table}'.format(**names))
+        op.execute('CREATE TRIGGER {insert} BEFORE INSERT OR UPDATE ON {table} FOR EACH ROW '
+                   'EXECUTE PROCEDURE {insert}()'.format(**names))
+    elif dialect == 'mysql':
+        op.execute('DROP TRIGGER IF EXISTS {insert}'.format(**names))
+        op.execute('CREATE TRIGGER {insert} BEFORE INSERT ON {table} FOR EACH ROW '
+                   'SET NEW.{target} = COALESCE(NEW.{target}, NEW.{source})'.format(**names))
+        op.execute('DROP TRIGGER IF EXISTS {update}'.format(**names))
+        op.execute('CREATE TRIGGER {update} BEFORE UPDATE ON {table} FOR EACH ROW '
+                   'IF NOT (NEW.{source} <=> OLD.{source}) THEN SET NEW.{target} = NEW.{source}; END IF'
+                   .format(**names))
+    else:
+        raise NotImplementedError('dual-write triggers are not implemented for %s' % dialect)
+
+
+def drop_dual_write(table_name, source, target):
+    bind = op.get_bind()
+    quote = bind.dialect.identifier_preparer.quote
+    insert_name, update_name = _trigger_names(table_name, source, target)
+    if bind.dialect.name == 'postgresql':
+        op.execute('DROP TRIGGER IF EXISTS %s ON %s' % (quote(insert_name), quote(table_name)))
+        op.execute('DROP FUNCTION IF EXISTS %s()' % quote(insert_name))
+        return
+    for name in (insert_name, update_name):
+        op.execute('DROP TRIGGER IF EXISTS %s' % quote(name))
+
+
+def _ensure_checkpoints(bind):
+    bind.execute(sa.text('CREATE TABLE IF NOT EXISTS %s (name VARCHAR(128) PRIMARY KEY, last_id INTEGER, '
+                         'max_id INTEGER)' % CHECKPOINT_TABLE))
+
+
+def _finish_checkpoint(bind, name):
+    bind.execute(sa.delete(_checkpoints).where(_checkpoints.c.name == name))
+    if not bind.execute(sa.select(sa.func.count()).select_from(_checkpoints)).scalar():
+        bind.execute(sa.text('DROP TABLE %s' % CHECKPOINT_TABLE))
+
+
+# 分块回填：对table_name中主键在(last_id, last_id + batch_size]范围内的行执行UPDATE ... SET values，
+# values为{列名: SQL表达式}，例如{'updatedAt': sa.column('updateAt')}，where用来跳过已经回填的行。
+# 迁移的事务先提交，每块在autocommit_block中单独提交，块之间暂停pause秒，API的写请求可以插进来；
+# 每块提交后记录检查点，迁移中断后重新运行从上次的位置继续，最后一块可能重复执行，所以回填必须是幂等的。
+# batch_size、pause默认取MIGRATION_BATCH_SIZE、MIGRATION_BATCH_PAUSE，返回更新的行数
+def backfill(name, table_name, values, where=None, pk='id', batch_size=None, pause=None):
+    context = op.get_context()
+    if context.as_sql:
+        raise RuntimeError('backfill %s needs a database connection and cannot run in offline mode' % name)
+    config = current_app.config
+    batch_size = batch_size or config['MIGRATION_BATCH_SIZE']
+    pause = config['MIGRATION_BATCH_PAUSE'] if pause is None else pause
+    target = sa.table(table_name, sa.column(pk), *[sa.column(column_name) for column_name in values])
+    key = target.c[pk]
+    stmt = sa.update(target).values(values)
+    if where is not None:
+        stmt = stmt.where(where)
+    updated = 0
+    with context.autocommit_block():
+        bind = op.get_bind()
+        _ensure_checkpoints(bind)
+        row = bind.execute(sa.select(_checkpoints.c.last_id, _checkpoints.c.max_id)
+                           .where(_checkpoints.c.name == name)).first()
+        if row is None:
+            min_id, max_id = bind.execute(sa.select(sa.func.min(key), sa.func.max(key))).first()
+            if min_id is None:
+                _finish_checkpoint(bind, name)
+                return 0
+            last_id = min_id - 1
+            bind.execute(sa.insert(_checkpoints).values(name=name, last_id=last_id, max_id=max_id))
+        else:
+            last_id, max_id = row
+            logger.info('backfill %s: resuming after %s=%d', name, pk, last_id)
+        first_id, started, reported = last_id, time.monotonic(), time.monotonic()
+        while last_id < max_id:
+            upper = min(last_id + batch_size, max_id)
+            updated += bind.execute(stmt.where(key > last_id, key <= upper)).rowcount
+            bind.execute(sa.update(_checkpoints).where(_checkpoints.c.name == name).values(last_id=upper))
+            last_id = upper
+            if time.monotonic() - reported >= config['MIGRATION_PROGRESS_INTERVAL'] or last_id == max_id:
+                reported = time.monotonic()
+                logger.info('backfill %s: %s %d/%d (%.1f%%), %d rows updated in %.1fs', name, pk, last_id, max_id,
+                            100.0 * (last_id - first_id) / (max_id - first_id), updated, reported - started)
+            if pause and last_id < max_id:
+                time.sleep(pause)
+        _finish_checkpoint(bind, name)
+    return updated
@@ -0,0 +1,139 @@
+"""on delete cascade
+
+Revision ID: 7a3c9e5f1b80
+Revises: 5e8d1f3a6c27
+Create Date: 2026-10-19 22:41:37.509215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a3c9e5f1b80'
+down_revision = '5e8d1f3a6c27'
+branch_labels = None
+depends_on = None
+
+
+# SQLite不能修改已有的外键，只能重建表：copy_from给出重建后的表结构（外键带不带ON DELETE CASCADE），
+# recreate='always'让batch模式按它建新表、复制数据、替换旧表
+def _tables(cascade):
+    ondelete = 'CASCADE' if cascade else None
+    meta = sa.MetaData()
+
+    def fk(target):
+        return sa.ForeignKey(target, ondelete=ondelete)
+
+    def child_index(name, *columns):
+        return [sa.Index(name, *columns)] if cascade else []
+
+    article = sa.Table(
+        'article', meta,
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=60), nullable=True),
+        sa.Column('slug', sa.Text(), nullable=True),
+        sa.Column('description', sa.String(length=60), nullable=True),
+        sa.Column('body', sa.Text(), nullable=True),
+        sa.Column('author_id', sa.Integer(), fk('user.id'), nullable=True),
+        sa.Column('createdAt', sa.DateTime(), nullable=True),
+        sa.Column('updatedAt', sa.DateTime(), nullable=True),
+        # 降级时旧表里已经有deletedAt，需要出现在copy_from中才能被删除
+        *([] if cascade else [sa.Column('deletedAt', sa.DateTime(), nullable=True)]),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('slug'),
+        *child_index('ix_article_author_id', 'author_id'),
+    )
+    follow = sa.Table(
+        'follow', meta,
+        sa.Column('follower_id', sa.Integer(), fk('user.id'), nullable=False),
+        sa.Column('followed_id', sa.Integer(), fk('user.id'), nullable=False),
+        sa.PrimaryKeyConstraint('follower_id', 'followed_id'),
+        *child_index('ix_follow_followed_id', 'followed_id'),
+    )
+    collect = sa.Table(
+        'collect', meta,
+        sa.Column('collector_id', sa.Integer(), fk('user.id'), nullable=False),
+        sa.Column('collected_id', sa.Integer(), fk('article.id'), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('collector_id', 'collected_id'),
+        sa.Index('ix_collect_collector_timestamp', 'collector_id', 'timestamp'),
+        *child_index('ix_collect_collected_id', 'collected_id'),
+    )
+    comment = sa.Table(
+        'comment', meta,
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('body', sa.Text(), nullable=True),
+        sa.Column('createAt', sa.DateTime(), nullable=True),
+        sa.Column('author_id', sa.Integer(), fk('user.id'), nullable=True),
+        sa.Column('article_id', sa.Integer(), fk('article.id'), nullable=True),
+        sa.Column('updatedAt', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        *child_index('ix_comment_author_id', 'author_id'),
+        *child_index('ix_comment_article_id', 'article_id'),
+    )
+    tagging = sa.Table(
+        'tagging', meta,
+        sa.Column('article_id', sa.Integer(), fk('article.id'), nullable=True),
+        sa.Column('tag_id', sa.Integer(), fk('tag.id'), nullable=True),
+        *child_index('ix_tagging_article_id', 'article_id'),
+    )
+    trending_article = sa.Table(
+        'trending_article', meta,
+        sa.Column('article_id', sa.Integer(), fk('article.id'), nullable=False),
+        sa.Column('score', sa.Float(), nullable=True),
+        sa.Column('computedAt', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('article_id'),
+        sa.Index('ix_trending_article_score', 'score'),
+    )
+    related_article = sa.Table(
+        'related_article', meta,
+        sa.Column('article_id', sa.Integer(), fk('article.id'), nullable=False),
+        sa.Column('rank', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('related_id', sa.Integer(), fk('article.id'), nullable=True),
+        sa.Column('score', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('article_id', 'rank'),
+        sa.Index('ix_related_article_related_id', 'related_id'),
+    )
+    return [article, follow, collect, comment, tagging, trending_article, related_article]
+
+
+# 重建表时会先DROP旧表，外键检查打开的话会触发级联删除，重建期间必须关闭。
+# 在事务中修改foreign_keys不生效，所以放到autocommit_block里执行
+def _foreign_keys(enabled):
+    with op.get_context().autocommit_block():
+        op.execute('PRAGMA foreign_keys=%s' % ('ON' if enabled else 'OFF'))
+
+
+def _rebuild(cascade, article_ops):
+    _foreign_keys(False)
+    for table in _tables(cascade):
+        with op.batch_alter_table(table.name, recreate='always', copy_from=table) as batch_op:
+            if table.name == 'article':
+                article_ops(batch_op)
+    _foreign_keys(True)
+
+
+def upgrade():
+    # 清理之前删除文章、用户时遗留下来的孤立记录，否则打开外键检查后这些行会违反约束
+    for table, column, parent in [('tagging', 'article_id', 'article'), ('tagging', 'tag_id', 'tag'),
+                                  ('comment', 'article_id', 'article'), ('collect', 'collected_id', 'article'),
+                                  ('collect', 'collector_id', 'user'), ('follow', 'follower_id', 'user'),
+                                  ('follow', 'followed_id', 'user'), ('trending_article', 'article_id', 'article'),
+                                  ('related_article', 'article_id', 'article'),
+                                  ('related_article', 'related_id', 'article')]:
+        op.execute('DELETE FROM {0} WHERE {1} IS NOT NULL AND {1} NOT IN (SELECT id FROM "{2}")'.format(
+            table, column, parent))
+
+    def article_ops(batch_op):
+        batch_op.add_column(sa.Column('deletedAt', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_article_deletedAt'), ['deletedAt'], unique=False)
+
+    _rebuild(True, article_ops)
+
+
+def downgrade():
+    def article_ops(batch_op):
+        batch_op.drop_column('deletedAt')
+
+    _rebuild(False, article_ops)
@@ -0,0 +1,34 @@
+"""event log autoincrement
+
+Revision ID: a7d5c3e9b2f4
+Revises: f3a9d2c7b6e1
+Create Date: 2026-10-21 09:32:07.184526
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d5c3e9b2f4'
+down_revision = 'f3a9d2c7b6e1'
+branch_labels = None
+depends_on = None
+
+
+# SQLite只能在建表时指定AUTOINCREMENT，用batch模式重建event_log，已有的事件连同id一起复制，
+# sqlite_sequence从现有的最大id开始；其他数据库的自增主键本来就不会复用id，不需要改动
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table('event_log', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        batch_op.alter_column('id', existing_type=sa.Integer(), nullable=False)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table('event_log', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': False}) as batch_op:
+        batch_op.alter_column('id', existing_type=sa.Integer(), nullable=False)
@@ -0,0 +1,35 @@
+"""comment createdAt
+
+Revision ID: b3e6f1a8d0c5
+Revises: a7d5c3e9b2f4
+Create Date: 2026-10-22 10:14:51.630297
+
+"""
+import sqlalchemy as sa
+
+from blog.migrations.online import add_column, drop_column, backfill, create_dual_write, drop_dual_write
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e6f1a8d0c5'
+down_revision = 'a7d5c3e9b2f4'
+branch_labels = None
+depends_on = None
+
+
+# comment.createAt改名为createdAt，与article一致。这是扩展-迁移阶段：加新列，两个方向各建双写触发器，
+# 新版本应用只写createdAt、旧版本应用只写createAt时两列都保持一致，再分块回填已有的评论。
+# 旧列和触发器要等旧版本的实例全部下线后，在后续的版本中drop_dual_write、drop_column
+def upgrade():
+    add_column('comment', sa.Column('createdAt', sa.DateTime(), nullable=True))
+    create_dual_write('comment', 'createAt', 'createdAt')
+    create_dual_write('comment', 'createdAt', 'createAt')
+    backfill('b3e6f1a8d0c5_comment', 'comment', {'createdAt': sa.column('createAt')},
+             where=sa.column('createdAt').is_(None))
+
+
+# 双写期间旧列一直与新列同步，回退时直接删除触发器和新列
+def downgrade():
+    drop_dual_write('comment', 'createdAt', 'createAt')
+    drop_dual_write('comment', 'createAt', 'createdAt')
+    drop_column('comment', 'createdAt')
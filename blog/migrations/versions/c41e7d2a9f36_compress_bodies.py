@@ -0,0 +1,34 @@
+"""compress bodies
+
+Revision ID: c41e7d2a9f36
+Revises: 7a3c9e5f1b80
+Create Date: 2026-10-19 23:56:12.804311
+
+"""
+from alembic import op
+from flask import current_app
+
+from blog.body_codec import codec_from_config, convert_bodies
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41e7d2a9f36'
+down_revision = '7a3c9e5f1b80'
+branch_labels = None
+depends_on = None
+
+
+# 只转换数据，列仍是TEXT：按BODY_COMPRESSION压缩已有的正文，未开启压缩时什么都不做。
+# 数据量大时也可以先升级，之后再用flask body-compress分块提交地转换
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    codec = codec_from_config(current_app.config)
+    if codec.method is not None:
+        convert_bodies(op.get_bind(), codec)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    convert_bodies(op.get_bind(), codec_from_config(current_app.config, compress=False))
@@ -1,4 +1,7 @@
 from blog.estensions import db
+from blog.body_codec import CompressedText
+from blog.writebatch import run_write, insert_ignore, delete_by_pk
+from blog.signals import article_collected, article_uncollected, user_followed, user_unfollowed
 from datetime import datetime
 from flask_login import UserMixin, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -6,8 +9,8 @@ from marshmallow import Schema, fields, pre_load, post_dump
 
 # 标签与文章的多对多关系的关联表
 tagging = db.Table('tagging',
-                   db.Column('article_id', db.Integer, db.ForeignKey('article.id')),
-                   db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'))
+                   db.Column('article_id', db.Integer, db.ForeignKey('article.id', ondelete='CASCADE'), index=True),
+                   db.Column('tag_id', db.Integer, db.ForeignKey('tag.id', ondelete='CASCADE'))
                    )
 
 
@@ -15,43 +18,51 @@ tagging = db.Table('tagging',
 # article模型与user模型也需要建立多对多关系，
 # 使用关系模型来将article和user的多对多关系分离成User模型和Collect模型的一对多关系，以及Article模型和Collect模型的一对多关系
 class Collect(db.Model):
-    collector_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
-    collected_id = db.Column(db.Integer, db.ForeignKey('article.id'), primary_key=True)
+    collector_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    collected_id = db.Column(db.Integer, db.ForeignKey('article.id', ondelete='CASCADE'), primary_key=True,
+                             index=True)
     # 存储收藏动作发生的时间
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     # 与User，Article模型的关系属性
     collector = db.relationship('User', back_populates='collections', lazy='joined')
     collected = db.relationship('Article', back_populates='collectors', lazy='joined')
+    # 按收藏时间分页列出某个用户收藏的文章
+    __table_args__ = (db.Index('ix_collect_collector_timestamp', 'collector_id', 'timestamp'),)
 
 
 class Article(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(60))
+    title = db.Column(db.String(60), index=True)
     slug = db.Column(db.Text, unique=True)
     description = db.Column(db.String(60))
-    body = db.Column(db.Text)
+    body = db.Column(CompressedText)
     # 与tag模型的关系属性
-    tagList = db.relationship('Tag', secondary=tagging, back_populates='articles')
+    tagList = db.relationship('Tag', secondary=tagging, back_populates='articles', passive_deletes=True)
     author = db.relationship('User', back_populates='articles')
-    author_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), index=True)
     createdAt = db.Column(db.DateTime, default=datetime.utcnow)
     updatedAt = db.Column(db.DateTime, default=datetime.utcnow)
+    # 软删除时间，非空的文章对查询不可见，由后台任务分批清除
+    deletedAt = db.Column(db.DateTime, index=True)
     # 为文章添加评论字段时，与评论数据库定义关系属性，并设置backref参数指向文章实例，\
     # 使得可以通过评论获取到文章，同时设置cascade参数为all，设置级联删除，在删除文章时不用手动删除对应的评论。
-    comments = db.relationship('Comment', back_populates='article', cascade='all', lazy='dynamic')
+    # 外键上设置了ON DELETE CASCADE，passive_deletes让ORM不再把未加载的评论、收藏逐条查出来删除，交给数据库一次完成
+    comments = db.relationship('Comment', back_populates='article', cascade='all', lazy='dynamic',
+                               passive_deletes=True)
     # 与Collect模型的关系属性
-    collectors = db.relationship('Collect', back_populates='collected', cascade='all')
+    collectors = db.relationship('Collect', back_populates='collected', cascade='all', passive_deletes=True)
 
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    body = db.Column(db.Text)
+    body = db.Column(CompressedText)
     author = db.relationship('User', back_populates='comments')
-    createAt = db.Column(db.DateTime, default=datetime.utcnow)
+    # 数据库中的列名为createdAt（见迁移b3e6f1a8d0c5），属性名和接口字段仍为createAt
+    createAt = db.Column('createdAt', db.DateTime, default=datetime.utcnow)
     updatedAt = db.Column(db.DateTime, default=datetime.utcnow)
     article = db.relationship('Article', back_populates='comments')
-    author_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    article_id = db.Column(db.Integer, db.ForeignKey('article.id'))
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), index=True)
+    article_id = db.Column(db.Integer, db.ForeignKey('article.id', ondelete='CASCADE'), index=True)
 
 
 class Tag(db.Model):
@@ -62,13 +73,43 @@ class Tag(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(20), unique=True, index=True)
-    articles = db.relationship('Article', secondary=tagging, back_populates='tagList')
+    articles = db.relationship('Article', secondary=tagging, back_populates='tagList', passive_deletes=True)
+
+
+# 热门文章快照，由定时任务整体重算，新的收藏/评论在两次重算之间增量累加分数
+class TrendingArticle(db.Model):
+    article_id = db.Column(db.Integer, db.ForeignKey('article.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, index=True)
+    # 分数的参考时间，分数都折算到这一时刻
+    computedAt = db.Column(db.DateTime)
+    article = db.relationship('Article')
+
+
+# 基于标签共现预先计算的相关文章，每篇文章保留前k篇，按rank排序
+class RelatedArticle(db.Model):
+    article_id = db.Column(db.Integer, db.ForeignKey('article.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    related_id = db.Column(db.Integer, db.ForeignKey('article.id', ondelete='CASCADE'), index=True)
+    score = db.Column(db.Float)
+
+
+# 推送事件日志：各worker进程写入新事件，再由各自的轮询线程读出分发给本进程的订阅者，定期清除过期记录
+class EventLog(db.Model):
+    # 轮询和Last-Event-ID补发都依赖id单调递增：没有AUTOINCREMENT时SQLite会在表被清空后重新从1分配id，
+    # 新事件的id小于轮询线程记住的last_id，会被一直跳过
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.Integer, primary_key=True)
+    # 频道，例如 article:<文章id>（新评论）、author:<用户id>（作者发表的新文章）
+    channel = db.Column(db.String(64))
+    payload = db.Column(db.Text)
+    createdAt = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 
 # 实现关注功能
 class Follow(db.Model):
-    follower_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
-    followed_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    follower_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    followed_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True,
+                            index=True)
     follower = db.relationship('User', foreign_keys=[follower_id], back_populates='following', lazy='joined')
     followed = db.relationship('User', foreign_keys=[followed_id], back_populates='followers', lazy='joined')
 
@@ -83,16 +124,16 @@ class User(db.Model, UserMixin):
     image = db.Column(db.String(70))
     confirmed = db.Column(db.Boolean, default=False)
     token = db.Column(db.String(254))
-    comments = db.relationship('Comment', back_populates='author', cascade='all')
-    articles = db.relationship('Article', back_populates='author', cascade='all')
+    comments = db.relationship('Comment', back_populates='author', cascade='all', passive_deletes=True)
+    articles = db.relationship('Article', back_populates='author', cascade='all', passive_deletes=True)
     # 与Collect模型的关系属性
-    collections = db.relationship('Collect', back_populates='collector', cascade='all')
+    collections = db.relationship('Collect', back_populates='collector', cascade='all', passive_deletes=True)
     # following 为自己的关注对象
     following = db.relationship('Follow', foreign_keys=[Follow.follower_id], back_populates='follower',
-                                lazy='dynamic', cascade='all')
+                                lazy='dynamic', cascade='all', passive_deletes=True)
     # followers 为自己的粉丝
     followers = db.relationship('Follow', foreign_keys=[Follow.followed_id], back_populates='followed',
-                                lazy='dynamic', cascade='all')
+                                lazy='dynamic', cascade='all', passive_deletes=True)
 
     # set_password()函数用来设置密码，接收密码原始值作为参数，将密码的散列值设为password_hash的只
     @property
@@ -110,19 +151,17 @@ class User(db.Model, UserMixin):
     def verify_password(self, password):
         return check_password_hash(self.password_hash, password)
 
-    # 关注
+    # 关注，直接对复合主键执行幂等插入，返回关注后的状态，不再先查询是否已关注
     def follow(self, user):
-        if not self.is_following(user):
-            follow = Follow(follower=self, followed=user)
-            db.session.add(follow)
-            db.session.commit()
+        if run_write(insert_ignore(Follow.__table__, follower_id=self.id, followed_id=user.id)):
+            user_followed.send(self, user=user)
+        return True
 
     # 取消关注
     def unfollow(self, user):
-        follow = self.following.filter_by(followed_id=user.id).first()
-        if follow:
-            db.session.delete(follow)
-            db.session.commit()
+        if run_write(delete_by_pk(Follow.__table__, follower_id=self.id, followed_id=user.id)):
+            user_unfollowed.send(self, user=user)
+        return False
 
     # 确认是否关注了对方
     def is_following(self, user):
@@ -138,23 +177,64 @@ class User(db.Model, UserMixin):
         return Article.query.join(Follow, Follow.followed_id == Article.author_id).filter(Follow.follower_id == self.id)
 
     def collect(self, article):
-        if not self.is_collecting(article):
-            collect = Collect(collector=self, collected=article)
-            db.session.add(collect)
-            db.session.commit()
+        if run_write(insert_ignore(Collect.__table__, collector_id=self.id, collected_id=article.id)):
+            # 只有真正新增了收藏记录才发出信号
+            article_collected.send(self, article=article)
+        return True
 
     # 取消收藏,即删除对应的collect记录
     def uncollect(self, article):
-        collect = Collect.query.with_parent(self).filter_by(collected_id=article.id).first()
-        if collect:
-            db.session.delete(collect)
-            db.session.commit()
+        if run_write(delete_by_pk(Collect.__table__, collector_id=self.id, collected_id=article.id)):
+            article_uncollected.send(self, article=article)
+        return False
 
     # 确认是否已收藏该文章
     def is_collecting(self, article):
         return Collect.query.with_parent(self).filter_by(collected_id=article.id).first() is not None
 
 
+# 列表接口使用的只读行对象，由列查询直接构造（见blog/readmodels.py），不进入会话的identity map，
+# 没有ORM实例的变更跟踪状态；查看者相关的following、favorited和收藏数已经批量查好，响应模型不再逐条查询
+class AuthorRow(object):
+    __slots__ = ('id', 'username', 'email', 'bio', 'image', 'following')
+
+    def __init__(self, id, username, email, bio, image, following=False):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.bio = bio
+        self.image = image
+        self.following = following
+
+
+class ArticleRow(object):
+    __slots__ = ('id', 'slug', 'title', 'description', 'body', 'createdAt', 'updatedAt', 'author', 'tagList',
+                 'favorited', 'favoritedCount')
+
+    def __init__(self, id, slug, title, description, body, createdAt, updatedAt, author):
+        self.id = id
+        self.slug = slug
+        self.title = title
+        self.description = description
+        self.body = body
+        self.createdAt = createdAt
+        self.updatedAt = updatedAt
+        self.author = author
+        self.tagList = []
+        self.favorited = False
+        self.favoritedCount = 0
+
+
+class CommentRow(object):
+    __slots__ = ('id', 'body', 'createAt', 'author')
+
+    def __init__(self, id, body, createAt, author):
+        self.id = id
+        self.body = body
+        self.createAt = createAt
+        self.author = author
+
+
 # 返回用户的响应模型
 class ProfileSchema(Schema):
     username = fields.Str()
@@ -172,8 +252,11 @@ class ProfileSchema(Schema):
     # def make_user(self, data, **kwargs):
     #    return data['profile']
 
-    @post_dump
-    def dump_user(self, data, **kwargs):
+    @post_dump(pass_original=True)
+    def dump_user(self, data, original, **kwargs):
+        if isinstance(original, AuthorRow):
+            data['following'] = original.following
+            return data
         data['following'] = current_user.is_following(User.query.filter(User.email == data['email']).first())
         return data
 
@@ -206,8 +289,11 @@ class ArticleSchema(Schema):
     def make_article(self, data, **kwargs):
         return data['article']
 
-    @post_dump
-    def dump_article(self, data, **kwargs):
+    @post_dump(pass_original=True)
+    def dump_article(self, data, original, **kwargs):
+        if isinstance(original, ArticleRow):
+            data['favoritedCount'] = original.favoritedCount
+            return {'data': {'article': data}}
         # 由于我把收藏文章的方法写给了user，所以这里只能把favorited响应字段写在额外的响应内容里
         data['favorited'] = current_user.is_collecting(Article.query.filter_by(slug=data['slug']).first())
         data['favoritedCount'] = len(Article.query.filter_by(slug=data['slug']).first().collectors)
@@ -0,0 +1,149 @@
+# 预先fork的启动器：master进程创建并预热应用后再fork出worker，导入的模块、编译好的映射器和响应模型、
+# 路由表都在fork之前就已经在内存中，worker与master按写时复制共享这些页面，不必每个worker各建一份。
+# 用法: python -m blog.prefork --workers 4 --bind 127.0.0.1:5000
+# worker用werkzeug的开发服务器处理请求，只用于本地调试和内存对比，不要用于生产环境；
+# 生产环境用gunicorn按同样的方式预加载: gunicorn -c blog/gunicorn_conf.py blog.wsgi:app
+#      --lazy 每个worker在fork之后各自创建应用，用于和预加载的内存占用对比（见benchmarks/prefork_memory.py）
+import argparse
+import gc
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# 把第一次请求才会做的初始化提前到master中：配置所有映射器、导入按需加载的模块、创建响应模型中嵌套的schema、
+# 编译路由表的正则，再在应用上下文中创建正文编解码器
+def warm_app(app):
+    from marshmallow import Schema, fields
+    from sqlalchemy.orm import configure_mappers
+    import blog.article_index  # noqa: F401
+    import blog.follow_graph  # noqa: F401
+    import blog.readmodels  # noqa: F401
+    from blog import models
+    from blog.body_codec import get_body_codec
+    from blog.estensions import db
+    configure_mappers()
+    for schema in vars(models).values():
+        if isinstance(schema, Schema):
+            for field in schema.fields.values():
+                field = getattr(field, 'inner', field)
+                if isinstance(field, fields.Nested):
+                    field.schema
+    adapter = app.url_map.bind('localhost')
+    for rule in app.url_map.iter_rules():
+        try:
+            adapter.match(rule.rule, method=next(iter(rule.methods)))
+        except Exception:
+            pass
+    with app.app_context():
+        get_body_codec()
+        # 数据库连接在fork之后由各个worker自己建立，master不持有任何连接
+        db.engine.dispose()
+
+
+def load_app():
+    from blog import create_app
+    from blog import scheduler
+    # 定时任务的线程等fork之后再在worker中启动
+    scheduler.defer()
+    app = create_app()
+    warm_app(app)
+    return app
+
+
+def serve(app, sock, host, port):
+    from werkzeug.serving import make_server
+    make_server(host, port, app, threaded=True, fd=sock.fileno()).serve_forever()
+
+
+# index为worker的编号，被替换的worker沿用原来的编号；0号worker负责运行共享的定时任务
+def spawn(app, sock, host, port, index):
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        # 每个worker的随机数序列不能相同
+        random.seed()
+        gc.enable()
+        if app is None:
+            app = load_app()
+        from blog.scheduler import start_deferred
+        start_deferred(primary=index == 0)
+        serve(app, sock, host, port)
+    except BaseException:
+        logger.exception('worker %d failed', os.getpid())
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m blog.prefork')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--bind', default='127.0.0.1:5000')
+    parser.add_argument('--lazy', action='store_true')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='[%(process)d] %(message)s')
+    host, _, port = args.bind.rpartition(':')
+    host, port = host or '127.0.0.1', int(port)
+
+    app = None
+    if not args.lazy:
+        # 创建应用期间产生的对象都是长期存活的，关掉gc避免回收过程改写对象头、把共享页面变成私有页面；
+        # gc.freeze把这些对象移到永久代，worker中的gc不再扫描它们
+        gc.disable()
+        app = load_app()
+        gc.freeze()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+    logger.info('listening on http://%s:%d with %d workers (%s)', host, port, args.workers,
+                'lazy' if args.lazy else 'preloaded')
+
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    workers = {spawn(app, sock, host, port, index): index for index in range(args.workers)}
+    while not stopping:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid in workers:
+            index = workers.pop(pid)
+            logger.warning('worker %d exited with status %d, respawning', pid, status)
+            workers[spawn(app, sock, host, port, index)] = index
+        elif not pid:
+            time.sleep(0.2)
+
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in workers:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+    sock.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
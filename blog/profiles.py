@@ -0,0 +1,92 @@
+from flask import current_app
+from sqlalchemy import exists, and_
+
+from blog.cache import LRUCache
+from blog.estensions import db
+from blog.models import User, Follow
+
+
+# 缓存的公共资料，与查看者无关，所有请求共享；只有User.follow/unfollow用到的id属性
+class Profile(object):
+    __slots__ = ('id', 'username', 'bio', 'image')
+
+    def __init__(self, id, username, bio, image):
+        self.id = id
+        self.username = username
+        self.bio = bio
+        self.image = image
+
+
+def init_profile_cache(app):
+    app.extensions['profile_cache'] = LRUCache(maxsize=app.config['PROFILE_CACHE_SIZE'],
+                                               ttl=app.config['PROFILE_CACHE_TTL'])
+
+
+# 读穿缓存：未命中时只查询资料需要的几列，不加载完整的User对象
+def get_profile(username):
+    cache = current_app.extensions['profile_cache']
+    profile = cache.get(username)
+    if profile is None:
+        row = db.session.query(User.id, User.username, User.bio, User.image) \
+            .filter(User.username == username).first()
+        if row is None:
+            return None
+        profile = Profile(*row)
+        cache.set(username, profile)
+    return profile
+
+
+# 按id一次查询多个用户的资料，返回{id: Profile}
+def get_profiles_by_id(ids):
+    if not ids:
+        return {}
+    rows = db.session.query(User.id, User.username, User.bio, User.image).filter(User.id.in_(ids)).all()
+    return {row[0]: Profile(*row) for row in rows}
+
+
+# 批量读取多个用户名的资料：先查缓存，未命中的用一条IN查询补齐并写回缓存，返回{username: Profile}
+def get_profiles(usernames):
+    cache = current_app.extensions['profile_cache']
+    profiles = {}
+    missing = []
+    for username in usernames:
+        profile = cache.get(username)
+        if profile is None:
+            missing.append(username)
+        else:
+            profiles[username] = profile
+    if missing:
+        rows = db.session.query(User.id, User.username, User.bio, User.image) \
+            .filter(User.username.in_(missing)).all()
+        for row in rows:
+            profile = Profile(*row)
+            cache.set(profile.username, profile)
+            profiles[profile.username] = profile
+    return profiles
+
+
+def invalidate_profile(username):
+    current_app.extensions['profile_cache'].delete(username)
+
+
+# 查看者相关的following单独查询，只走follow表的复合主键
+def is_following_id(follower_id, followed_id):
+    return db.session.query(exists().where(and_(Follow.follower_id == follower_id,
+                                                Follow.followed_id == followed_id))).scalar()
+
+
+# 批量版本：返回ids中被follower_id关注的用户id集合
+def following_ids(follower_id, ids):
+    if not ids:
+        return set()
+    rows = db.session.query(Follow.followed_id) \
+        .filter(Follow.follower_id == follower_id, Follow.followed_id.in_(ids)).all()
+    return {row[0] for row in rows}
+
+
+def profile_data(profile, following):
+    return {
+        "username": profile.username,
+        "bio": profile.bio,
+        "image": profile.image,
+        "following": following}
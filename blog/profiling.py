@@ -0,0 +1,168 @@
+import cProfile
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+from flask import request, g
+
+# 性能剖析文件的命名：<时间戳>-<端点>-<耗时毫秒>.<扩展名>，列表接口据此解析出各字段
+EXTENSIONS = {'cprofile': '.prof', 'sampler': '.speedscope.json'}
+
+
+# 统计采样器：后台线程每隔interval秒读取一次目标线程的调用栈，结果可以导出为speedscope格式，
+# 开销只与采样频率有关，不会像cProfile那样拖慢每一次函数调用
+class StackSampler(object):
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.frames = []
+        self._frame_index = {}
+        self.samples = []
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = None
+        self.started = None
+        self.elapsed = 0
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_name, code.co_filename, code.co_firstlineno)
+                index = self._frame_index.get(key)
+                if index is None:
+                    index = self._frame_index[key] = len(self.frames)
+                    self.frames.append({'name': key[0], 'file': key[1], 'line': key[2]})
+                stack.append(index)
+                frame = frame.f_back
+            # speedscope要求调用栈从根到叶排列
+            stack.reverse()
+            self.samples.append(stack)
+
+    def dump(self, path, name):
+        profile = {
+            'type': 'sampled', 'name': name, 'unit': 'seconds',
+            'startValue': 0, 'endValue': self.elapsed,
+            'samples': self.samples, 'weights': [self.interval] * len(self.samples),
+        }
+        with open(path, 'w') as f:
+            json.dump({'$schema': 'https://www.speedscope.app/file-format-schema.json',
+                       'shared': {'frames': self.frames}, 'profiles': [profile],
+                       'name': name, 'exporter': 'blog'}, f)
+
+
+def profile_dir(app):
+    return app.config['PROFILE_DIR'] or os.path.join(app.instance_path, 'profiles')
+
+
+# 列出已保存的剖析文件，按时间从新到旧
+def list_profiles(app):
+    directory = profile_dir(app)
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        parts = name.split('.', 1)[0].split('-')
+        if len(parts) < 3:
+            continue
+        profiles.append({'name': name,
+                         'createdAt': datetime.utcfromtimestamp(int(parts[0]) / 1000000).isoformat(),
+                         'endpoint': '-'.join(parts[1:-1]),
+                         'elapsedMs': int(parts[-1]),
+                         'size': os.path.getsize(os.path.join(directory, name))})
+    return profiles
+
+
+# 环形缓冲：目录中只保留最新的PROFILE_KEEP个文件
+def _trim(directory, keep):
+    names = sorted(os.listdir(directory))
+    for name in names[:max(0, len(names) - keep)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+
+def _should_profile(app):
+    token = app.config['ADMIN_TOKEN']
+    header = request.headers.get('X-Profile-Token')
+    if token and header and hmac.compare_digest(header, token):
+        return True
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+
+# 只有PROFILE_ENABLED时才注册请求钩子，关闭时请求路径上没有任何额外开销。
+# 请求头X-Profile-Token等于ADMIN_TOKEN，或按PROFILE_SAMPLE_RATE随机抽中的请求会被剖析，
+# PROFILE_MODE为cprofile时保存pstats文件，为sampler时保存speedscope文件
+def init_profiling(app):
+    if not app.config['PROFILE_ENABLED']:
+        return
+    mode = app.config['PROFILE_MODE']
+    directory = profile_dir(app)
+    os.makedirs(directory, exist_ok=True)
+
+    @app.before_request
+    def start_profile():
+        if not _should_profile(app):
+            return
+        if mode == 'sampler':
+            profiler = StackSampler(app.config['PROFILE_SAMPLE_INTERVAL'])
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12起同一时刻只能有一个cProfile在运行，并发的请求跳过剖析
+                return
+        g.profiler = (profiler, time.perf_counter())
+
+    @app.after_request
+    def save_profile(response):
+        state = g.pop('profiler', None)
+        if state is None:
+            return response
+        profiler, started = state
+        if mode == 'sampler':
+            profiler.stop()
+        else:
+            profiler.disable()
+        elapsed_ms = int((time.perf_counter() - started) * 1000)
+        endpoint = (request.endpoint or 'unknown').replace('.', '_').replace('-', '_')
+        name = '%d-%s-%d%s' % (time.time() * 1000000, endpoint, elapsed_ms, EXTENSIONS[mode])
+        path = os.path.join(directory, name)
+        if mode == 'sampler':
+            profiler.dump(path, '%s %s' % (request.method, request.path))
+        else:
+            profiler.dump_stats(path)
+        _trim(directory, app.config['PROFILE_KEEP'])
+        response.headers['X-Profile-Id'] = name
+        return response
+
+    # 视图抛出异常时after_request不会执行，这里保证剖析器被关闭，不会影响同一线程后续的请求
+    @app.teardown_request
+    def stop_profile(exc):
+        state = g.pop('profiler', None)
+        if state is not None:
+            if mode == 'sampler':
+                state[0].stop()
+            else:
+                state[0].disable()
@@ -0,0 +1,186 @@
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import Counter
+
+from flask import request, jsonify
+from flask_login import current_user
+
+# 每个槽位：键的哈希（0表示空槽）、剩余令牌数、上次更新时间
+SLOT = struct.Struct('<Qdd')
+UNITS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+# 解析'10/minute'这样的限额，返回(桶容量, 每秒补充的令牌数)：容量等于周期内允许的请求数，允许短时间的突发
+def parse_limit(limit):
+    count, unit = limit.split('/')
+    count = int(count)
+    return count, count / float(UNITS[unit.strip()])
+
+
+# 令牌桶表放在mmap映射的文件里，同一台机器上的所有gunicorn worker映射同一个文件，看到的是同一份计数。
+# 表是开放寻址的哈希表，键哈希后线性探测probes个槽位，都被占用时复用最久没有更新的槽位（它的桶多半早已补满）。
+# 进程之间用flock互斥，同一进程的线程之间flock不互斥，另外加一把线程锁；临界区只有几次struct读写。
+# 文件在第一次取令牌时才创建和映射，命令行等不处理请求的进程不会创建它
+class TokenBuckets(object):
+
+    def __init__(self, path, slots=65536, probes=8):
+        self.path = path
+        self.slots = slots
+        self.probes = probes
+        self._lock = threading.Lock()
+        self._fd = None
+        self._map = None
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = self.slots * SLOT.size
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+
+    # flock的锁属于打开的文件描述，fork出的worker与master共用同一个描述时互相不排斥，fork之后要重新打开文件；
+    # 还没有打开过的不用处理，worker第一次取令牌时自己打开
+    def reopen(self):
+        self._lock = threading.Lock()
+        if self._fd is None:
+            return
+        self._map.close()
+        os.close(self._fd)
+        self._open()
+
+    @staticmethod
+    def key_hash(key):
+        value = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+        return value or 1
+
+    # 从键对应的桶里取一个令牌，返回(是否允许, 需要等待的秒数)
+    def take(self, key, capacity, rate, now=None):
+        allowed, retry_after, _ = self.take_all([(key, capacity, rate)], now)
+        return allowed, retry_after
+
+    # 同时检查多个桶，keys为[(键, 桶容量, 每秒补充的令牌数)]。所有桶都有令牌时才各取一个；
+    # 任何一个不足时都不扣减，前面的范围不会因为后面的范围拒绝而白白消耗令牌。
+    # 返回(是否允许, 需要等待的秒数, 第一个不足的桶在keys中的下标)
+    def take_all(self, keys, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._fd is None:
+                self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                slots, rejected, retry_after = [], None, 0.0
+                for index, (key, capacity, rate) in enumerate(keys):
+                    key_hash = self.key_hash(key)
+                    offset, tokens, last = self._find(key_hash)
+                    if last is None:
+                        tokens = float(capacity)
+                    else:
+                        tokens = min(float(capacity), tokens + max(0.0, now - last) * rate)
+                    # 先写回补充后的令牌数占住槽位，后面的键探测时不会选中同一个空槽
+                    SLOT.pack_into(self._map, offset, key_hash, tokens, now)
+                    slots.append((offset, key_hash, tokens))
+                    if tokens < 1:
+                        retry_after = max(retry_after, (1 - tokens) / rate)
+                        if rejected is None:
+                            rejected = index
+                if rejected is None:
+                    for offset, key_hash, tokens in slots:
+                        SLOT.pack_into(self._map, offset, key_hash, tokens - 1, now)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return rejected is None, retry_after, rejected
+
+    # 返回(槽位偏移, 令牌数, 上次更新时间)，新占用的槽位上次更新时间为None
+    def _find(self, key_hash):
+        start = key_hash % self.slots
+        oldest_offset, oldest_last = None, None
+        for i in range(self.probes):
+            offset = ((start + i) % self.slots) * SLOT.size
+            slot_hash, tokens, last = SLOT.unpack_from(self._map, offset)
+            if slot_hash == key_hash:
+                return offset, tokens, last
+            if slot_hash == 0:
+                return offset, 0.0, None
+            if oldest_last is None or last < oldest_last:
+                oldest_offset, oldest_last = offset, last
+        return oldest_offset, 0.0, None
+
+
+def rate_limit_rejections(app):
+    state = app.extensions.get('rate_limit_rejections')
+    if state is None:
+        return {}
+    counter, lock = state
+    with lock:
+        return {'%s:%s' % key: count for key, count in counter.items()}
+
+
+# 客户端地址：部署在trusted_proxies层反向代理之后时，从X-Forwarded-For右边数第trusted_proxies个地址
+# （与werkzeug的ProxyFix(x_for=trusted_proxies)相同），更左边的值可以由客户端伪造，不使用。
+# 没有经过代理时不能信任这个请求头，trusted_proxies为0，直接用连接的对端地址
+def client_ip(trusted_proxies):
+    if trusted_proxies:
+        forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+        if len(forwarded) >= trusted_proxies:
+            return forwarded[-trusted_proxies]
+    return request.remote_addr
+
+
+# 限流的范围：ip按客户端地址，user按登录用户，未登录时退回按地址
+def _scope_key(scope, trusted_proxies):
+    if scope == 'user' and current_user.is_authenticated:
+        return 'user:%s' % current_user.get_id()
+    return 'ip:%s' % client_ip(trusted_proxies)
+
+
+# RATE_LIMITS按端点配置限额，例如{'users.user_login': {'ip': '10/minute'}}，没有配置的端点不限流。
+# 一个端点配置了多个范围时，所有范围都有余量才放行。超过限额的请求返回429和Retry-After，按(端点, 范围)计数
+def init_rate_limit(app):
+    if not app.config['RATE_LIMIT_ENABLED'] or not app.config['RATE_LIMITS']:
+        return
+    rules = {endpoint: [(scope, parse_limit(limit)) for scope, limit in limits.items()]
+             for endpoint, limits in app.config['RATE_LIMITS'].items()}
+    trusted_proxies = app.config['RATE_LIMIT_TRUSTED_PROXIES']
+    path = app.config['RATE_LIMIT_FILE'] or os.path.join(app.instance_path, 'ratelimit.bin')
+    buckets = app.extensions['rate_limit'] = TokenBuckets(path, slots=app.config['RATE_LIMIT_SLOTS'])
+    app.extensions['rate_limit_rejections'] = (Counter(), threading.Lock())
+    os.register_at_fork(after_in_child=buckets.reopen)
+
+    @app.before_request
+    def check_rate_limit():
+        endpoint_rules = rules.get(request.endpoint)
+        if endpoint_rules is None:
+            return None
+        allowed, retry_after, rejected = buckets.take_all([
+            ('%s|%s' % (request.endpoint, _scope_key(scope, trusted_proxies)), capacity, rate)
+            for scope, (capacity, rate) in endpoint_rules])
+        if allowed:
+            return None
+        counter, lock = app.extensions['rate_limit_rejections']
+        with lock:
+            counter[(request.endpoint, endpoint_rules[rejected][0])] += 1
+        ret_data = {"code": 10012,
+                    "errors": {
+                        "body": [
+                            "can't be empty"
+                        ]
+                    },
+                    "message": "too many requests"
+                    }
+        response = jsonify(ret_data)
+        response.status_code = 429
+        response.headers['Retry-After'] = str(int(math.ceil(retry_after)))
+        return response
@@ -0,0 +1,67 @@
+from flask_login import current_user
+from sqlalchemy import func
+
+from blog.estensions import db
+from blog.models import Article, Comment, User, Tag, Collect, tagging, AuthorRow, ArticleRow, CommentRow
+from blog.profiles import following_ids
+
+AUTHOR_COLUMNS = (User.id, User.username, User.email, User.bio, User.image)
+ARTICLE_COLUMNS = (Article.id, Article.slug, Article.title, Article.description, Article.body,
+                   Article.createdAt, Article.updatedAt)
+COMMENT_COLUMNS = (Comment.id, Comment.body, Comment.createAt)
+
+
+def _viewer_id():
+    return current_user.id if current_user.is_authenticated else None
+
+
+# 作者列在行尾，没有作者（外连接为空）时返回None
+def _author(row, start):
+    if row[start] is None:
+        return None
+    return AuthorRow(*row[start:start + len(AUTHOR_COLUMNS)])
+
+
+# 批量填充查看者是否关注了这些作者
+def _fill_following(authors):
+    viewer_id = _viewer_id()
+    if viewer_id is None:
+        return
+    following = following_ids(viewer_id, list({author.id for author in authors}))
+    for author in authors:
+        author.following = author.id in following
+
+
+# 文章列表的只读查询：query为过滤、排序好的Article查询，只取当前页需要的列构造ArticleRow，
+# 标签、收藏数、查看者的收藏和关注状态各用一次IN查询补齐，整页固定5条查询
+def article_rows(query, limit, offset):
+    rows = query.with_entities(*ARTICLE_COLUMNS + AUTHOR_COLUMNS) \
+        .outerjoin(User, User.id == Article.author_id).offset(offset).limit(limit).all()
+    articles = [ArticleRow(*row[:len(ARTICLE_COLUMNS)], author=_author(row, len(ARTICLE_COLUMNS)))
+                for row in rows]
+    if not articles:
+        return articles
+    by_id = {article.id: article for article in articles}
+    ids = list(by_id)
+    for article_id, name in db.session.query(tagging.c.article_id, Tag.name) \
+            .join(Tag, Tag.id == tagging.c.tag_id).filter(tagging.c.article_id.in_(ids)).all():
+        by_id[article_id].tagList.append(name)
+    for article_id, count in db.session.query(Collect.collected_id, func.count()) \
+            .filter(Collect.collected_id.in_(ids)).group_by(Collect.collected_id).all():
+        by_id[article_id].favoritedCount = count
+    viewer_id = _viewer_id()
+    if viewer_id is not None:
+        for row in db.session.query(Collect.collected_id) \
+                .filter(Collect.collector_id == viewer_id, Collect.collected_id.in_(ids)).all():
+            by_id[row[0]].favorited = True
+    _fill_following([article.author for article in articles if article.author is not None])
+    return articles
+
+
+# 一篇文章的评论列表，评论与作者一次连接查询，查看者的关注状态一次IN查询
+def comment_rows(article_id):
+    rows = db.session.query(*COMMENT_COLUMNS + AUTHOR_COLUMNS).outerjoin(User, User.id == Comment.author_id) \
+        .filter(Comment.article_id == article_id).order_by(Comment.id).all()
+    comments = [CommentRow(*row[:len(COMMENT_COLUMNS)], author=_author(row, len(COMMENT_COLUMNS))) for row in rows]
+    _fill_following([comment.author for comment in comments if comment.author is not None])
+    return comments
@@ -0,0 +1,110 @@
+from flask import current_app
+from sqlalchemy import select, func
+
+from blog.estensions import db
+from blog.models import tagging, RelatedArticle
+from blog.signals import article_tags_changed
+
+
+# 根据交集大小计算相似度：jaccard为 |A∩B| / |A∪B|，cosine为 |A∩B| / sqrt(|A||B|)，
+# 返回按相似度排好的前k个(候选文章id数组, 相似度数组)
+def top_k(size, candidates, intersections, candidate_sizes, k, measure='jaccard'):
+    import numpy as np
+    if measure == 'cosine':
+        scores = intersections / np.sqrt(size * candidate_sizes)
+    else:
+        scores = intersections / (size + candidate_sizes - intersections)
+    if len(scores) > k:
+        keep = np.argpartition(-scores, k - 1)[:k]
+        candidates, scores = candidates[keep], scores[keep]
+    order = np.lexsort((candidates, -scores))
+    return candidates[order], scores[order]
+
+
+def _replace_rows(article_ids, rows):
+    if article_ids:
+        db.session.query(RelatedArticle).filter(RelatedArticle.article_id.in_(article_ids)) \
+            .delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(RelatedArticle, rows)
+
+
+def _rows(article_id, candidates, scores):
+    return [{'article_id': article_id, 'rank': rank, 'related_id': int(related_id), 'score': float(score)}
+            for rank, (related_id, score) in enumerate(zip(candidates, scores))]
+
+
+# 批量全量计算：用tagging构造稀疏的文章×标签矩阵（按文章、按标签各一份CSR），
+# 每篇文章经由自己的标签找到候选文章，用bincount统计交集大小，整表替换
+def refresh_related_all():
+    import numpy as np
+    config = current_app.config
+    rows = db.session.execute(select(tagging.c.article_id, tagging.c.tag_id).distinct()
+                              .where(tagging.c.article_id.isnot(None), tagging.c.tag_id.isnot(None))).all()
+    pairs = np.array(rows, dtype=np.int64).reshape(-1, 2)
+    articles, article_index = np.unique(pairs[:, 0], return_inverse=True)
+    tags, tag_index = np.unique(pairs[:, 1], return_inverse=True)
+    by_article = np.lexsort((tag_index, article_index))
+    article_ptr = np.searchsorted(article_index[by_article], np.arange(len(articles) + 1))
+    article_tags = tag_index[by_article]
+    by_tag = np.lexsort((article_index, tag_index))
+    tag_ptr = np.searchsorted(tag_index[by_tag], np.arange(len(tags) + 1))
+    tag_articles = article_index[by_tag]
+    sizes = np.diff(article_ptr)
+
+    new_rows = []
+    for i, article_id in enumerate(articles.tolist()):
+        own_tags = article_tags[article_ptr[i]:article_ptr[i + 1]]
+        candidates = np.concatenate([tag_articles[tag_ptr[t]:tag_ptr[t + 1]] for t in own_tags])
+        candidates = candidates[candidates != i]
+        if len(candidates) == 0:
+            continue
+        candidates, intersections = np.unique(candidates, return_counts=True)
+        related, scores = top_k(sizes[i], candidates, intersections, sizes[candidates],
+                                config['RELATED_TOP_K'], config['RELATED_MEASURE'])
+        new_rows.extend(_rows(article_id, articles[related], scores))
+    db.session.query(RelatedArticle).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(RelatedArticle, new_rows)
+    db.session.commit()
+    return len(articles)
+
+
+# 只重新计算一篇文章的近邻，用两次聚合查询取得交集大小和候选文章的标签数
+def _compute_for(article_id):
+    import numpy as np
+    config = current_app.config
+    own_tags = select(tagging.c.tag_id).where(tagging.c.article_id == article_id).scalar_subquery()
+    size = db.session.query(func.count(func.distinct(tagging.c.tag_id))) \
+        .filter(tagging.c.article_id == article_id).scalar()
+    overlap = db.session.query(tagging.c.article_id, func.count(func.distinct(tagging.c.tag_id))) \
+        .filter(tagging.c.tag_id.in_(own_tags), tagging.c.article_id != article_id) \
+        .group_by(tagging.c.article_id).all()
+    if not size or not overlap:
+        return []
+    candidates = np.array([row[0] for row in overlap], dtype=np.int64)
+    intersections = np.array([row[1] for row in overlap], dtype=np.float64)
+    candidate_sizes = dict(db.session.query(tagging.c.article_id, func.count(func.distinct(tagging.c.tag_id)))
+                           .filter(tagging.c.article_id.in_(candidates.tolist()))
+                           .group_by(tagging.c.article_id).all())
+    sizes = np.array([candidate_sizes[c] for c in candidates.tolist()], dtype=np.float64)
+    related, scores = top_k(size, candidates, intersections, sizes,
+                            config['RELATED_TOP_K'], config['RELATED_MEASURE'])
+    return _rows(article_id, related, scores)
+
+
+# 增量刷新：标签变化的文章本身，它新的近邻（相似度是对称的），以及原先把它列为近邻的文章
+def refresh_related_for(article_id):
+    previous = [row[0] for row in db.session.query(RelatedArticle.article_id)
+                .filter(RelatedArticle.related_id == article_id).all()]
+    rows = _compute_for(article_id)
+    affected = [article_id] + sorted(set(previous) | {row['related_id'] for row in rows})
+    new_rows = rows
+    for other_id in affected[1:]:
+        new_rows = new_rows + _compute_for(other_id)
+    _replace_rows(affected, new_rows)
+    db.session.commit()
+
+
+@article_tags_changed.connect
+def on_article_tags_changed(sender, article, **kwargs):
+    if current_app.config['RELATED_INCREMENTAL']:
+        refresh_related_for(article.id)
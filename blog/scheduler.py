@@ -0,0 +1,46 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+# defer()之后start_periodic只登记任务，由start_deferred()在fork出的worker中启动
+_deferred = None
+
+
+# 在后台守护线程中每隔interval秒在应用上下文里执行一次func，异常只记录日志，不会终止线程。
+# per_process为True的任务统计的是本进程的状态（例如内存跟踪的日志），每个worker都要运行；
+# 其余任务（重算热门、清除文章、数据库维护）读写的是共享的数据库，多个worker只需要一个运行
+def start_periodic(app, name, interval, func, per_process=False):
+    if _deferred is not None:
+        _deferred.append((app, name, interval, func, per_process))
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    func()
+                except Exception:
+                    logger.exception('periodic job %s failed', name)
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+# 在master中创建应用再fork时（blog.prefork、gunicorn的preload_app），master不能启动定时任务的线程：master不处理请求，
+# 而且fork时其他线程可能正持有锁。创建应用前调用defer()，fork之后在worker中调用start_deferred()
+def defer():
+    global _deferred
+    if _deferred is None:
+        _deferred = []
+
+
+# 启动登记的任务：primary为True的worker启动全部任务，其他worker只启动per_process的任务
+def start_deferred(primary):
+    global _deferred
+    jobs, _deferred = _deferred or [], None
+    for app, name, interval, func, per_process in jobs:
+        if primary or per_process:
+            start_periodic(app, name, interval, func, per_process)
@@ -25,17 +25,156 @@ class BaseConfig(object):
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = ('cansu', os.getenv('MAIL_USERNAME'))
     BLOG_MAIL_SUBJECT_PREFIX = '[BLOG]'
+    # 为True时即使不在flask命令行中也初始化Flask-Migrate
+    MIGRATE_ALWAYS = False
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'jwt-secret-string')
+    # ASGI模式：推送事件流时轮询event_log用的aiosqlite连接池大小、执行WSGI请求的线程数
+    ASGI_DB_POOL_SIZE = int(os.getenv('ASGI_DB_POOL_SIZE', 10))
+    ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', 32))
+    # 写合并：开启后并发的收藏/关注切换在等待窗口（秒）内合并为一个事务提交
+    WRITE_COALESCE = os.getenv('WRITE_COALESCE', 'false').lower() == 'true'
+    WRITE_COALESCE_WINDOW = 0.005
+    WRITE_COALESCE_MAX_BATCH = 100
+    # 个人资料缓存的容量与过期时间（秒）
+    PROFILE_CACHE_SIZE = 1024
+    PROFILE_CACHE_TTL = 60
+    # 热门文章：统计窗口与半衰期（小时）、收藏和评论的权重、快照保留的文章数，
+    # 后台重算间隔（秒，0表示不启动后台线程，改用flask trending-refresh定时执行），
+    # 两次重算之间把新的收藏、评论批量累加到快照分数上的间隔（秒），只在设置了后台重算间隔时生效
+    TRENDING_WINDOW_HOURS = 72
+    TRENDING_HALF_LIFE_HOURS = 12
+    TRENDING_FAVORITE_WEIGHT = 1.0
+    TRENDING_COMMENT_WEIGHT = 2.0
+    TRENDING_SIZE = 500
+    TRENDING_REFRESH_INTERVAL = int(os.getenv('TRENDING_REFRESH_INTERVAL', 0))
+    TRENDING_INCREMENTAL = True
+    TRENDING_FLUSH_INTERVAL = 5
+    # 推荐关注：内存关注图的重建间隔（秒）、触发合并的增量条数，二度好友与收藏作者的权重
+    FOLLOW_GRAPH_TTL = 300
+    FOLLOW_GRAPH_MAX_DELTA = 10000
+    SUGGEST_FOF_WEIGHT = 1.0
+    SUGGEST_FAVORITE_WEIGHT = 0.5
+    # 相关文章：每篇保留的近邻数、相似度（jaccard或cosine）、是否在标签变化时增量刷新
+    RELATED_TOP_K = 10
+    RELATED_MEASURE = 'jaccard'
+    RELATED_INCREMENTAL = True
+    # 软删除：删除文章时只做标记，由后台线程（间隔秒数，0为不启动，改用flask articles-purge）
+    # 清除删除超过ARTICLE_PURGE_DELAY秒的文章，每轮最多ARTICLE_PURGE_LIMIT篇，子表每批删除ARTICLE_PURGE_BATCH行
+    ARTICLE_SOFT_DELETE = os.getenv('ARTICLE_SOFT_DELETE', 'false').lower() == 'true'
+    ARTICLE_PURGE_INTERVAL = int(os.getenv('ARTICLE_PURGE_INTERVAL', 0))
+    ARTICLE_PURGE_DELAY = 0
+    ARTICLE_PURGE_LIMIT = 100
+    ARTICLE_PURGE_BATCH = 1000
+    # 文章和评论正文的压缩存储（仅SQLite）：None为不压缩，可选zlib或zstd（需要安装zstandard，
+    # 可用flask body-train-dict训练字典并通过BODY_ZSTD_DICT指定），短于BODY_COMPRESS_MIN_BYTES字节的正文不压缩
+    BODY_COMPRESSION = os.getenv('BODY_COMPRESSION') or None
+    BODY_COMPRESS_MIN_BYTES = 256
+    BODY_ZLIB_LEVEL = 6
+    BODY_ZSTD_LEVEL = 3
+    BODY_ZSTD_DICT = os.getenv('BODY_ZSTD_DICT') or None
+    # 管理接口的令牌（请求头X-Admin-Token），为空时管理接口不可用
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+    # 性能剖析：开启后带X-Profile-Token（等于ADMIN_TOKEN）的请求以及按比例抽样的请求会被剖析，
+    # 模式为cprofile或sampler（采样间隔秒），文件保存在PROFILE_DIR（默认instance/profiles）中，只保留最新的PROFILE_KEEP个
+    PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', 'false').lower() == 'true'
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_MODE = os.getenv('PROFILE_MODE', 'cprofile')
+    PROFILE_SAMPLE_INTERVAL = 0.001
+    PROFILE_DIR = os.getenv('PROFILE_DIR') or None
+    PROFILE_KEEP = 200
+    # 请求的数据库截止时间（毫秒，0为不限制），SQLite每执行REQUEST_DEADLINE_CHECK_OPS条虚拟机指令检查一次
+    REQUEST_DEADLINE_MS = int(os.getenv('REQUEST_DEADLINE_MS', 0))
+    REQUEST_DEADLINE_CHECK_OPS = 1000
+    # 新评论、新文章推送（SSE）：轮询event_log的间隔、保活注释的间隔、单个连接的最长时间（秒），
+    # 客户端重连等待（毫秒），每个连接的事件队列长度，事件保留时间与清除间隔（秒）。
+    # 开启后每次发表文章、评论都要多写一条event_log，默认关闭
+    SSE_ENABLED = os.getenv('SSE_ENABLED', 'false').lower() == 'true'
+    SSE_POLL_INTERVAL = 0.5
+    SSE_KEEPALIVE = 15
+    SSE_MAX_STREAM = 300
+    SSE_RETRY_MS = 3000
+    SSE_QUEUE_SIZE = 100
+    SSE_EVENT_TTL = 3600
+    SSE_PRUNE_INTERVAL = 60
+    # 批量读取接口一次最多查询的条目数
+    BATCH_MAX_ITEMS = 100
+    # 响应压缩：按Accept-Encoding协商（br需要安装brotli），小于COMPRESS_MIN_BYTES字节的响应不压缩，
+    # 带ETag的响应压缩结果缓存COMPRESS_CACHE_SIZE条、COMPRESS_CACHE_TTL秒
+    COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', 'true').lower() == 'true'
+    COMPRESS_ALGORITHMS = ['br', 'gzip']
+    COMPRESS_MIMETYPES = ['application/json']
+    COMPRESS_MIN_BYTES = 1024
+    COMPRESS_GZIP_LEVEL = 6
+    COMPRESS_BR_QUALITY = 5
+    COMPRESS_CACHE_SIZE = 512
+    COMPRESS_CACHE_TTL = 300
+    # 为False时API请求的会话commit后不让已加载的对象过期，提交后读取刚写入的对象不再重新SELECT
+    SESSION_EXPIRE_ON_COMMIT = os.getenv('SESSION_EXPIRE_ON_COMMIT', 'false').lower() == 'true'
+    # 在线迁移的分块回填：每块的行数、块之间暂停的秒数（让出写锁给API请求），以及进度日志的间隔（秒）
+    MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', 1000))
+    MIGRATION_BATCH_PAUSE = float(os.getenv('MIGRATION_BATCH_PAUSE', 0.01))
+    MIGRATION_PROGRESS_INTERVAL = 5
+    # 文章列表组合多个过滤条件（tag、author、favorited）时使用内存中的文章索引，索引每隔ARTICLE_INDEX_TTL秒从数据库重建
+    ARTICLE_INDEX_ENABLED = os.getenv('ARTICLE_INDEX_ENABLED', 'true').lower() == 'true'
+    ARTICLE_INDEX_TTL = 300
+    # 分配slug时与并发的请求冲突后最多重试几次
+    SLUG_MAX_ATTEMPTS = 5
+    # 限流（默认关闭）：令牌桶表所在的mmap文件（默认在instance目录下，同一台机器上的worker共享）与槽位数，
+    # RATE_LIMITS按端点配置限额，范围为ip或user（未登录时按ip），限额格式为“次数/second|minute|hour|day”。
+    # 部署在反向代理之后时把RATE_LIMIT_TRUSTED_PROXIES设为代理的层数，否则所有请求的地址都是代理的地址
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'false').lower() == 'true'
+    RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv('RATE_LIMIT_TRUSTED_PROXIES', 0))
+    RATE_LIMIT_FILE = os.getenv('RATE_LIMIT_FILE')
+    RATE_LIMIT_SLOTS = 65536
+    RATE_LIMITS = {
+        'users.user_login': {'ip': '10/minute'},
+        'users.user_reg': {'ip': '20/hour'},
+        'articles.article_create': {'user': '30/hour'},
+        'articles.article_comment': {'user': '20/minute', 'ip': '60/minute'},
+    }
+    # SQLite维护（flask db-maintenance或后台线程）：后台线程每MAINTENANCE_CHECK_INTERVAL秒检查一次，距上次维护超过
+    # MAINTENANCE_INTERVAL秒（0为不启动后台线程）且worker已空闲MAINTENANCE_IDLE_SECONDS秒时执行；
+    # ANALYZE每个索引最多扫描MAINTENANCE_ANALYSIS_LIMIT行，WAL超过MAINTENANCE_WAL_TRUNCATE_BYTES字节时截断，
+    # 每次最多回收MAINTENANCE_VACUUM_PAGES个空闲页
+    MAINTENANCE_INTERVAL = int(os.getenv('MAINTENANCE_INTERVAL', 0))
+    MAINTENANCE_CHECK_INTERVAL = 30
+    MAINTENANCE_IDLE_SECONDS = 10
+    MAINTENANCE_ANALYSIS_LIMIT = 400
+    MAINTENANCE_CHECKPOINT_MODE = 'PASSIVE'
+    MAINTENANCE_WAL_TRUNCATE_BYTES = 64 * 1024 * 1024
+    MAINTENANCE_VACUUM_PAGES = 1000
+    # 流量记录：按CAPTURE_SAMPLE_RATE抽样，把请求的元数据写入JSONL文件（{pid}替换为进程号，默认在instance目录下），
+    # 文件达到CAPTURE_MAX_BYTES字节后轮转，CAPTURE_REDACT_ARGS中的查询参数只记录参数名
+    CAPTURE_ENABLED = os.getenv('CAPTURE_ENABLED', 'false').lower() == 'true'
+    CAPTURE_FILE = os.getenv('CAPTURE_FILE')
+    CAPTURE_SAMPLE_RATE = 1.0
+    CAPTURE_MAX_BYTES = 64 * 1024 * 1024
+    CAPTURE_BACKUP_COUNT = 5
+    CAPTURE_REDACT_ARGS = ('token', 'access_token', 'password', 'email')
+    # 内存分配跟踪（tracemalloc，开启后请求串行执行，只用于排查）：保存MEMTRACK_FRAMES层调用栈，
+    # 列出增长最多的MEMTRACK_TOP个分配位置，每MEMTRACK_LOG_INTERVAL秒写一次日志（0为不写）
+    MEMTRACK_ENABLED = os.getenv('MEMTRACK_ENABLED', 'false').lower() == 'true'
+    MEMTRACK_FRAMES = 10
+    MEMTRACK_TOP = 20
+    MEMTRACK_LOG_INTERVAL = int(os.getenv('MEMTRACK_LOG_INTERVAL', 0))
 
 
 class DevelopmentConfig(BaseConfig):
     SQLALCHEMY_DATABASE_URI = prefix + os.path.join(basedir, 'data.db')
 
 
+# 测试用的配置，数据库由测试在创建应用之后指向临时文件（见tests/conftest.py）
+class TestingConfig(BaseConfig):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    # 测试期间应用上下文一直推入，请求共用同一个上下文，记录的查询会一直累积
+    SQLALCHEMY_RECORD_QUERIES = False
+
+
 class Operations:
     CONFIRM = 'confirm'
     RESET_PASSWORD = 'reset-password'
     CHANGE_EMAIL = 'change-email'
 
 
-config = {'development': DevelopmentConfig}
+config = {'development': DevelopmentConfig, 'testing': TestingConfig}
@@ -0,0 +1,18 @@
+from blinker import Namespace
+
+# 应用内的信号，写操作成功后发出，热门分数、索引等订阅者据此增量更新
+signals = Namespace()
+
+# sender为收藏者，参数article
+article_collected = signals.signal('article-collected')
+# sender为取消收藏的用户，参数article
+article_uncollected = signals.signal('article-uncollected')
+# sender为作者，发表新文章后发出，参数article
+article_published = signals.signal('article-published')
+# sender为作者，文章创建、删除或标签被修改后发出，参数article
+article_tags_changed = signals.signal('article-tags-changed')
+# sender为评论者，参数comment
+comment_posted = signals.signal('comment-posted')
+# sender为关注者，参数user为被关注的用户
+user_followed = signals.signal('user-followed')
+user_unfollowed = signals.signal('user-unfollowed')
@@ -0,0 +1,70 @@
+import sqlite3
+
+from flask import current_app
+from slugify import slugify
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from blog.estensions import db
+from blog.models import Article
+
+
+# 一次范围查询取出base本身和所有以“base-”开头的slug，都走slug的唯一索引：'.'是'-'后面的下一个字符，
+# [base-, base.)恰好覆盖所有带后缀的候选，不用逐个试探-2、-3……
+def taken_slugs(base, exclude_id=None):
+    rows = db.session.query(Article.id, Article.slug) \
+        .filter(or_(Article.slug == base, Article.slug.between(base + '-', base + '.'))) \
+        .execution_options(include_deleted=True).all()
+    return {slug for article_id, slug in rows if article_id != exclude_id}
+
+
+# 为标题分配一个未被占用的slug：优先用标题本身的slug，被占用时取最小的可用数字后缀base-2、base-3……
+# skip为本次请求已经试过、提交时发生冲突的slug
+def allocate_slug(title, exclude_id=None, skip=()):
+    base = slugify(title) or 'article'
+    # 会话中待提交的文章不必在探测前先flush
+    with db.session.no_autoflush:
+        taken = taken_slugs(base, exclude_id) | set(skip)
+    if base not in taken:
+        return base
+    suffix = 2
+    while '%s-%d' % (base, suffix) in taken:
+        suffix += 1
+    return '%s-%d' % (base, suffix)
+
+
+# pysqlite直到第一条INSERT/UPDATE/DELETE之前才隐式开始事务，SAVEPOINT之前不会开启事务：
+# 新建文章时会话还没有写过任何东西，begin_nested()发出的就成了最外层的保存点，RELEASE即提交，
+# 文章在标签写入、请求提交之前就已经落库。保存点之前先在会话的连接上显式开始事务，
+# 用IMMEDIATE直接取得写锁（新建、修改文章本来就要写），不会在读锁升级为写锁时与其他写事务互相等待出错
+def _begin_outer_transaction():
+    dbapi_connection = db.session.connection().connection.dbapi_connection
+    if isinstance(dbapi_connection, sqlite3.Connection) and not dbapi_connection.in_transaction:
+        dbapi_connection.execute('BEGIN IMMEDIATE')
+
+
+# 设置文章的slug并在保存点中flush。两个请求并发地分配到同一个slug时，后flush的一方违反唯一约束，
+# 只回滚这个保存点，换下一个候选重试，会话中的其他修改不受影响；重试SLUG_MAX_ATTEMPTS次后仍冲突则抛出。
+# 保存点嵌在会话的事务中，释放保存点并不提交，之后的修改出错时文章随整个事务一起回滚。
+# 新建的文章应在加入会话之前调用（不要先设置author、tagList这类会把它级联进会话的关系属性），
+# 开启保存点时的flush就不会先插入一行slug为空的文章，保存点中的第一次flush即为带着slug的INSERT
+def assign_slug(article, title):
+    tried = []
+    _begin_outer_transaction()
+    for attempt in range(current_app.config['SLUG_MAX_ATTEMPTS']):
+        # 开启保存点时会先flush会话中已有的修改，slug要在保存点开启之后再设置
+        savepoint = db.session.begin_nested()
+        # 回滚保存点会让文章的属性过期，试过的候选保存在局部变量中
+        candidate = allocate_slug(title, exclude_id=article.id, skip=tried)
+        article.slug = candidate
+        db.session.add(article)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            savepoint.rollback()
+            tried.append(candidate)
+            if attempt + 1 == current_app.config['SLUG_MAX_ATTEMPTS']:
+                raise
+        else:
+            savepoint.commit()
+            return candidate
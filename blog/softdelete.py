@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, delete, select
+from sqlalchemy.orm import with_loader_criteria
+
+from blog.estensions import db
+from blog.models import Article, Comment, Collect
+from blog.scheduler import start_periodic
+
+
+# 开启软删除后，所有ORM查询自动加上 deletedAt IS NULL 的条件，
+# 需要查到已删除文章的查询（例如清除任务）设置执行选项include_deleted=True
+@event.listens_for(db.session, 'do_orm_execute')
+def _hide_deleted_articles(execute_state):
+    if not execute_state.is_select or execute_state.execution_options.get('include_deleted', False):
+        return
+    if current_app.config['ARTICLE_SOFT_DELETE']:
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(Article, Article.deletedAt.is_(None), include_aliases=True))
+
+
+# 软删除只标记时间并释放slug（slug唯一，同名文章可以马上重新发布），评论、收藏等留给清除任务处理
+def soft_delete_article(article):
+    article.deletedAt = datetime.utcnow()
+    article.slug = None
+    db.session.add(article)
+    db.session.commit()
+
+
+# 按主键分批删除文章的评论和收藏，每批单独提交，避免一个大事务长时间占用SQLite的写锁
+def _purge_children(article_id, batch_size):
+    batches = [
+        (select(Comment.id).where(Comment.article_id == article_id),
+         lambda ids: delete(Comment).where(Comment.id.in_(ids))),
+        (select(Collect.collector_id).where(Collect.collected_id == article_id),
+         lambda ids: delete(Collect).where(Collect.collected_id == article_id, Collect.collector_id.in_(ids))),
+    ]
+    for ids_stmt, delete_stmt in batches:
+        while True:
+            ids = db.session.execute(ids_stmt.limit(batch_size)).scalars().all()
+            if not ids:
+                break
+            db.session.execute(delete_stmt(ids))
+            db.session.commit()
+
+
+# 清除软删除超过ARTICLE_PURGE_DELAY秒的文章：先分批删掉量大的子表，
+# 再删除文章本身，标签关联、热门和相关文章的记录由外键的ON DELETE CASCADE一并删除。返回清除的文章数
+def purge_deleted_articles(limit=None):
+    config = current_app.config
+    before = datetime.utcnow() - timedelta(seconds=config['ARTICLE_PURGE_DELAY'])
+    article_ids = db.session.execute(
+        select(Article.id).where(Article.deletedAt.isnot(None),
+                                 Article.deletedAt <= before)
+        .order_by(Article.deletedAt).limit(limit or config['ARTICLE_PURGE_LIMIT']),
+        execution_options={'include_deleted': True}).scalars().all()
+    for article_id in article_ids:
+        _purge_children(article_id, config['ARTICLE_PURGE_BATCH'])
+        db.session.execute(delete(Article).where(Article.id == article_id))
+        db.session.commit()
+    return len(article_ids)
+
+
+def init_soft_delete(app):
+    if app.config['ARTICLE_SOFT_DELETE'] and app.config['ARTICLE_PURGE_INTERVAL']:
+        start_periodic(app, 'article-purge', app.config['ARTICLE_PURGE_INTERVAL'], purge_deleted_articles)
@@ -0,0 +1,139 @@
+import math
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, func, update, bindparam
+
+from blog.estensions import db
+from blog.models import Collect, Comment, TrendingArticle
+from blog.signals import article_collected, comment_posted
+from blog.scheduler import start_periodic
+from blog.writebatch import insert_ignore
+
+
+# 计算时间衰减后的热度分数：窗口内每次收藏/评论的权重按半衰期指数衰减，
+# 分数折算到now这一时刻，返回按分数从高到低排好的(文章id数组, 分数数组)
+def compute_scores(now=None):
+    import numpy as np
+    config = current_app.config
+    now = now or datetime.utcnow()
+    since = now - timedelta(hours=config['TRENDING_WINDOW_HOURS'])
+    events = [
+        (select(Collect.collected_id, Collect.timestamp).where(Collect.timestamp >= since),
+         config['TRENDING_FAVORITE_WEIGHT']),
+        (select(Comment.article_id, Comment.createAt).where(Comment.createAt >= since),
+         config['TRENDING_COMMENT_WEIGHT']),
+    ]
+    ids, weights = [], []
+    for stmt, weight in events:
+        rows = db.session.execute(stmt).all()
+        if not rows:
+            continue
+        article_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        times = np.array([row[1] for row in rows], dtype='datetime64[us]')
+        age_hours = (np.datetime64(now, 'us') - times) / np.timedelta64(1, 'h')
+        ids.append(article_ids)
+        weights.append(weight * np.exp2(-age_hours / config['TRENDING_HALF_LIFE_HOURS']))
+    if not ids:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    ids = np.concatenate(ids)
+    weights = np.concatenate(weights)
+    # 按文章聚合：先把文章id压缩成连续下标，再用bincount按权重求和
+    unique_ids, inverse = np.unique(ids, return_inverse=True)
+    scores = np.bincount(inverse, weights=weights)
+    order = np.argsort(-scores, kind='stable')[:config['TRENDING_SIZE']]
+    return unique_ids[order], scores[order]
+
+
+# 全量重算并整体替换快照表，返回快照中的文章数
+def refresh_trending(now=None):
+    now = now or datetime.utcnow()
+    article_ids, scores = compute_scores(now)
+    db.session.query(TrendingArticle).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(TrendingArticle, [
+        {'article_id': int(article_id), 'score': float(score), 'computedAt': now}
+        for article_id, score in zip(article_ids, scores)])
+    db.session.commit()
+    return len(article_ids)
+
+
+# 两次重算之间的增量更新：收藏、评论的请求中只把事件记在本进程的内存里，不查询也不提交，
+# 由flush_scores定时在一个事务中批量累加到快照的分数上
+def bump_score(article_id, weight, now=None):
+    state = current_app.extensions['trending']
+    with state['lock']:
+        state['events'].append((article_id, weight, now or datetime.utcnow()))
+
+
+# 没能写入的事件放回队首，下次按当时的快照重新折算
+def _requeue(state, events):
+    with state['lock']:
+        state['events'][:0] = events
+
+
+def _snapshot_time():
+    return db.session.query(func.max(TrendingArticle.computedAt)).scalar()
+
+
+# 把积累的事件按文章合并，权重折算到快照的参考时间后累加到分数上，返回更新的文章数。
+# 折算的倍数随距离快照的时间指数增长，只有定时重算快照时才启用（见init_trending），倍数不会超过重算间隔对应的值。
+# 发生在快照计算时间之前的事件已经计入了快照（包括其他worker重算的快照），直接丢弃；
+# 还没有快照时事件留在队列中，等第一次重算之后再写入
+def flush_scores():
+    state = current_app.extensions['trending']
+    with state['lock']:
+        events, state['events'] = state['events'], []
+    if not events:
+        return 0
+    computed_at = _snapshot_time()
+    if computed_at is None:
+        _requeue(state, events)
+        return 0
+    half_life = current_app.config['TRENDING_HALF_LIFE_HOURS']
+    deltas = {}
+    for article_id, weight, at in events:
+        if at <= computed_at:
+            continue
+        hours = (at - computed_at).total_seconds() / 3600
+        deltas[article_id] = deltas.get(article_id, 0) + weight * math.pow(2, hours / half_life)
+    if not deltas:
+        return 0
+    table = TrendingArticle.__table__
+    db.session.execute(insert_ignore(table, article_id=bindparam('row_id'), score=0, computedAt=computed_at),
+                       [{'row_id': article_id} for article_id in deltas])
+    db.session.execute(update(table).where(table.c.article_id == bindparam('row_id'))
+                       .values(score=table.c.score + bindparam('delta')),
+                       [{'row_id': article_id, 'delta': delta} for article_id, delta in deltas.items()])
+    # 写入之前快照被其他进程重算替换了，这些增量是按旧快照折算的，回滚后按新快照重新折算
+    if _snapshot_time() != computed_at:
+        db.session.rollback()
+        _requeue(state, events)
+        return 0
+    db.session.commit()
+    return len(deltas)
+
+
+@article_collected.connect
+def on_article_collected(sender, article, **kwargs):
+    if current_app.extensions['trending']['incremental']:
+        bump_score(article.id, current_app.config['TRENDING_FAVORITE_WEIGHT'])
+
+
+@comment_posted.connect
+def on_comment_posted(sender, comment, **kwargs):
+    if current_app.extensions['trending']['incremental']:
+        bump_score(comment.article_id, current_app.config['TRENDING_COMMENT_WEIGHT'])
+
+
+def init_trending(app):
+    config = app.config
+    # 增量更新以最近一次重算的快照为基准，快照不再重算时折算倍数会无限增长，只在定时重算时启用
+    incremental = bool(config['TRENDING_INCREMENTAL'] and config['TRENDING_REFRESH_INTERVAL']
+                       and config['TRENDING_FLUSH_INTERVAL'])
+    app.extensions['trending'] = {'lock': threading.Lock(), 'events': [], 'incremental': incremental}
+    if config['TRENDING_REFRESH_INTERVAL']:
+        start_periodic(app, 'trending-refresh', config['TRENDING_REFRESH_INTERVAL'], refresh_trending)
+    # 事件记在各个进程自己的内存中，每个worker都要写入
+    if incremental:
+        start_periodic(app, 'trending-flush', config['TRENDING_FLUSH_INTERVAL'], flush_scores, per_process=True)
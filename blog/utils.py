@@ -1,7 +1,6 @@
-from flask import current_app
+from flask import current_app, jsonify
 from itsdangerous import TimedSerializer as Serializer
-from flask_mail import Message
-from blog.estensions import mail
+from blog.estensions import get_mail
 from itsdangerous import BadSignature, SignatureExpired
 from blog.estensions import db
 from blog.settings import Operations
@@ -50,10 +49,25 @@ def validate_token(user, token, operation):
 # 发送邮件的通用发信函数
 
 def send_mail(subject, to, body, template, **kwargs):
+    from flask_mail import Message
     message = Message(subject, recipients=[to], body=body)
-    mail.send(message)
+    get_mail().send(message)
 
 
 # 发送确认邮件
 def send_confirm_email(user, token, to=None):
     send_mail(subject='注册', to=to or user.email, template='confirm', user=user, token=token)
+
+
+# 批量接口一次请求的条目数超过BATCH_MAX_ITEMS
+def too_many_items_response():
+    ret_data = {
+        "code": 10011,
+        "errors": {
+            "body": [
+                "最多%d条" % current_app.config['BATCH_MAX_ITEMS']
+            ]
+        },
+        "message": "too many items"
+    }
+    return jsonify(ret_data)
@@ -0,0 +1,119 @@
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import insert, delete, and_
+from sqlalchemy.dialects import sqlite, postgresql
+
+from blog.estensions import db
+
+
+# 幂等的插入语句：主键已存在时什么都不做（SQLite/PostgreSQL为ON CONFLICT DO NOTHING，MySQL为INSERT IGNORE）
+def insert_ignore(table, **values):
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return sqlite.insert(table).values(**values).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        return postgresql.insert(table).values(**values).on_conflict_do_nothing()
+    return insert(table).values(**values).prefix_with('IGNORE')
+
+
+# 幂等的删除语句：按复合主键删除，记录不存在时影响0行
+def delete_by_pk(table, **values):
+    return delete(table).where(and_(*[table.c[name] == value for name, value in values.items()]))
+
+
+# 执行一条写语句并返回影响的行数。开启写合并时交给合并队列，和其他并发的写一起在一个事务中提交
+def run_write(stmt):
+    coalescer = current_app.extensions.get('write_coalescer')
+    if coalescer is None:
+        rowcount = db.session.execute(stmt).rowcount
+        db.session.commit()
+    else:
+        rowcount = coalescer.submit(stmt)
+    # 核心语句绕过了identity map（合并写时还是在另外的连接上提交的），会话中已加载的关系属性需要重新加载；
+    # 会话关闭了expire_on_commit时commit不会替我们做这件事
+    db.session.expire_all()
+    return rowcount
+
+
+class _Pending(object):
+
+    def __init__(self, stmt):
+        self.stmt = stmt
+        # 语句执行完，或者被指定为下一个leader时唤醒等待的线程
+        self.wake = threading.Event()
+        self.finished = False
+        self.error = None
+        self.rowcount = 0
+
+
+# 写合并队列：第一个到达的线程成为leader，等待一个很短的窗口收集其他线程提交的语句，
+# 然后在一个事务中执行整批语句并唤醒等待的线程，把大量细小的SQLite写事务合并成一次提交。
+# leader只处理到包含自己语句的那一批为止，之后把leader交给队列中最早的等待者，
+# 持续有写请求时也不会让某一个请求线程一直替别人提交而无法返回
+class WriteCoalescer(object):
+
+    def __init__(self, window=0.005, max_batch=100):
+        self.window = window
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._pending = []
+        self._leader = False
+
+    def submit(self, stmt):
+        item = _Pending(stmt)
+        with self._lock:
+            self._pending.append(item)
+            is_leader = not self._leader
+            if is_leader:
+                self._leader = True
+        if not is_leader:
+            item.wake.wait()
+        if not item.finished:
+            # 第一个到达的线程先等待窗口收集语句；接手的leader面前已经有排队的语句，直接开始
+            self._lead(item, wait=is_leader)
+        if item.error is not None:
+            raise item.error
+        return item.rowcount
+
+    def _lead(self, item, wait):
+        if wait:
+            time.sleep(self.window)
+        while not item.finished:
+            with self._lock:
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+            self._flush(batch)
+        with self._lock:
+            if self._pending:
+                # 队首的语句还没有执行，它的线程仍在等待，唤醒后由它接着处理
+                self._pending[0].wake.set()
+            else:
+                self._leader = False
+
+    def _flush(self, batch):
+        try:
+            with db.engine.begin() as conn:
+                for item in batch:
+                    item.rowcount = conn.execute(item.stmt).rowcount
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].error = e
+            else:
+                # 整批回滚后逐条在各自的事务中重试，只有出错的那条语句把错误报告给它的请求
+                for item in batch:
+                    try:
+                        with db.engine.begin() as conn:
+                            item.rowcount = conn.execute(item.stmt).rowcount
+                    except Exception as item_error:
+                        item.error = item_error
+        for item in batch:
+            item.finished = True
+            item.wake.set()
+
+
+def init_write_coalescer(app):
+    if app.config['WRITE_COALESCE']:
+        app.extensions['write_coalescer'] = WriteCoalescer(window=app.config['WRITE_COALESCE_WINDOW'],
+                                                           max_batch=app.config['WRITE_COALESCE_MAX_BATCH'])
@@ -0,0 +1,12 @@
+# gunicorn的入口，配置见blog/gunicorn_conf.py: gunicorn -c blog/gunicorn_conf.py blog.wsgi:app
+# 配置中开启了preload_app，master导入本模块一次，创建并预热应用（与blog.prefork的预加载相同）后再fork出worker。
+# 创建应用期间关掉gc，避免回收过程改写对象头；gc.freeze把这些长期存活的对象移到永久代，
+# 之后master和worker中的gc都不再扫描它们，worker与master按写时复制共享这些页面
+import gc
+
+from blog.prefork import load_app
+
+gc.disable()
+app = load_app()
+gc.freeze()
+gc.enable()
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from blog import create_app
+from blog.estensions import db
+from blog.settings import config, TestingConfig
+
+
+# 创建使用临时SQLite数据库的应用并推入应用上下文。创建应用时就要读取的配置（例如是否开启限流、写合并）
+# 通过参数传入，其余配置可以在测试中直接修改app.config
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    contexts = []
+
+    def make_app(**overrides):
+        overrides.setdefault('RATE_LIMIT_FILE', str(tmp_path / 'ratelimit.bin'))
+        monkeypatch.setitem(config, 'testing', type('TestConfig', (TestingConfig,), overrides))
+        app = create_app('testing')
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / 'test.db')
+        context = app.app_context()
+        context.push()
+        contexts.append(context)
+        db.create_all()
+        return app
+
+    yield make_app
+    for context in reversed(contexts):
+        db.session.remove()
+        db.engine.dispose()
+        context.pop()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+# 注册并登录一个用户，返回保持着登录会话的测试客户端
+@pytest.fixture
+def login(app):
+    def login(username):
+        client = app.test_client()
+        client.post('/api/users', data=json.dumps(
+            {'user': {'email': username + '@x.com', 'username': username, 'password': 'pw'}}))
+        response = client.post('/api/users/login', json={'user': {'email': username + '@x.com', 'password': 'pw'}})
+        assert response.json['code'] == 10000
+        return client
+    return login
+
+
+def create_article(client, title, tags=(), body='body'):
+    response = client.post('/api/articles', data=json.dumps(
+        {'article': {'title': title, 'description': 'd', 'body': body, 'tagList': list(tags)}}))
+    assert response.json['code'] == 10000, response.json
+    return response.json['data']['article']['slug']
@@ -0,0 +1,49 @@
+import gzip
+
+from blog.models import Tag
+from blog.estensions import db
+from tests.conftest import create_article
+
+
+def test_not_modified_until_content_changes(app, login):
+    alice = login('alice')
+    create_article(alice, 'First')
+    first = alice.get('/api/articles')
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag
+
+    cached = alice.get('/api/articles', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag
+    assert cached.data == b''
+
+    create_article(alice, 'Second')
+    changed = alice.get('/api/articles', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.json['articleCount'] == 2
+
+
+def test_if_modified_since(app, login):
+    alice = login('alice')
+    create_article(alice, 'First')
+    last_modified = alice.get('/api/articles').headers['Last-Modified']
+    assert alice.get('/api/articles', headers={'If-Modified-Since': last_modified}).status_code == 304
+
+
+def test_compressed_representations_have_their_own_etag(app):
+    app.config.update(COMPRESS_ALGORITHMS=['gzip'])
+    db.session.add_all([Tag(name='tag%04d' % i) for i in range(300)])
+    db.session.commit()
+    client = app.test_client()
+    plain = client.get('/api/tags', headers={'Accept-Encoding': 'identity'})
+    compressed = client.get('/api/tags', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == plain.data
+    assert compressed.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+
+    cached = client.get('/api/tags', headers={'Accept-Encoding': 'gzip', 'If-None-Match': compressed.headers['ETag']})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == compressed.headers['ETag']
+    assert 'Accept-Encoding' in cached.headers['Vary']
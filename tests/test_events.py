@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+import pytest
+
+from blog.asgi import BlogASGI
+from blog.estensions import db
+from blog.events import publish, missed_events, prune_events, EventHub, event_stream
+from blog.models import EventLog
+from tests.conftest import create_article
+
+
+@pytest.fixture
+def sse_app(app):
+    app.config.update(SSE_ENABLED=True, SSE_POLL_INTERVAL=0.02, SSE_KEEPALIVE=0.1, SSE_MAX_STREAM=0.5)
+    return app
+
+
+def messages(body):
+    return [dict(line.split(': ', 1) for line in block.split('\n'))
+            for block in body.strip().split('\n\n') if not block.startswith((':', 'retry'))]
+
+
+def test_missed_events_filter_by_channel_and_id(app):
+    publish('article:1', 'comment', {'n': 1})
+    publish('article:2', 'comment', {'n': 2})
+    publish('article:1', 'comment', {'n': 3})
+    assert [json.loads(payload)['data'] for _, payload in missed_events(['article:1'], 0)] == [{'n': 1}, {'n': 3}]
+    assert [event_id for event_id, _ in missed_events(['article:1', 'article:2'], 1)] == [2, 3]
+
+
+def test_prune_keeps_recent_events(app):
+    app.config.update(SSE_EVENT_TTL=60)
+    publish('article:1', 'comment', {})
+    publish('article:1', 'comment', {})
+    db.session.execute(db.text("UPDATE event_log SET createdAt = '2000-01-01 00:00:00' WHERE id = 1"))
+    prune_events()
+    db.session.commit()
+    assert [row.id for row in EventLog.query.all()] == [2]
+
+
+def test_stream_replays_and_pushes_new_events(sse_app):
+    publish('article:1', 'comment', {'n': 1})
+    hub = EventHub(sse_app)
+    stream, close = event_stream(hub, ['article:1'], last_event_id=0)
+    assert next(stream) == 'retry: 3000\n\n'
+    assert next(stream) == 'id: 1\nevent: comment\ndata: {"n": 1}\n\n'
+    publish('article:2', 'comment', {'n': 2})
+    publish('article:1', 'comment', {'n': 3})
+    rest = ''.join(stream)
+    assert messages(rest) == [{'id': '3', 'event': 'comment', 'data': '{"n": 3}'}]
+    assert ': keepalive' in rest
+    # 生成器结束时取消订阅
+    assert hub._subscribers == {}
+
+
+def test_comment_stream_endpoint(sse_app, login):
+    alice = login('alice')
+    slug = create_article(alice, 'Live')
+    alice.post('/api/articles/%s/comments' % slug, json={'comment': {'body': 'before'}})
+    response = alice.get('/api/articles/%s/comments/stream' % slug, headers={'Last-Event-ID': '0'})
+    assert response.mimetype == 'text/event-stream'
+    events = messages(response.get_data(as_text=True))
+    assert [(event['event'], json.loads(event['data'])['body']) for event in events] == [('comment', 'before')]
+
+
+# ASGI模式下事件流由事件循环推送：视图返回之后不再占用执行WSGI请求的线程
+def test_asgi_stream_does_not_hold_wsgi_threads(sse_app, login):
+    sse_app.config.update(ASGI_WSGI_THREADS=1)
+    alice = login('alice')
+    slug = create_article(alice, 'Async')
+    cookie = next(c for c in alice.cookie_jar if c.name == 'session')
+    asgi = BlogASGI(sse_app)
+
+    async def call(path, headers=()):
+        sent = []
+
+        async def receive():
+            if not sent:
+                return {'type': 'http.request', 'body': b''}
+            await asyncio.sleep(10)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'http_version': '1.1',
+                 'headers': [(b'cookie', ('session=' + cookie.value).encode())] + list(headers)}
+        await asgi(scope, receive, send)
+        return sent
+
+    async def run():
+        streams = [asyncio.ensure_future(call('/api/articles/%s/comments/stream' % slug)) for _ in range(3)]
+        await asyncio.sleep(0.1)
+        tags = await asyncio.wait_for(call('/api/tags'), 1)
+        await asyncio.get_running_loop().run_in_executor(
+            None, lambda: alice.post('/api/articles/%s/comments' % slug, json={'comment': {'body': 'live'}}))
+        try:
+            return tags, await asyncio.gather(*streams)
+        finally:
+            asgi.hub.close()
+            await asgi.pool.close()
+
+    tags, streams = asyncio.run(run())
+    assert tags[0]['status'] == 200
+    for sent in streams:
+        assert sent[0]['status'] == 200
+        assert (b'content-type', b'text/event-stream; charset=utf-8') in sent[0]['headers']
+        body = b''.join(message.get('body', b'') for message in sent[1:]).decode()
+        assert [json.loads(event['data'])['body'] for event in messages(body)] == ['live']
+        assert sent[-1] == {'type': 'http.response.body', 'body': b''}
+    assert asgi.hub._subscribers == {}
@@ -0,0 +1,24 @@
+import pytest
+
+from blog.memtrack import assert_memory_bound
+from tests.conftest import create_article
+
+
+def test_article_list_memory_is_bounded(app, login):
+    alice = login('alice')
+    for i in range(20):
+        create_article(alice, 'Article %d' % i, tags=['x', 'y'], body='body ' * 200)
+    peak, net = assert_memory_bound(alice, '/api/articles?limit=20', max_peak=4 * 1024 * 1024, max_net=2048, warmup=10)
+    assert peak > 0
+
+
+def test_memory_bound_reports_growth(app):
+    leaked = []
+
+    @app.route('/leak')
+    def leak():
+        leaked.append(bytearray(64 * 1024))
+        return 'ok'
+
+    with pytest.raises(AssertionError, match='net .* bytes/request'):
+        assert_memory_bound(app.test_client(), '/leak', max_net=16 * 1024, repeat=5, warmup=1)
@@ -0,0 +1,88 @@
+from contextlib import contextmanager
+
+import pytest
+import sqlalchemy as sa
+from alembic.operations import Operations
+from alembic.runtime.migration import MigrationContext
+
+from blog.estensions import db
+from blog.migrations import online
+
+
+# 在临时数据库的连接上执行迁移辅助函数，和alembic运行迁移脚本时一样提供op
+@contextmanager
+def migration():
+    with db.engine.connect() as connection:
+        context = MigrationContext.configure(connection)
+        with Operations.context(context):
+            yield connection
+
+
+@pytest.fixture
+def items(app):
+    with db.engine.begin() as connection:
+        connection.execute(sa.text('CREATE TABLE item (id INTEGER PRIMARY KEY, old_name VARCHAR(20))'))
+        connection.execute(sa.text('INSERT INTO item (old_name) VALUES (:name)'),
+                           [{'name': 'item%d' % i} for i in range(1, 11)])
+
+
+def rows():
+    with db.engine.connect() as connection:
+        return connection.execute(sa.text('SELECT id, old_name, new_name FROM item ORDER BY id')).all()
+
+
+def test_add_and_drop_column_are_idempotent(items):
+    with migration() as connection:
+        online.add_column('item', sa.Column('new_name', sa.String(20)))
+        online.add_column('item', sa.Column('new_name', sa.String(20)))
+        assert online.has_column('item', 'new_name')
+        online.drop_column('item', 'new_name')
+        online.drop_column('item', 'new_name')
+        assert not online.has_column('item', 'new_name')
+        assert connection.execute(sa.text('SELECT count(*) FROM item')).scalar() == 10
+
+
+def test_backfill_in_chunks(app, items):
+    app.config.update(MIGRATION_BATCH_PAUSE=0)
+    with migration():
+        online.add_column('item', sa.Column('new_name', sa.String(20)))
+        updated = online.backfill('test_items', 'item', {'new_name': sa.column('old_name')},
+                                  where=sa.column('new_name').is_(None), batch_size=3)
+    assert updated == 10
+    assert all(old == new for _, old, new in rows())
+    # 完成后删除检查点表
+    assert not sa.inspect(db.engine).has_table(online.CHECKPOINT_TABLE)
+
+
+def test_backfill_resumes_from_checkpoint(app, items):
+    app.config.update(MIGRATION_BATCH_PAUSE=0)
+    with migration() as connection:
+        online.add_column('item', sa.Column('new_name', sa.String(20)))
+        # 上一次运行处理到id=6后中断
+        connection.execute(sa.text('CREATE TABLE alembic_backfill (name VARCHAR(128) PRIMARY KEY, '
+                                   'last_id INTEGER, max_id INTEGER)'))
+        connection.execute(sa.text("INSERT INTO alembic_backfill VALUES ('test_items', 6, 10)"))
+        updated = online.backfill('test_items', 'item', {'new_name': sa.column('old_name')}, batch_size=3)
+    assert updated == 4
+    assert [new for _, _, new in rows()] == [None] * 6 + ['item7', 'item8', 'item9', 'item10']
+
+
+def test_dual_write_keeps_columns_in_sync(items):
+    with migration() as connection:
+        online.add_column('item', sa.Column('new_name', sa.String(20)))
+        online.create_dual_write('item', 'old_name', 'new_name')
+        online.create_dual_write('item', 'new_name', 'old_name')
+        # 旧版本应用只写旧列，新版本应用只写新列
+        connection.execute(sa.text("INSERT INTO item (id, old_name) VALUES (100, 'from old')"))
+        connection.execute(sa.text("INSERT INTO item (id, new_name) VALUES (101, 'from new')"))
+        connection.execute(sa.text("UPDATE item SET old_name = 'renamed' WHERE id = 1"))
+        connection.execute(sa.text("UPDATE item SET new_name = 'renamed too' WHERE id = 2"))
+        online.drop_dual_write('item', 'old_name', 'new_name')
+        online.drop_dual_write('item', 'new_name', 'old_name')
+        connection.execute(sa.text("UPDATE item SET old_name = 'after drop' WHERE id = 3"))
+    synced = {row_id: (old, new) for row_id, old, new in rows()}
+    assert synced[100] == ('from old', 'from old')
+    assert synced[101] == ('from new', 'from new')
+    assert synced[1] == ('renamed', 'renamed')
+    assert synced[2] == ('renamed too', 'renamed too')
+    assert synced[3] == ('after drop', None)
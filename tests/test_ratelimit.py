@@ -0,0 +1,69 @@
+import pytest
+
+from blog.ratelimit import TokenBuckets, parse_limit
+
+
+@pytest.fixture
+def buckets(tmp_path):
+    return TokenBuckets(str(tmp_path / 'ratelimit.bin'), slots=64)
+
+
+def test_parse_limit():
+    assert parse_limit('10/minute') == (10, 10 / 60.0)
+    assert parse_limit('2 / second') == (2, 2.0)
+
+
+def test_bucket_allows_burst_then_refills(buckets):
+    now = 1000.0
+    assert [buckets.take('k', 3, 1.0, now)[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = buckets.take('k', 3, 1.0, now)
+    assert not allowed and retry_after == pytest.approx(1.0)
+    # 半秒后只补充了半个令牌
+    assert not buckets.take('k', 3, 1.0, now + 0.5)[0]
+    assert buckets.take('k', 3, 1.0, now + 1.0)[0]
+    # 补充不超过桶容量
+    assert [buckets.take('k', 3, 1.0, now + 100)[0] for _ in range(4)] == [True, True, True, False]
+
+
+def test_keys_are_independent(buckets):
+    assert buckets.take('a', 1, 0.1, 0.0)[0]
+    assert not buckets.take('a', 1, 0.1, 0.0)[0]
+    assert buckets.take('b', 1, 0.1, 0.0)[0]
+
+
+def test_take_all_is_all_or_nothing(buckets):
+    keys = [('ip', 5, 1.0), ('user', 1, 1.0)]
+    assert buckets.take_all(keys, 0.0) == (True, 0.0, None)
+    allowed, retry_after, rejected = buckets.take_all(keys, 0.0)
+    assert not allowed and rejected == 1 and retry_after == pytest.approx(1.0)
+    # 被拒绝的请求没有扣ip桶的令牌：还能单独取4次
+    assert [buckets.take('ip', 5, 1.0, 0.0)[0] for _ in range(5)] == [True, True, True, True, False]
+
+
+def test_buckets_are_shared_through_the_file(tmp_path):
+    path = str(tmp_path / 'shared.bin')
+    first, second = TokenBuckets(path, slots=64), TokenBuckets(path, slots=64)
+    assert first.take('k', 2, 1.0, 0.0)[0]
+    assert second.take('k', 2, 1.0, 0.0)[0]
+    assert not first.take('k', 2, 1.0, 0.0)[0]
+
+
+def test_full_probe_window_reuses_oldest_slot(tmp_path):
+    buckets = TokenBuckets(str(tmp_path / 'small.bin'), slots=2, probes=2)
+    buckets.take('a', 1, 1.0, 0.0)
+    buckets.take('b', 1, 1.0, 1.0)
+    buckets.take('c', 1, 1.0, 2.0)
+    # a所在的槽位最旧，被c占用，a重新得到一个满桶
+    assert buckets.take('a', 1, 1.0, 2.0)[0]
+
+
+def test_endpoint_limit_returns_429(make_app):
+    app = make_app(RATE_LIMIT_ENABLED=True, RATE_LIMITS={'users.user_login': {'ip': '3/minute'}})
+    client = app.test_client()
+    login = {'user': {'email': 'nobody@x.com', 'password': 'pw'}}
+    responses = [client.post('/api/users/login', json=login) for _ in range(4)]
+    assert [response.status_code for response in responses] == [200, 200, 200, 429]
+    assert responses[-1].json['code'] == 10012
+    assert int(responses[-1].headers['Retry-After']) == 20
+    # 没有配置限额的端点不受影响
+    assert client.get('/api/tags').status_code == 200
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from blog.estensions import db
+from blog.follow_graph import FollowGraph
+from blog.models import RelatedArticle
+from blog.related import top_k, refresh_related_all
+from tests.conftest import create_article
+
+
+def related(slug_ids, article_id):
+    rows = db.session.query(RelatedArticle.related_id, RelatedArticle.score) \
+        .filter(RelatedArticle.article_id == article_id).order_by(RelatedArticle.rank).all()
+    return [(slug_ids[related_id], score) for related_id, score in rows]
+
+
+def test_top_k_orders_by_similarity():
+    candidates = np.array([7, 8, 9])
+    intersections = np.array([1.0, 2.0, 2.0])
+    sizes = np.array([1.0, 2.0, 4.0])
+    # 相似度相同时按文章id排序
+    ids, scores = top_k(2, candidates, intersections, sizes, k=2)
+    assert ids.tolist() == [8, 7]
+    assert scores.tolist() == pytest.approx([1.0, 0.5])
+    ids, scores = top_k(2, candidates, intersections, sizes, k=3, measure='cosine')
+    assert ids.tolist() == [8, 7, 9]
+    assert scores.tolist() == pytest.approx([1.0, 1 / np.sqrt(2), 1 / np.sqrt(2)])
+
+
+def test_related_articles_follow_tag_changes(app, login):
+    alice = login('alice')
+    slugs = [create_article(alice, 'a', ['x', 'y']), create_article(alice, 'b', ['x', 'y']),
+             create_article(alice, 'c', ['x', 'z']), create_article(alice, 'd', ['w'])]
+    slug_ids = dict(enumerate(['?'] + slugs))
+    # 新建文章时增量刷新
+    assert related(slug_ids, 1) == [('b', 1.0), ('c', pytest.approx(1 / 3.0))]
+    assert related(slug_ids, 4) == []
+    response = alice.get('/api/articles/a/related')
+    assert [article['data']['article']['slug'] for article in response.json['articles']] == ['b', 'c']
+
+    # 全量计算与增量结果一致
+    incremental = db.session.query(RelatedArticle.article_id, RelatedArticle.rank, RelatedArticle.related_id).all()
+    assert refresh_related_all() == 4
+    assert sorted(db.session.query(RelatedArticle.article_id, RelatedArticle.rank,
+                                   RelatedArticle.related_id).all()) == sorted(incremental)
+
+    # 删除文章后，把它列为近邻的文章一并刷新
+    alice.delete('/api/articles/b')
+    assert related(slug_ids, 1) == [('c', pytest.approx(1 / 3.0))]
+
+
+def test_follow_graph_friends_of_friends():
+    # 1关注2、3；2、3都关注4；3还关注5
+    graph = FollowGraph.from_edges([1, 1, 2, 3, 3], [2, 3, 4, 4, 5])
+    ids, counts = graph.friends_of_friends(1)
+    assert dict(zip(ids.tolist(), counts.tolist())) == {4: 2, 5: 1}
+    assert graph.neighbors(9).tolist() == []
+
+
+def test_follow_graph_deltas_merge():
+    graph = FollowGraph.from_edges([1, 2], [2, 3], max_delta=3)
+    graph.add_edge(1, 4)
+    graph.add_edge(4, 5)
+    assert graph.neighbors(1).tolist() == [2, 4]
+    assert dict(zip(*[a.tolist() for a in graph.friends_of_friends(1)])) == {3: 1, 5: 1}
+    # 第三次变化时增量合并进CSR数组，结果不变
+    graph.remove_edge(1, 2)
+    assert graph._delta == 0 and not graph._added
+    assert graph.neighbors(1).tolist() == [4]
+    assert dict(zip(*[a.tolist() for a in graph.friends_of_friends(1)])) == {5: 1}
+
+
+def test_follow_suggestions(app, login):
+    alice, bob, carol = login('alice'), login('bob'), login('carol')
+    login('dave')
+    create_article(carol, 'Carols')
+    alice.post('/api/profiles/bob/follow')
+    bob.post('/api/profiles/dave/follow')
+    alice.post('/api/articles/carols/favorite')
+    names = [profile['username'] for profile in alice.get('/api/user/suggestions').json['data']['profiles']]
+    assert sorted(names) == ['carol', 'dave']
+    # 关注之后不再推荐
+    alice.post('/api/profiles/dave/follow')
+    names = [profile['username'] for profile in alice.get('/api/user/suggestions').json['data']['profiles']]
+    assert names == ['carol']
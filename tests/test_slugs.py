@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from blog.estensions import db
+from blog.models import Article
+from blog.slugs import allocate_slug, assign_slug
+from tests.conftest import create_article
+
+
+def test_titles_with_the_same_slug_get_suffixes(app, login):
+    alice = login('alice')
+    assert create_article(alice, 'Hello World') == 'hello-world'
+    assert create_article(alice, 'Hello, World!') == 'hello-world-2'
+    assert create_article(alice, 'hello world?') == 'hello-world-3'
+
+
+def test_allocate_skips_taken_and_tried(app):
+    db.session.add_all([Article(title='a', slug='post'), Article(title='b', slug='post-2'),
+                        Article(title='c', slug='post-4'), Article(title='d', slug='postscript')])
+    db.session.commit()
+    assert allocate_slug('Post') == 'post-3'
+    assert allocate_slug('Post', skip=['post-3']) == 'post-5'
+    assert allocate_slug('Other') == 'other'
+    # 修改文章时它自己的slug不算被占用
+    own_id = db.session.query(Article.id).filter(Article.slug == 'post').scalar()
+    assert allocate_slug('Post', exclude_id=own_id) == 'post'
+
+
+def test_assign_slug_retries_after_conflict(app, monkeypatch):
+    db.session.add(Article(title='taken', slug='taken'))
+    db.session.commit()
+    # 模拟另一个请求在探测之后抢先插入了同一个slug：第一次分配时看不到已有的slug
+    calls = []
+
+    def stale_allocate(title, exclude_id=None, skip=()):
+        calls.append(list(skip))
+        return 'taken' if not skip else allocate_slug(title, exclude_id, skip)
+    monkeypatch.setattr('blog.slugs.allocate_slug', stale_allocate)
+
+    article = Article(title='Taken')
+    assert assign_slug(article, 'Taken') == 'taken-2'
+    db.session.commit()
+    assert calls == [[], ['taken']]
+    assert db.session.query(Article.slug).order_by(Article.id).all() == [('taken',), ('taken-2',)]
+
+
+def test_assign_slug_gives_up_after_max_attempts(app, monkeypatch):
+    app.config.update(SLUG_MAX_ATTEMPTS=2)
+    db.session.add(Article(title='taken', slug='taken'))
+    db.session.commit()
+    monkeypatch.setattr('blog.slugs.allocate_slug', lambda title, exclude_id=None, skip=(): 'taken')
+    with pytest.raises(IntegrityError):
+        assign_slug(Article(title='Taken'), 'Taken')
+    db.session.rollback()
+
+
+# 分配slug时的保存点嵌在请求的事务里，之后出错回滚时文章不能已经落库
+def test_assign_slug_does_not_commit_the_article(app):
+    article = Article(title='Draft')
+    assign_slug(article, 'Draft')
+    db.session.rollback()
+    assert db.session.query(Article).count() == 0
@@ -0,0 +1,64 @@
+import json
+
+from sqlalchemy import select, func
+
+from blog.estensions import db
+from blog.models import Article, Comment, Collect, TrendingArticle, tagging
+from blog.softdelete import purge_deleted_articles
+from tests.conftest import create_article
+
+
+def count(table, *where):
+    return db.session.execute(select(func.count()).select_from(table).where(*where)).scalar()
+
+
+def test_soft_delete_hides_article_and_frees_slug(app, login):
+    app.config.update(ARTICLE_SOFT_DELETE=True)
+    alice = login('alice')
+    slug = create_article(alice, 'Hello World', tags=['x'])
+    assert alice.delete('/api/articles/' + slug).json['code'] == 10000
+
+    assert alice.get('/api/articles/' + slug).json['code'] == 10004
+    assert alice.get('/api/articles').json['articleCount'] == 0
+    # 行还在，只是对普通查询不可见，slug可以马上被同名文章使用
+    assert db.session.execute(select(func.count(Article.id)), execution_options={'include_deleted': True}).scalar() == 1
+    assert create_article(alice, 'Hello, World!') == slug
+
+
+def test_purge_removes_children_and_cascades(app, login):
+    app.config.update(ARTICLE_SOFT_DELETE=True, ARTICLE_PURGE_DELAY=0, ARTICLE_PURGE_BATCH=1)
+    alice, bob = login('alice'), login('bob')
+    slug = create_article(alice, 'Doomed', tags=['x', 'y'])
+    bob.post('/api/articles/%s/comments' % slug, json={'comment': {'body': 'first'}})
+    bob.post('/api/articles/%s/comments' % slug, json={'comment': {'body': 'second'}})
+    bob.post('/api/articles/%s/favorite' % slug)
+    article_id = db.session.query(Article.id).filter(Article.slug == slug).scalar()
+    db.session.add(TrendingArticle(article_id=article_id, score=1.0))
+    db.session.commit()
+    alice.delete('/api/articles/' + slug)
+
+    assert purge_deleted_articles() == 1
+    assert count(Comment.__table__) == 0
+    assert count(Collect.__table__) == 0
+    # 标签关联和热门快照由外键的ON DELETE CASCADE删除
+    assert count(tagging, tagging.c.article_id == article_id) == 0
+    assert count(TrendingArticle.__table__) == 0
+    assert db.session.execute(select(func.count(Article.id)), execution_options={'include_deleted': True}).scalar() == 0
+
+
+def test_purge_waits_for_delay(app, login):
+    app.config.update(ARTICLE_SOFT_DELETE=True, ARTICLE_PURGE_DELAY=3600)
+    alice = login('alice')
+    alice.delete('/api/articles/' + create_article(alice, 'Recent'))
+    assert purge_deleted_articles() == 0
+
+
+def test_hard_delete_cascades_comments(app, login):
+    alice = login('alice')
+    slug = create_article(alice, 'Gone', tags=['x'])
+    alice.post('/api/articles/%s/comments' % slug, data=json.dumps({'comment': {'body': 'c'}}),
+               content_type='application/json')
+    alice.delete('/api/articles/' + slug)
+    assert count(Article.__table__) == 0
+    assert count(Comment.__table__) == 0
+    assert count(tagging) == 0
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from blog.estensions import db
+from blog.models import Article, Collect, Comment, TrendingArticle, User
+from blog.trending import compute_scores, refresh_trending, bump_score, flush_scores
+
+NOW = datetime(2026, 1, 1, 12)
+
+
+@pytest.fixture
+def articles(app):
+    app.config.update(TRENDING_HALF_LIFE_HOURS=12, TRENDING_WINDOW_HOURS=72,
+                      TRENDING_FAVORITE_WEIGHT=1.0, TRENDING_COMMENT_WEIGHT=2.0)
+    db.session.add_all([User(username='u%d' % i, email='u%d@x.com' % i) for i in range(1, 4)])
+    db.session.add_all([Article(title='a%d' % i, slug='a%d' % i) for i in range(1, 4)])
+    db.session.commit()
+
+
+def scores():
+    return dict(db.session.query(TrendingArticle.article_id, TrendingArticle.score).all())
+
+
+def test_scores_decay_with_age(articles):
+    db.session.add_all([
+        # 文章1：刚刚收到两次收藏
+        Collect(collector_id=1, collected_id=1, timestamp=NOW),
+        Collect(collector_id=2, collected_id=1, timestamp=NOW),
+        # 文章2：一个半衰期之前的一条评论，权重2衰减为1
+        Comment(article_id=2, body='c', createAt=NOW - timedelta(hours=12)),
+        # 文章3：窗口之外的收藏不计入
+        Collect(collector_id=3, collected_id=3, timestamp=NOW - timedelta(hours=73)),
+    ])
+    db.session.commit()
+    article_ids, values = compute_scores(NOW)
+    assert article_ids.tolist() == [1, 2]
+    assert values.tolist() == pytest.approx([2.0, 1.0])
+
+    assert refresh_trending(NOW) == 2
+    assert scores() == pytest.approx({1: 2.0, 2: 1.0})
+
+
+def test_flush_waits_for_a_snapshot(articles):
+    bump_score(1, 1.0, NOW + timedelta(minutes=1))
+    assert flush_scores() == 0
+    assert db.session.query(TrendingArticle).count() == 0
+    # 事件保留到第一次重算之后
+    db.session.add(Collect(collector_id=1, collected_id=2, timestamp=NOW))
+    db.session.commit()
+    refresh_trending(NOW)
+    assert flush_scores() == 1
+    assert scores() == pytest.approx({1: 2 ** (1 / 60.0 / 12), 2: 1.0})
+
+
+def test_flush_adds_to_the_snapshot(articles):
+    db.session.add(Collect(collector_id=1, collected_id=1, timestamp=NOW))
+    db.session.commit()
+    refresh_trending(NOW)
+    # 快照之前的事件已经计入，直接丢弃；之后的事件折算到快照时刻后累加
+    bump_score(1, 1.0, NOW - timedelta(minutes=1))
+    bump_score(1, 1.0, NOW + timedelta(hours=12))
+    bump_score(2, 2.0, NOW + timedelta(hours=24))
+    assert flush_scores() == 2
+    assert scores() == pytest.approx({1: 1.0 + 2.0, 2: 2.0 * 4})
+    assert flush_scores() == 0
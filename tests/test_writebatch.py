@@ -0,0 +1,84 @@
+import threading
+
+from sqlalchemy import select, func, insert
+
+from blog.estensions import db
+from blog.models import Follow, User
+from blog.writebatch import WriteCoalescer, insert_ignore, delete_by_pk
+
+
+def make_users(count):
+    db.session.add_all([User(username='user%d' % i, email='user%d@x.com' % i) for i in range(count)])
+    db.session.commit()
+
+
+def follow_count():
+    return db.session.execute(select(func.count()).select_from(Follow.__table__)).scalar()
+
+
+# 每条语句在各自的线程中提交，和并发的请求一样各有自己的应用上下文
+def submit_all(app, coalescer, statements):
+    results = [None] * len(statements)
+    start = threading.Barrier(len(statements))
+
+    def run(index):
+        start.wait()
+        with app.app_context():
+            try:
+                results[index] = coalescer.submit(statements[index])
+            except Exception as e:
+                results[index] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(statements))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert not any(thread.is_alive() for thread in threads)
+    return results
+
+
+def test_idempotent_statements(app):
+    make_users(2)
+    table = Follow.__table__
+    assert db.session.execute(insert_ignore(table, follower_id=1, followed_id=2)).rowcount == 1
+    assert db.session.execute(insert_ignore(table, follower_id=1, followed_id=2)).rowcount == 0
+    assert db.session.execute(delete_by_pk(table, follower_id=1, followed_id=2)).rowcount == 1
+    assert db.session.execute(delete_by_pk(table, follower_id=1, followed_id=2)).rowcount == 0
+
+
+def test_concurrent_writes_are_batched(app):
+    make_users(21)
+    coalescer = WriteCoalescer(window=0.05, max_batch=100)
+    batches = []
+    flush = coalescer._flush
+    coalescer._flush = lambda batch: batches.append(len(batch)) or flush(batch)
+    statements = [insert_ignore(Follow.__table__, follower_id=i, followed_id=21) for i in range(1, 21)]
+    assert submit_all(app, coalescer, statements) == [1] * 20
+    assert follow_count() == 20
+    assert sum(batches) == 20 and len(batches) < 20
+
+
+# 每批只取max_batch条：leader处理完包含自己语句的那一批就返回，剩下的由等待者接手，所有线程都能返回
+def test_leadership_is_handed_off(app):
+    make_users(31)
+    coalescer = WriteCoalescer(window=0.05, max_batch=4)
+    statements = [insert_ignore(Follow.__table__, follower_id=i, followed_id=31) for i in range(1, 31)]
+    assert submit_all(app, coalescer, statements) == [1] * 30
+    assert follow_count() == 30
+    assert not coalescer._leader and not coalescer._pending
+
+
+def test_failing_statement_only_fails_its_own_request(app):
+    make_users(5)
+    coalescer = WriteCoalescer(window=0.05)
+    table = Follow.__table__
+    statements = [insert_ignore(table, follower_id=i, followed_id=5) for i in range(1, 5)]
+    # 普通INSERT遇到主键冲突会报错，拖累整批回滚
+    db.session.execute(insert(table).values(follower_id=5, followed_id=1))
+    db.session.commit()
+    statements.append(insert(table).values(follower_id=5, followed_id=1))
+    results = submit_all(app, coalescer, statements)
+    assert results[:4] == [1, 1, 1, 1]
+    assert isinstance(results[4], Exception)
+    assert follow_count() == 5